@@ -0,0 +1,171 @@
+"""
+Headless batch simulation
+=========================
+Runs many simulation cases without a visualization, each in its own worker process, as fast as the machine allows.
+Meant for muscle layout studies: hundreds of runs overnight on a many-core box.
+
+A batch file is a list of cases separated by blank lines. Each case uses the same label/value layout as a config file,
+and any label it sets overrides its config (see config.schema.load_batch):
+
+CONFIG:
+config/desktopsim_testconfig2.txt
+MUSCLE ATTACHMENTS:
+robots/muscle_attachments_b2.csv
+PRESSURE SCHEDULE:
+config/batch_input/pressure_schedule_1.csv
+DURATION:
+5
+
+A pressure schedule is a semicolon separated table: time in seconds, then one pressure per muscle. Each row holds until
+the next one. Results for every case are gathered into one columnar .npz file.
+
+Usage: python batchsim.py config/batch_input/sim_batch_input_1.txt --out results.npz --jobs 16
+"""
+import argparse
+import os
+import time
+import types
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+import klampt
+import klampt.io
+import klampt.sim.batch  # Runs the simulation loop for us
+
+import config.schema as cfg
+import pyonics.submodules.control.control as ctrl
+import pyonics.submodules.sim.sim as xsim  # No klampt.vis, unlike the HUD apps
+
+def load_schedule(schedule_path, num_muscles):
+    """
+    Returns (times, pressures). With no schedule, every muscle holds zero pressure.
+    """
+    if not schedule_path:
+        return np.zeros(1), np.zeros((1, num_muscles))
+    with open(schedule_path) as fn:
+        first = fn.readline().split(";")[0]
+    try:
+        float(first)
+        header = 0
+    except ValueError:
+        header = 1
+    table = np.atleast_2d(np.loadtxt(schedule_path, delimiter=";", skiprows=header))
+    return table[:, 0], table[:, 1:]
+
+
+def run_case(index, config, run, default_duration, force_multiplier, record_every):
+    """
+    Simulates one case. Runs in a worker process, so everything it needs comes in as plain data.
+    """
+    duration = run.get("duration", default_duration)
+
+    # Just the world, link transforms and muscle arrays: no pandas, no Muscle objects, no planner, no network
+    world = klampt.io.load("WorldModel", config["world_path"])
+    world.loadRobot(config["core"])
+    pcm = types.SimpleNamespace(world=world, robot=world.robot(0))
+    pcm.bones = ctrl.TransformBuffer(pcm.robot)
+    bank = ctrl.MuscleBank(ctrl.load_attachments(config["attachments"]), pcm)
+    times, pressures = load_schedule(run.get("schedule"), bank.count)
+    force_history = []
+    contact_counts = []
+    state = {"step": 0}
+
+    def sim_init(sim):
+        sim.enableContactFeedbackAll()
+        state["sim"] = sim
+        state["wrenches"] = xsim.LinkWrenchAccumulator(sim, pcm.robot)
+        state["bodies"] = [pcm.robot.link(x).getID() for x in range(pcm.robot.numLinks())]
+
+    def sim_step(sim):
+        sim.updateWorld()
+        pcm.bones.capture()
+        row = max(np.searchsorted(times, sim.getTime(), side="right") - 1, 0)
+        bank.set_pressures(pressures[row])
+        state["wrenches"].accumulate(*bank.update(force_multiplier))
+        state["wrenches"].apply()
+        if state["step"] % record_every == 0:
+            force_history.append(bank.forces.astype(np.float32))
+            contact_counts.append(sum(sim.inContact(body, -1) for body in state["bodies"]))
+        state["step"] += 1
+
+    wall_start = time.perf_counter()
+    # Only the status is used, which doSim always returns. Its default return items read actualTorques, which
+    # SimpleSimulator does not have.
+    result = klampt.sim.batch.doSim(pcm.world, duration, {}, returnItems=[], simDt=config["timestep"],
+                                    simInit=sim_init, simStep=sim_step)
+    state["sim"].updateWorld()
+    pcm.bones.capture()
+    return {"case": index,
+            "config": run.get("config", ""),
+            "attachments": config["attachments"],
+            "status": str(result.get("status", "")),
+            "sim_time": float(state["sim"].getTime()),
+            "wall_time": time.perf_counter() - wall_start,
+            "final_config": np.array(pcm.robot.getConfig()),
+            "final_transforms": np.array(pcm.bones.current),
+            "force_history": np.array(force_history, dtype=np.float32).reshape(-1, bank.count),
+            "contact_counts": np.array(contact_counts, dtype=np.int32)}
+
+
+def pad_stack(arrays):
+    """
+    Stacks arrays of different lengths along a new first axis, padding with NaN.
+    """
+    shape = tuple(max(a.shape[d] for a in arrays) for d in range(arrays[0].ndim))
+    out = np.full((len(arrays),) + shape, np.nan)
+    for x, a in enumerate(arrays):
+        out[(x,) + tuple(slice(0, n) for n in a.shape)] = a
+    return out
+
+
+def save_results(results, out_path):
+    """
+    Writes every case's results as columns of one .npz file. Histories of different lengths and widths are stored
+    ragged: one flat array per history plus offsets (rows) and widths (muscles) per case.
+    """
+    results = sorted(results, key=lambda r: r["case"])
+    rows = [len(r["contact_counts"]) for r in results]
+    np.savez(out_path,
+             case=np.array([r["case"] for r in results]),
+             config=np.array([r["config"] for r in results]),
+             attachments=np.array([r["attachments"] for r in results]),
+             status=np.array([r["status"] for r in results]),
+             sim_time=np.array([r["sim_time"] for r in results]),
+             wall_time=np.array([r["wall_time"] for r in results]),
+             final_config=pad_stack([r["final_config"] for r in results]),
+             final_transforms=pad_stack([r["final_transforms"] for r in results]),
+             history_offsets=np.concatenate([[0], np.cumsum(rows)]),
+             force_widths=np.array([r["force_history"].shape[1] for r in results]),
+             force_history=np.concatenate([r["force_history"].ravel() for r in results]),
+             contact_counts=np.concatenate([r["contact_counts"] for r in results]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs a batch of headless ExOS simulations.")
+    parser.add_argument("batch", help="Batch file listing the cases")
+    parser.add_argument("--config", default="config/desktopsim_testconfig2.txt",
+                        help="Base config for cases without a CONFIG entry")
+    parser.add_argument("--out", default="batch_results.npz", help="Columnar results file")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="Worker processes")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds per case without a DURATION entry")
+    parser.add_argument("--force-multiplier", type=float, default=2, help="Scales every muscle force")
+    parser.add_argument("--record-every", type=int, default=10, help="Control steps per recorded history row")
+    args = parser.parse_args()
+
+    cases = cfg.load_batch(args.batch, base=cfg.load_config(args.config))  # Fails here on any bad case
+    results = []
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = {pool.submit(run_case, x, config, run, args.duration, args.force_multiplier,
+                               args.record_every): x for x, (config, run) in enumerate(cases)}
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            print("Case {} done: {:.2f} s simulated in {:.2f} s".format(result["case"], result["sim_time"],
+                                                                          result["wall_time"]))
+    save_results(results, args.out)
+    print("Wrote {} cases to {}".format(len(results), args.out))
+
+
+if __name__ == "__main__":
+    main()
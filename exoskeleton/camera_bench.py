@@ -0,0 +1,75 @@
+"""
+Camera capture benchmark
+========================
+Runs CameraCapture against a file-backed fake camera, so capture can be measured without a webcam, and reports the
+capture rate, how stale the latest frame is when a consumer asks for it, and how many frames were dropped unread.
+
+With no clip given, a synthetic one is written first.
+
+Usage: python camera_bench.py --clip frames.npy --fps 0 --seconds 5 --consumer-rate 60
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from pyonics.submodules.apps.apps import CameraCapture, FileCaptureSource
+
+
+def synthetic_clip(path, frames=120, height=480, width=640):
+    """
+    Writes a clip of moving gradients, shape (frames, height, width, 3) uint8, the size of a VGA webcam frame.
+    """
+    rows = np.arange(height, dtype=np.uint16)[:, None]
+    columns = np.arange(width, dtype=np.uint16)[None, :]
+    clip = np.lib.format.open_memmap(path, mode="w+", dtype=np.uint8, shape=(frames, height, width, 3))
+    for x in range(frames):
+        clip[x, :, :, 0] = (rows + x) % 256
+        clip[x, :, :, 1] = (columns + 2 * x) % 256
+        clip[x, :, :, 2] = x % 256
+    clip.flush()
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks threaded camera capture against a fake camera.")
+    parser.add_argument("--clip", default=None, help=".npy clip (frames, height, width, channels)")
+    parser.add_argument("--fps", type=float, default=0, help="Playback rate of the fake camera; 0 is unthrottled")
+    parser.add_argument("--seconds", type=float, default=5, help="How long to run")
+    parser.add_argument("--consumer-rate", type=float, default=60, help="How often a consumer asks for a frame")
+    parser.add_argument("--slots", type=int, default=4, help="Frames in the ring")
+    args = parser.parse_args()
+
+    clip = args.clip or synthetic_clip(os.path.join(tempfile.mkdtemp(), "clip.npy"))
+    capture = CameraCapture(FileCaptureSource(clip, fps=args.fps), slots=args.slots).start()
+    capture.ready.wait()
+    if capture.ring is None:
+        print("Could not read the clip.")
+        return
+
+    ages = []
+    checksums = 0
+    start = time.monotonic()
+    while time.monotonic() - start < args.seconds:
+        pinned = capture.pin()
+        if pinned is not None:
+            slot, sequence, frame, stamp = pinned
+            ages.append(time.monotonic() - stamp)
+            checksums += int(frame[0, 0, 0])  # Touch the frame like a consumer would, without copying it
+            capture.release(slot)
+        time.sleep(1 / args.consumer_rate)
+    elapsed = time.monotonic() - start
+    capture.stop()
+
+    ring = capture.ring
+    print("Captured {} frames in {:.2f} s: {:.1f} fps".format(ring.count, elapsed, ring.count / elapsed))
+    print("Consumer read {} frames, latest frame age median {:.2f} ms, max {:.2f} ms".format(
+        len(ages), statistics.median(ages) * 1000, max(ages) * 1000))
+    print("Frames dropped unread: {}".format(ring.unread))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""
+Config schema for ExOS. Config files are label lines ending in a colon, each followed by its value line(s):
+
+CORE:
+robots/core_bot_test3.rob
+CONTROL RATE:
+.001
+
+Labels can come in any order and most are optional; see LABELS for the full list. A file compiles into a frozen
+ExoConfig, which is validated before anything else is loaded. Compiled configs are cached per file, so a batch that
+names the same config hundreds of times parses it once.
+"""
+import dataclasses
+import os
+from dataclasses import dataclass
+
+
+class ConfigError(ValueError):
+    pass
+
+
+def parse_bool(text):
+    lowered = text.lower()
+    if lowered in ("true", "1", "yes"):
+        return True
+    if lowered in ("false", "0", "no"):
+        return False
+    raise ValueError("expected True or False, got " + text)
+
+
+# Label -> (field names, parser). Labels with several fields take one value line per field.
+LABELS = {"CORE": (("core",), str),
+          "MODEL": (("model",), str),
+          "MUSCLE ATTACHMENTS": (("attachments",), str),
+          "WORLD": (("world_path",), str),
+          "CONTROL RATE": (("timestep",), float),
+          "CONTROL ADDRESS": (("address",), str),
+          "CONTROL PORT": (("port",), int),
+          "CONTACT RATE": (("contact_rate",), float),
+          "NETWORK MODE": (("network_mode",), str),
+          "DISPLAY RESOLUTION": (("width", "height"), int),
+          "HAS_ROBWORLD": (("has_robworld",), parse_bool),
+          "HAS_VIS": (("has_vis",), parse_bool),
+          "HAS_SIM": (("has_sim",), parse_bool),
+          "HAS_HUD": (("has_hud",), parse_bool),
+          "HAS_VOICE": (("has_voice",), parse_bool),
+          "HAS_PERSONA": (("has_persona",), parse_bool),
+          "HAS_PLANNER": (("has_planner",), parse_bool),
+          "VOICE ID": (("voice_id",), int),
+          "VOICE SPEECH RATE": (("voice_rate",), int),
+          "VOICE INPUT": (("voice_input",), str),
+          "VOICE GATE": (("voice_gate",), parse_bool),
+          "VOICE GRAMMAR": (("voice_grammar",), parse_bool),
+          "VOICE OUTPUT": (("voice_output",), str),
+          "PERSONA MODEL": (("persona_model",), str)}
+
+# Batch file labels that describe a run rather than the robot
+BATCH_LABELS = {"CONFIG": (("config",), str),
+                "PRESSURE SCHEDULE": (("schedule",), str),
+                "DURATION": (("duration",), float)}
+
+NETWORK_MODES = ("master", "slave")
+VOICE_OUTPUTS = ("speaker", "null")  # null speaks in silence, for machines without sound hardware
+
+
+@dataclass(frozen=True)
+class ExoConfig:
+    """
+    Everything a config file sets. Supports config["key"] as well as config.key, like the dictionary configLoader used
+    to return.
+    """
+    core: str = ""
+    attachments: str = ""
+    world_path: str = ""
+    timestep: float = .001
+    model: str = ""
+    address: str = "127.0.0.1"
+    port: int = 5005
+    contact_rate: float = 100  # Hz, how often simulated contacts are read
+    network_mode: str = "master"
+    width: int = 1920
+    height: int = 1080
+    has_robworld: bool = True
+    has_vis: bool = False
+    has_sim: bool = False
+    has_hud: bool = False
+    has_voice: bool = False
+    has_persona: bool = False
+    has_planner: bool = True  # PRM planner over the robot's cspace, built when the controller starts
+    voice_id: int = 0
+    voice_rate: int = 200
+    voice_input: str = ""  # WAV file to recognize instead of the microphone, for headless runs
+    voice_gate: bool = True  # Only decode audio around speech
+    voice_grammar: bool = False  # Only recognize the command phrases in system_strings
+    voice_output: str = "speaker"
+    persona_model: str = "gpt2"  # GPT-2 variation, loaded on first use, or stub for canned answers offline
+    source: str = ""  # File the config was compiled from
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def replace(self, **changes):
+        """
+        Returns a validated copy with some fields changed.
+        """
+        return validate(dataclasses.replace(self, **changes))
+
+
+def validate(config):
+    """
+    Checks values and the dependencies between subsystems. Raises ConfigError naming the config file.
+    """
+    problems = []
+    if config.has_robworld:
+        for field in ("core", "attachments", "world_path"):
+            path = getattr(config, field)
+            if not path:
+                problems.append(field + " is required when HAS_ROBWORLD is True")
+            elif not os.path.exists(path):
+                problems.append(field + " " + path + " does not exist")
+    if config.model and not os.path.isdir(config.model):
+        problems.append("model " + config.model + " is not a directory")
+    if config.has_sim and not config.has_robworld:
+        problems.append("HAS_SIM needs HAS_ROBWORLD, there is nothing to simulate")
+    if config.has_vis and not config.has_robworld:
+        problems.append("HAS_VIS needs HAS_ROBWORLD, there is nothing to show")
+    if config.voice_input and not os.path.exists(config.voice_input):
+        problems.append("voice_input " + config.voice_input + " does not exist")
+    if not config.timestep > 0:
+        problems.append("CONTROL RATE must be positive")
+    if not config.contact_rate > 0:
+        problems.append("CONTACT RATE must be positive")
+    if not 0 <= config.port <= 65535:
+        problems.append("CONTROL PORT must be between 0 and 65535")
+    if config.network_mode not in NETWORK_MODES:
+        problems.append("NETWORK MODE must be one of " + ", ".join(NETWORK_MODES))
+    if config.voice_output not in VOICE_OUTPUTS:
+        problems.append("VOICE OUTPUT must be one of " + ", ".join(VOICE_OUTPUTS))
+    if config.width <= 0 or config.height <= 0:
+        problems.append("DISPLAY RESOLUTION must be positive")
+    if problems:
+        raise ConfigError((config.source or "config") + ": " + "; ".join(problems))
+    return config
+
+
+def parse_block(lines, source, labels):
+    """
+    lines: (line number, text) pairs of one config.
+
+    Returns a dictionary of field values. Raises ConfigError on unknown labels, missing or extra values, and values that
+    do not parse.
+    """
+    fields = {}
+    pending = []  # (fields, parser, label line) still waiting for value lines
+    for number, text in lines:
+        if text.endswith(":"):
+            if pending:
+                raise ConfigError(source + " line " + str(pending[0][2]) + ": missing value")
+            label = text[:-1].strip().upper()
+            if label not in labels:
+                raise ConfigError(source + " line " + str(number) + ": unknown label " + label)
+            names, parser = labels[label]
+            pending = [(name, parser, number) for name in names]
+        elif not pending:
+            raise ConfigError(source + " line " + str(number) + ": value " + text + " has no label")
+        else:
+            name, parser, _ = pending.pop(0)
+            try:
+                fields[name] = parser(text)
+            except ValueError as error:
+                raise ConfigError(source + " line " + str(number) + ": " + str(error)) from None
+    if pending:
+        raise ConfigError(source + " line " + str(pending[0][2]) + ": missing value")
+    return fields
+
+
+def read_blocks(path):
+    """
+    Splits a file into blocks of (line number, text) pairs, separated by blank lines.
+    """
+    blocks = [[]]
+    with open(path) as fn:
+        for number, line in enumerate(fn, 1):
+            text = line.strip()
+            if text:
+                blocks[-1].append((number, text))
+            elif blocks[-1]:
+                blocks.append([])
+    return [block for block in blocks if block]
+
+
+compiled = {}  # (absolute path, mtime, size) -> ExoConfig
+
+
+def load_config(path):
+    """
+    Compiles and validates a config file. Cached until the file changes.
+    """
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    if key not in compiled:
+        lines = [line for block in read_blocks(path) for line in block]  # Blank lines mean nothing in a config
+        compiled[key] = validate(ExoConfig(source=path, **parse_block(lines, path, LABELS)))
+    return compiled[key]
+
+
+def load_batch(path, base=None):
+    """
+    path: Batch file, cases separated by blank lines.
+    base: Config for cases without a CONFIG entry.
+
+    Parses every case in one pass. Each case names a config (or uses base), may override any config label, and may set
+    PRESSURE SCHEDULE and DURATION. Returns (config, run settings) pairs; every config is validated before this returns.
+    """
+    cases = []
+    for block in read_blocks(path):
+        fields = parse_block(block, path, {**LABELS, **BATCH_LABELS})
+        run = {name: fields.pop(name) for name in ("config", "schedule", "duration") if name in fields}
+        if "config" in run:
+            config = load_config(run["config"])
+        elif base is not None:
+            config = base
+        else:
+            raise ConfigError(path + " line " + str(block[0][0]) + ": case has no CONFIG and there is no base config")
+        config = config.replace(source=path + " line " + str(block[0][0]), **fields) if fields else config
+        cases.append((config, run))
+    return cases
@@ -17,65 +17,58 @@ onboard the robot in order for its proper unassisted offline operation.
 STANDARD LIBRARIES
 """
 import random
+import time
 from datetime import datetime
 import platform  # For detecting the platform and automatically selecting the correct launcher
 
-import pandas as pd  # Critical, most of the data structures are pandas structures
+import numpy as np
 import asyncio  # For asynchronous OSC handling
 import os  # For listing files in directory
 
 import sys
 import logging
-import tkinter as tk
-import tkinter.filedialog as filedialog
 
 """
 OTHER LIBRARIES
 """
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-from cryptography.hazmat.primitives import padding
-from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+# tkinter, cryptography, klampt.plan, pandas, klampt.vis and the interface toolkits (speech, language model, HUD) are
+# imported where they are used, so a config only pays for the subsystems it turns on.
+
 """
 KLAMPT IMPORTS
 """
 
 import klampt  # Main robotics library
 
-import klampt.vis  # For visualization
-import klampt.vis.colorize  # For colorizing to easily assess robot performance
-
-import klampt.sim.batch  # For batch simulation
-import klampt.sim.settle  # Applies forces and lets them reach equilibrium in simulation
 import klampt.sim.simulation  # For simulation
 
-import klampt.io.resource  # For easy resource access
+import klampt.io  # Loads the vis world
 
 import klampt.model.subrobot  # Defines the subrobot
 import klampt.model.contact  # For dealing with collisions
 
-import klampt.plan.cspace
-import klampt.plan.robotcspace
-import klampt.plan.rigidobjectcspace
-import klampt.plan.robotplanning
-
 """
 CUSTOM LIBRARIES
 """
-import pyonics.submodules.ui.interface as ui  # Interface modules
-import pyonics.submodules.video.video as vid
+import config.schema as cfg  # Config files
+import pyonics.submodules.startup.startup as startup
+import pyonics.submodules.ui.system_strings as sysvx  # Canned phrases, the interface module itself loads on demand
 import pyonics.submodules.control.control as ctrl
-import pyonics.submodules.apps.apps as xapp
+import pyonics.submodules.sim.sim as xsim
+import pyonics.submodules.telemetry.telemetry as tlm
+import pyonics.submodules.audio.audio as audio  # Announcement priorities
 
 """
 PANDAS CONFIG
 """
-pd.options.display.width = 0
-pd.set_option('display.max_rows', None)
-pd.set_option('display.max_columns', None)
-pd.set_option('display.width', None)
-pd.set_option('display.max_colwidth', None)
+def configure_pandas():
+    # Prints whole muscle tables. Called once the controller has loaded pandas for them.
+    import pandas as pd
+    pd.options.display.width = 0
+    pd.set_option('display.max_rows', None)
+    pd.set_option('display.max_columns', None)
+    pd.set_option('display.width', None)
+    pd.set_option('display.max_colwidth', None)
 
 # General Configuration
 def configLoader(config_name):
@@ -83,88 +76,27 @@ def configLoader(config_name):
     This is tightly coupled with the GUNDAM (limb/element-wise) style configuration process.
     Takes configuration filepath as an argument.
 
-    Returns a dataframe with entries in columns referencing the filepath of the robot core, and of the location of
-    the muscle attachments CSV.
-
-    Want to add a "has simulation" parameter.
+    Returns a frozen ExoConfig with entries referencing the filepath of the robot core, the location of the muscle
+    attachments CSV and so on; config["core"] still works. Labels may come in any order. A bad or incomplete config
+    raises cfg.ConfigError here, before the world loads.
     """
-    print("Loading configuration" + config_name + "...\n")
-    with open(config_name) as fn:
-        print("Loading core components...\n", fn.readline().rstrip())
-        core = fn.readline().rstrip()  # Filepath to robot core
-        print("Locating model data...\n", fn.readline().rstrip())
-        model = fn.readline().rstrip()  # Filepath to calculated model parameters
-        print("Loading muscle attachments...\n", fn.readline().rstrip())
-        attachments = fn.readline().rstrip()  # Filepath to muscle attachments file
-        print("Locating world filepath...\n", fn.readline().rstrip())
-        world_path = fn.readline().rstrip()  # Filepath to the world file
-        print("Configuring control rates...\n", fn.readline().rstrip())
-        timestep = float(fn.readline().rstrip())  # Float value setting simulation and control time step; want >.01 sec
-        print("Setting controller address...\n", fn.readline().rstrip())
-        address = fn.readline().rstrip()  # Controller IP address; string value
-        print("Setting controller network socket...\n", fn.readline().rstrip())
-        port = int(fn.readline().rstrip())  # Controller network socket
-        print("Setting network mode...\n", fn.readline().rstrip())
-        network_mode = fn.readline().rstrip()
-        print("Setting display resolution...\n", fn.readline().rstrip())
-        width = int(fn.readline().rstrip())
-        height = int(fn.readline().rstrip())
-        print("Getting world preferences...\n", fn.readline().rstrip())
-        has_robworld = eval(str(fn.readline().rstrip()))
-        print("Getting visualization preferences...\n", fn.readline().rstrip())
-        has_vis = eval(str(fn.readline().rstrip()))
-        print("Getting simulation preferences...\n", fn.readline().rstrip())
-        has_sim = eval(str(fn.readline().rstrip()))
-        print("Getting HUD preferences...\n", fn.readline().rstrip())
-        has_hud = eval(str(fn.readline().rstrip()))
-        print("Getting voice preferences...\n", fn.readline().rstrip())
-        has_voice = eval(str(fn.readline().rstrip()))
-        print("Setting personality...\n", fn.readline().rstrip())
-        has_persona = eval(str(fn.readline().rstrip()))
-        print("has persona is..." + str(has_persona))
-        print("Selecting voice ID...\n", fn.readline().rstrip())
-        voice_id = int(fn.readline().strip())
-        print("Setting voice speech rate\n", fn.readline().strip())
-        voice_rate = int(fn.readline().rstrip())
-        config = {"core": core,
-                  "model": model,
-                  "attachments": attachments,
-                  "world_path": world_path,
-                  "timestep": timestep,
-                  "address": address,
-                  "port": port,
-                  "network_mode": network_mode,
-                  "width": width,
-                  "height": height,
-                  "has_robworld": has_robworld,
-                  "has_vis": has_vis,
-                  "has_sim": has_sim,
-                  "has_hud": has_hud,
-                  "has_voice": has_voice,
-                  "has_persona": has_persona,
-                  "voice_id": voice_id,
-                  "voice_rate": voice_rate
-                  }
-
-        return config
+    print("Loading configuration " + config_name + "...")
+    return cfg.load_config(config_name)
 
 """
 SECURITY
 """
-# Function to derive a key from a password using PBKDF2
-def derive_key(password):
-    salt = os.urandom(16)
-    kdf = PBKDF2HMAC(
-        algorithm=hashes.SHA256(),
-        length=32,
-        salt=salt,
-        iterations=100000,
-        backend=default_backend()
-    )
-    return kdf.derive(password), salt
+# Function to derive a key from a password using PBKDF2. Pass the stored salt to derive the same key again.
+def derive_key(password, salt=None):
+    if salt is None:
+        salt = os.urandom(16)
+    return tlm.derive_log_key(password, salt), salt
 
 # Function to encrypt data using AES-256
 def encrypt_data(data, key, salt):
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives import padding
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
     padder = padding.PKCS7(128).padder()
     padded_data = padder.update(data) + padder.finalize()
     iv = os.urandom(16)
@@ -174,6 +106,44 @@ def encrypt_data(data, key, salt):
     return salt + iv + encrypted_data
 
 
+"""
+OPTIONAL SUBSYSTEMS
+"""
+def load_interface():
+    """
+    Imports the interface module on first use. It pulls in the speech, language model and HUD toolkits, so only
+    configs with HAS_VOICE, HAS_PERSONA or HAS_HUD load it.
+    """
+    import pyonics.submodules.ui.interface as ui
+    return ui
+
+
+def load_video():
+    """
+    Imports klampt.vis and the video module on first use, so configs without HAS_VIS never load a GUI toolkit.
+    """
+    import klampt.vis  # For visualization
+    import pyonics.submodules.video.video as vid
+    return vid
+
+"""
+EVENT LOOP
+"""
+def run_event_loop(main, fast=True):
+    """
+    main: The top level coroutine.
+    fast: Uses uvloop's event loop when it is installed.
+
+    Runs main on a new event loop until it finishes. Call once per process.
+    """
+    if fast:
+        try:
+            import uvloop
+            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+        except ImportError:
+            pass
+    return asyncio.run(main)
+
 """
 CLASS DEFINITIONS
 """
@@ -200,69 +170,183 @@ class ExOS(klampt.control.OmniRobotInterface):
         self.mode = None  # Safe mode, restricted mode, etc. - None is normal
         self.network_mode = config_data["network_mode"]  # Can be master or slave
         self.dt = config_data["timestep"]
+        self.scheduler = ctrl.RateScheduler(self.dt)  # Runs main at the control rate
+        self.vis_divisor = self.scheduler.divisor_for(60)  # Vis snapshot, datalog and contact map rates in ticks per run
+        self.datalog_divisor = 1
+        self.contact_divisor = self.scheduler.divisor_for(config_data["contact_rate"])
+
+        self.config = config_data
+        self.pcm = None
+        self.voice = None
+        self.last_phrase = None  # Latest thing the voice assistant heard
+        self.persona = None
+        self.sim = None
+        self.contacts = None
+        self.viewport = None
+        self.muscle_vis = None
+        self.bone_vis = None
+        self.snapshots = None  # State handed from the control loop to the render thread
+        self.renderer = None
+        self.hud = None
+        self.logging = bool(self.model_path)  # This is the diagnostic output flag; logs go in the model folder
+
+        self.startup_plan = self.plan_startup(config_data)
+        try:
+            self.startup_plan.run()
+        finally:
+            print(self.startup_plan.timeline())
 
-        if config_data["has_voice"]:
-            self.voice = ui.VoiceAssistantUI(config_data["voice_id"], config_data["voice_rate"])
-        else:
-            self.voice = None
-
-        if config_data["has_robworld"]:
-            # Variable for a robot representation # Not sure if this is happening correctly
-            self.pcm = ctrl.ExoController(config_data) # PCM as in powertrain control module, this is primary motor driver
-            self.input = asyncio.run(self.pcm.idle(self.pcm.bones))  # async function
-
-        if config_data["has_sim"]:  # If a simulation is defined
-            self.sim = xapp.Sim(self.pcm.world, self.pcm.robot, self.pcm.controlRate())
-            self.sim.enableContactFeedbackAll()
-            # asyncio.run(self.sim_settings())
-            self.sim.endLogging()
-        else:
-            self.sim = None
-
-        # Visualization
-
-        if config_data["has_vis"]:  # If there's a visualization
-            klampt.vis.add("w", self.pcm.world)
-            klampt.vis.add("robby", self.pcm.robot)
-
-            if config_data["has_sim"]:  # If a simulation is defined AND there's a visualization
-                vid.display_muscles(self.pcm.muscles)  # Displays the muscles
-
-            klampt.vis.visualization.setWindowTitle("ExOS")
-            klampt.vis.visualization.setBackgroundColor(.8, .5, .8, .3)
-
-            klampt.vis.visualization.resizeWindow(1920, 1080)
-            self.viewport = klampt.vis.getViewport()
-            vid.configure_sim_vis(self.viewport)
-            klampt.vis.show()  # Shows the visualization
-        else:
-            self.viewport = None
+        klampt.control.OmniRobotInterface.__init__(self, self.pcm.robot)
 
+        run_event_loop(self.run())  # The one event loop, runs until shutdown or the vis window closes
 
+    """
+    Startup steps
+    """
+    def plan_startup(self, config_data):
+        """
+        Returns the startup steps for a config, not yet run. Subsystems that do not need each other are built at the
+        same time; the timeline shows what waited on what.
+        """
+        plan = startup.StartupOrchestrator(on_background=self.background_built)
+        robworld = ["controller"] if config_data["has_robworld"] else []
+        if config_data["has_robworld"]:
+            plan.add("controller", self.build_controller)
+        if config_data["has_voice"]:
+            # The speech engine lives on the voice assistant's own speech thread, so this can build on a worker
+            plan.add("voice", self.build_voice)
+        if config_data["has_persona"]:
+            plan.add("persona", self.build_persona)
+        if config_data["has_robworld"] and config_data["has_planner"]:
+            plan.add("planner", self.build_planner, after=robworld)
+        if config_data["has_sim"]:
+            plan.add("sim", self.build_sim, after=robworld)
+            plan.add("contacts", self.build_contacts, after=["sim"])
+            # Samples the self-collision pairs when the robot file has no cache yet, without holding up the boot
+            plan.add("self pairs", self.build_self_pairs, after=["contacts"], background=True)
+        if config_data["has_vis"]:
+            plan.add("vis", self.build_vis, after=robworld + (["sim"] if config_data["has_sim"] else []),
+                     main_thread=True)  # Klampt vis is a GUI, it lives on the main thread
+        if self.logging:
+            plan.add("log", self.build_log, after=robworld)
         if config_data["has_hud"]:
-            self.hud = ui.AugmentOverlayKlUI()  # Should be a place for a HUD object
+            # The HUD draws into the vis window, so it goes last, once everything else is up. It runs as a task later.
+            # Background steps are left out: nothing may wait for them, the HUD included
+            plan.add("hud", self.build_hud, after=[name for name, step in plan.steps.items() if not step.background],
+                     main_thread=True)
+        return plan
+
+    def build_controller(self):
+        # Variable for a robot representation # Not sure if this is happening correctly
+        self.pcm = ctrl.ExoController(self.config) # PCM as in powertrain control module, this is primary motor driver
+        configure_pandas()
+
+    def build_voice(self):
+        self.voice = load_interface().VoiceAssistantUI(self.config["voice_id"], self.config["voice_rate"],
+                                                       self.config["voice_input"], self.config["voice_gate"],
+                                                       self.config["voice_grammar"], self.config["voice_output"])
+
+    def build_persona(self):
+        # Language model for conversation. Loads on first use and generates on its own thread.
+        self.persona = load_interface().Personality(self.config["persona_model"])
+
+    def build_planner(self):
+        self.pcm.build_planner()  # The controller skips this in start() once it is built
+
+    def build_sim(self):
+        self.sim = xsim.Sim(self.pcm.world, self.pcm.robot, self.pcm.controlRate(), transforms=self.pcm.bones)
+        self.sim.enableContactFeedbackAll()
+        # asyncio.run(self.sim_settings())
+        self.sim.endLogging()
+
+    def build_contacts(self):
+        # Only reads the cached self-collision mask. Without one, links are checked against the world alone until the
+        # self pairs step has sampled it.
+        mask = ctrl.cached_self_collision_mask(self.config["core"])
+        self.contacts = xsim.ContactService(self.sim, self.pcm.robot, mask, divisor=self.contact_divisor)
+
+    def build_self_pairs(self):
+        # Background step. Samples and caches the mask once per robot file; the timeline shows what that cost.
+        if self.contacts.mask is None:
+            self.contacts.set_mask(ctrl.self_collision_mask(self.config["core"]))
+
+    def background_built(self, step):
+        if step.state == "failed":
+            print("Background startup step", step.name, "failed:", repr(step.error))
+        print(self.startup_plan.timeline())
+
+    def build_vis(self):
+        vid = load_video()
+        # The vis draws its own world, loaded from the same files so its link geometries are posed independently
+        # (WorldModel.copy() shares them), and only from snapshots. The simulation can then move the real robot while a
+        # frame is being drawn.
+        self.vis_world = klampt.io.load('WorldModel', self.config["world_path"])
+        self.vis_world.loadRobot(self.config["core"])
+        self.vis_robot = self.vis_world.robot(0)
+        self.vis_robot.setConfig(self.pcm.robot.getConfig())
+        klampt.vis.add("w", self.vis_world)
+        klampt.vis.add("robby", self.vis_robot)
+
+        if self.sim:  # If a simulation is defined AND there's a visualization
+            # Registered once, then only what changed is pushed each frame
+            self.muscle_vis = vid.MuscleVis(self.pcm.muscles["name"], self.pcm.muscle_bank.max_pressure)
+        self.bone_vis = vid.BoneVis(self.vis_robot)  # Colors the robot links, tinted by contact force as it runs
+        self.link_forces = np.zeros(self.pcm.robot.numLinks())
+        self.snapshots = vid.SnapshotBuffer(self.pcm.muscle_bank.count, self.pcm.robot.numLinks())
+        self.renderer = vid.RenderThread(self.snapshots, self.draw, rate=60)
+
+        klampt.vis.visualization.setWindowTitle("ExOS")
+        klampt.vis.visualization.setBackgroundColor(.8, .5, .8, .3)
+
+        klampt.vis.visualization.resizeWindow(1920, 1080)
+        self.viewport = klampt.vis.getViewport()
+        vid.configure_sim_vis(self.viewport)
+        klampt.vis.show()  # Shows the visualization
+
+    def build_hud(self):
+        self.hud = load_interface().AugmentOverlayKlUI()  # Should be a place for a HUD object
+
+    def build_log(self):
+        self.log_filepath = self.model_path + ("/data/" + str(datetime.now().strftime(format='%Y%m%d%H%M')) + \
+                                               r"datalog.exo")
+        self.log_file = open(self.log_filepath, "wb")
+        password = os.environ.get("EXOS_LOG_PASSWORD")  # Encrypts the log when set; key is derived once here
+        if password:
+            self.log_sink = tlm.LogEncryptor.from_password(self.log_file, password.encode())
         else:
-            self.hud = None  # No HUD
+            self.log_sink = self.log_file
+        # Binary per-tick records, flushed in blocks by a task on the event loop
+        self.telemetry = tlm.TelemetryWriter(self.log_sink, self.pcm.muscle_bank.count, len(self.pcm.bones),
+                                             threaded=False)
 
-        klampt.control.OmniRobotInterface.__init__(self, self.pcm.robot)
+    async def run(self):
+        """
+        Everything async runs here, on one long-lived event loop: the OSC server, the control scheduler with its vis,
+        datalog and contact subtasks, and the telemetry flusher.
+        """
+        await self.pcm.start()  # Planner, idle and the OSC endpoint, which now lives as long as the control loop
         if self.sim:
-            asyncio.run(self.sim.configure_sim())
-
-        self.logging = True  # This is the diagnostic output flag
-
-        if self.logging:
-            self.log_filepath = self.model_path + ("/data/" + str(datetime.now().strftime(format='%Y%m%d%H%M')) + \
-                                                   r"datalog.exo")
-            with open(self.log_filepath, "wb") as self.log_file:
-                asyncio.run(self.pcm.idle_configuration())  # Set up the idle for the powertrain control module
-                asyncio.run(vid.display_bones(self.pcm.robot))  # Sets the color of the robot links
-                asyncio.run(self.startup(self.main))  # Initiates the primary idle loop for the total system
-                #klampt.vis.add("Config Space", self.pcm.cspace)  # Trying to show the configuration space.
-        else:
-            asyncio.run(self.pcm.idle_configuration())  # Set up the idle for the powertrain control module
-            asyncio.run(vid.display_bones(self.pcm.robot))  # Sets the color of the robot links
-            asyncio.run(self.startup(self.main))  # Initiates the primary idle loop for the total system
-            # klampt.vis.add("Config Space", self.pcm.cspace)  # Trying to show the configuration space.
+            await self.sim.configure_sim()
+        flusher = asyncio.create_task(self.telemetry.flush_task()) if self.logging else None
+        hud_task = asyncio.create_task(self.hud.run()) if self.hud else None  # Redraws only widgets that changed
+        if self.voice:
+            self.voice.listen(asyncio.get_running_loop(), self.heard)  # Recognizes on its own thread, posts here
+        try:
+            await self.startup(self.main)  # Initiates the primary idle loop for the total system
+            #klampt.vis.add("Config Space", self.pcm.cspace)  # Trying to show the configuration space.
+        finally:
+            if self.renderer and self.renderer.is_alive():
+                self.renderer.stop()
+            await self.pcm.shutdown()
+            if flusher:
+                flusher.cancel()
+            if hud_task:
+                hud_task.cancel()
+            if self.persona:
+                self.persona.close()
+            if self.voice:
+                await asyncio.to_thread(self.voice.shutdown_assistant)  # Lets the shutdown announcement finish
+            self.close_log()
 
     async def startup(self, self_method, *args):
         """
@@ -276,44 +360,85 @@ class ExOS(klampt.control.OmniRobotInterface):
 
         self.state = "Running"
 
-        while klampt.vis.shown():  # I ddn't know if this should be packaged somehow
-            await self_method()  # Async function call
-            await asyncio.sleep(2)
-            # i += 1
-            # asyncio.run(asyncio.sleep(1))
+        # Diagnostics and display run as decimated subtasks of the control tick
+        self.scheduler.add_task("datalog", self.datalog, self.datalog_divisor)
+        if self.viewport:
+            self.scheduler.add_task("vis", self.update_vis, self.vis_divisor)
+            self.renderer.start()  # Draws whatever update_vis last published, at its own rate
+        if self.contacts:
+            self.scheduler.add_task("contacts", self.collision_settings, self.contacts.divisor)
+
+        await self.scheduler.run(self_method, until=lambda: self.shutdown_flag or
+                                 (self.viewport is not None and not klampt.vis.shown()))
 
     async def main(self):
-        # Diagnostics go here at the top
-        await self.datalog()
         # await vid.display_contact_forces(self.pcm.robot, self.sim)
         if self.sim:
-            # Attend to the simulation
-            # await self.collision_settings()  # Should access the collision settings function and do something related to collisions every loop
-            if klampt.vis.shown():
-                vid.display_muscles(self.pcm.muscles)
-                klampt.vis.lock()
-
+            # Attend to the simulation. The vis draws from snapshots on its own thread, so no vis lock here.
             # Main operating system loop. Last argument of pressures_to_forces is a force multiplier.
-            forces = await self.sim.pressures_to_forces(self.pcm.muscles.muscle_objects, self.pcm.pressures, 2)
+            forces = await self.sim.pressures_to_forces(self.pcm.muscle_bank, self.pcm.read_pressures(), 2)
             self.pcm.bones = await self.sim.simLoop(forces)  # Needs list of input values
 
-            if klampt.vis.shown():
-                klampt.vis.unlock()
-                klampt.vis.update()
-
         else:
             pass
 
+    async def update_vis(self):
+        """
+        Publishes a snapshot of the state for the render thread. Runs every vis_divisor control ticks, never waits.
+        """
+        bank = self.pcm.muscle_bank
+        if self.contacts:
+            self.contacts.link_forces(self.link_forces)
+        self.snapshots.publish(self.scheduler.tick, self.pcm.robot.getConfig(), self.pcm.bones.current,
+                               bank.endpoints_a, bank.endpoints_b, bank.pressures, self.link_forces)
+
+    def draw(self, snapshot):
+        """
+        Poses the vis robot and pushes muscle and bone changes from one snapshot. Runs on the render thread, with the vis
+        locked.
+        """
+        self.vis_robot.setConfig(snapshot["config"].tolist())
+        if self.muscle_vis:
+            self.muscle_vis.update(snapshot["endpoints_a"], snapshot["endpoints_b"], snapshot["pressures"])
+        if self.contacts:
+            self.bone_vis.update(snapshot["link_forces"])
+
     async def async_error(self, error_message: None):
         print("ERROR")
         print(error_message)
         if self.voice:
-            self.voice.announce("Error:")
-            self.voice.announce(ui.sysvx.negatives[random.randint(0,len(ui.sysvx.negatives))])
+            # Queued on the speech thread; the caller carries on
+            self.voice.announce(sysvx.error_string1, audio.ERROR)
+            self.voice.announce(random.choice(sysvx.negatives), audio.ERROR)
+
+    def heard(self, phrase):
+        """
+        Called on the event loop with each phrase the voice assistant recognizes.
+        """
+        self.last_phrase = phrase
+        print("Heard:", phrase)
+        if self.hud:
+            self.hud.subtitles.update(phrase)
+        command = sysvx.commands.get(phrase)
+        if command == "shutdown":
+            self.shutdown()
+        elif command == "status":
+            self.voice.announce(self.state, audio.STATUS)
+        elif self.persona:
+            asyncio.create_task(self.converse(phrase))
+
+    async def converse(self, phrase):
+        # Answers through the persona. Generation runs on the persona's thread, so this only waits for the future.
+        try:
+            response = await self.persona.respond(phrase)
+        except Exception as error:
+            await self.async_error(error)
+            return
+        self.voice.announce(response)
 
     async def collision_settings(self):
-        contacts = klampt.model.contact.sim_contact_map(self.sim)
-        return contacts
+        # Returns the contacts that appeared and disappeared since the last update; self.contacts.active has them all
+        return self.contacts.update()
 
     """
     Control
@@ -334,10 +459,19 @@ class ExOS(klampt.control.OmniRobotInterface):
         # Should shut everything down nice and pretty.
         self.state = "Shutdown in progress"
         self.shutdown_flag = True
-        self.voice.announce("Shutting down systems.")
-        self.hud.async_shutdown()
-        self.state = "Off"
-        self.log_file.close()
+        if self.voice:
+            self.voice.announce(sysvx.shutdown_string1, audio.SAFETY)
+        if self.hud:
+            self.hud.stop()  # Its run() task ends on the next frame
+        self.state = "Off"  # The event loop winds down on the next tick and closes the log
+
+    def close_log(self):
+        # Flushes whatever telemetry is still in the ring, then closes the log file
+        if self.logging and not self.log_file.closed:
+            self.telemetry.close()
+            if self.log_sink is not self.log_file:
+                self.log_sink.close()  # Seals the final encrypted chunk
+            self.log_file.close()
 
     """
     Testing
@@ -355,20 +489,11 @@ class ExOS(klampt.control.OmniRobotInterface):
         # A diagnostic function for printing to console or logging other relevant things at the top level.
         # print(self.pcm.muscles.shape[0])
         if self.logging:
-            self.log_file.write(str(self.pcm.robot.numDrivers()).encode())
+            bank = self.pcm.muscle_bank
+            self.telemetry.record(time.time(), self.scheduler.tick, bank.pressures, self.pcm.bones.current, bank.forces)
 
-        try:
-            # print("Number of robot drivers", str(self.pcm.robot.numDrivers()))
-            if self.pcm.robot.numDrivers():
-                for x in range(self.pcm.robot.numDrivers()):
-                    # print(self.pcm.robot.driver(x).name)
-                    pass
-            if self.sim:
-                return klampt.model.contact.sim_contact_map(self.sim)  # Returns a contact map if there's a simulation
-            else:
-                return None
-        except SystemError:
-            return "Contact map calculations failed."
+        # print("Number of robot drivers", str(self.pcm.robot.numDrivers()))
+        # Contacts are read by the contact service at its own rate, see collision_settings
 
 """
 MAIN LOOP
@@ -380,7 +505,8 @@ def launch_standard():
     print(plat)
     print("Initializing...")
     if plat.startswith("Windows"):  # Windows default behaviour
-        config_path = tk.filedialog.askopenfilename()
+        import tkinter.filedialog as filedialog
+        config_path = filedialog.askopenfilename()
 
     else:  # Platform default error
         config_path = None
@@ -0,0 +1,88 @@
+"""
+GPS service benchmark
+=====================
+Runs GPSService against FakeGPSD, a local stand-in gpsd replaying a track, so GPS handling can be measured without a
+receiver. Reports the time to the first fix, how stale the fix is when the HUD reads it, what a read costs, and how long
+the service takes to come back after gpsd restarts.
+
+Tracks are text files of gpsd JSON reports or NMEA sentences (GGA/RMC), one per line. With no track given, a synthetic
+one is generated.
+
+Usage: python gps_bench.py --track walk.nmea --rate 10 --seconds 5
+"""
+import argparse
+import json
+import math
+import statistics
+import time
+
+from pyonics.submodules.apps.apps import FakeGPSD, GPSService
+
+
+def synthetic_track(points=600, latitude=40.4433, longitude=-79.9436, radius=.001):
+    """
+    Returns TPV reports walking a circle of about 100 m around the given point.
+    """
+    track = []
+    for x in range(points):
+        angle = 2 * math.pi * x / points
+        track.append(json.dumps({"class": "TPV", "mode": 3, "lat": latitude + radius * math.sin(angle),
+                                 "lon": longitude + radius * math.cos(angle), "altMSL": 300.0, "speed": 1.4,
+                                 "track": math.degrees(angle) % 360}))
+    return track
+
+
+def wait_for(condition, timeout):
+    start = time.monotonic()
+    while not condition():
+        if time.monotonic() - start > timeout:
+            return None
+        time.sleep(.001)
+    return time.monotonic() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the GPS service against a fake gpsd.")
+    parser.add_argument("--track", default=None, help="Track of gpsd JSON reports or NMEA sentences")
+    parser.add_argument("--rate", type=float, default=10, help="Reports per second from the fake gpsd")
+    parser.add_argument("--seconds", type=float, default=5, help="How long to read fixes")
+    parser.add_argument("--reader-rate", type=float, default=30, help="How often the HUD reads the fix")
+    args = parser.parse_args()
+
+    server = FakeGPSD(args.track or synthetic_track(), rate=args.rate).start()
+    service = GPSService(server.host, server.port, backoff=(.05, 1)).start()
+    first = wait_for(lambda: service.fix is not None, 10)
+    if first is None:
+        print("No fix from the fake gpsd.")
+        return
+    print("First fix after {:.1f} ms".format(first * 1000))
+
+    reads = 100000
+    start = time.perf_counter()
+    for _ in range(reads):
+        fix = service.fix
+    print("Reading the fix costs {:.0f} ns".format((time.perf_counter() - start) / reads * 1e9))
+
+    ages = []
+    start = time.monotonic()
+    while time.monotonic() - start < args.seconds:
+        ages.append(service.age())
+        time.sleep(1 / args.reader_rate)
+    print("Received {} reports, fix age median {:.1f} ms, max {:.1f} ms (report period {:.1f} ms)".format(
+        service.reports, statistics.median(ages) * 1000, max(ages) * 1000, 1000 / args.rate))
+
+    # Restart gpsd on the same port and time the reconnect
+    port = server.port
+    server.stop()
+    wait_for(lambda: not service.connected, 5)
+    connects = service.connects
+    server = FakeGPSD(args.track or synthetic_track(), port=port, rate=args.rate).start()
+    restart = time.monotonic()
+    back = wait_for(lambda: service.connects > connects and service.age() < time.monotonic() - restart, 10)
+    print("Reconnected after gpsd restart in {}".format("{:.1f} ms".format(back * 1000) if back else "more than 10 s"))
+    service.stop()
+    server.stop()
+
+
+if __name__ == "__main__":
+    main()
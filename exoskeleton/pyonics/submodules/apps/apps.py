@@ -1,7 +1,11 @@
 import asyncio  # Needs asynchronous functionality
-import pandas as pd
-import gpsd  # GPS library
-import cv2  # CameraWidget library
+import collections
+import json
+import math
+import socket
+import threading
+import time
+import numpy as np
 from datetime import datetime
 import asyncio
 # Klamp't imports
@@ -10,20 +14,67 @@ import klampt
 import klampt.model.coordinates
 import klampt.model.collide
 import klampt.model.contact
-import klampt.plan.robotplanning
-import klampt.plan.robotcspace
-import klampt.plan.cspace
-import klampt.plan.rigidobjectcspace
+import klampt.vis.glcommon  # Map and CameraWidget draw through it
+import klampt.vis.glprogram
 
-# Each app should be its own class
+# The simulation is in pyonics.submodules.sim, which headless runs can import without klampt.vis
+
+# Each app should be its own class. Hardware libraries (cv2) are imported by the apps that use them, so a headless
+# simulation never loads them. GPS talks to gpsd's JSON protocol directly.
 
 """
 CLASSES
 """
 
 # HUD Widgets
-class Map(klampt.vis.glcommon.GLProgram):
-    def __init__(self, widget=None):
+class HUDWidget:
+    """
+    name: Vis item name.
+    interval: Seconds between refreshes. None for widgets that only change when told to.
+    position, size, color: Where and how the HUD draws the widget's text.
+
+    Base for HUD widgets. When a widget is due, refresh() renders its text again and marks it dirty only if the text
+    changed; the HUD redraws dirty widgets and clears the flag. Refreshes land on whole multiples of the interval, so
+    a clock ticks over with the second instead of up to a second late.
+    """
+    def __init__(self, name, interval=None, position=(0, 0), size=50, color=(1, 1, 1, 1)):
+        self.name = name
+        self.interval = interval
+        self.position = position
+        self.size = size
+        self.color = color
+        self.text = ""
+        self.dirty = True
+        self.dirty_since = 0.  # The HUD draws the longest waiting widgets first
+        self.next_refresh = 0.
+
+    def due(self, now):
+        return self.interval is not None and now >= self.next_refresh
+
+    def refresh(self, now):
+        self.next_refresh = (math.floor(now / self.interval) + 1) * self.interval
+        return self.set_text(self.render())
+
+    def render(self):
+        # Overridden by widgets that compute their own text
+        return self.text
+
+    def set_text(self, text):
+        if text != self.text:
+            self.text = text
+            if not self.dirty:
+                self.dirty = True
+                self.dirty_since = time.time()
+        return self.text
+
+
+class Map(HUDWidget, klampt.vis.glcommon.GLProgram):
+    def __init__(self, widget=None, name="map", interval=5, position=(-300, 100), size=30, gps=None):
+        """
+        gps: A GPSService. One is started against the local gpsd if None. Reading the fix never touches the socket.
+        """
+        klampt.vis.glprogram.GLProgram.__init__(self, name)  # First, as it sets self.name too
+        HUDWidget.__init__(self, name, interval, position, size)
         self.world = klampt.WorldModel()
         self.frenet = klampt.model.coordinates.Frame("frenet frame", self.world)
         self.latitude = None
@@ -32,83 +83,284 @@ class Map(klampt.vis.glcommon.GLProgram):
 
         self.bearing = "east"
         self.widget = widget
-        self.get_gps_data()
-        klampt.vis.glprogram.GLProgram.__init__(self)
+        self.gps = gps if gps is not None else GPSService().start()
+        self.set_text(self.get_gps_data())
 
     async def surrounding_geometry(self):
         pass
 
+    def render(self):
+        return self.get_gps_data()
 
-    def get_gps_data(self):
-        # Connect to the local gpsd service (default host and port)
-        try:
-            gpsd.connect()
-            # Get the GPS data
-            packet = gpsd.get_current()
-            # Check if the data is valid
-            if packet.mode >= 2:
-                self.latitude = packet.lat
-                self.longitude = packet.lon
-                self.altitude = packet.alt
-
-                return (f"Latitude: {self.latitude},\n Longitude: {self.longitude},\n Altitude: {self.altitude}")
-            else:
-                return ("No GPS fix")
-        except ConnectionRefusedError:
+    def read_fix(self):
+        # Copies the latest fix from the GPS service. Returns True if it is a 2D or 3D fix.
+        fix = self.gps.fix
+        if fix is None or fix.mode < 2:
+            return False
+        self.latitude = fix.lat
+        self.longitude = fix.lon
+        self.altitude = fix.alt
+        return True
 
+    def get_gps_data(self):
+        if self.read_fix():
+            return (f"Latitude: {self.latitude},\n Longitude: {self.longitude},\n Altitude: {self.altitude}")
+        elif self.gps.connected:
+            return ("No GPS fix")
+        else:
             return("GPS Fix failed")
 
     def update(self, bearing):
-        gpsd.connect()
-        # Get the GPS data
-        packet = gpsd.get_current()
-        # Check if the data is valid
-        if packet.mode >= 2:
-            self.latitude = packet.lat
-            self.longitude = packet.lon
-            self.altitude = packet.alt
-
+        self.read_fix()
         self.bearing = bearing
 
     def set_widget(self, widget):
         self.widget = widget
 
-class Clock():
-    def __init__(self, widget=None, widget_type=None):
-        # Adds a clock
-        self.time = datetime.now().strftime("%H:%M:%S")
+class Clock(HUDWidget):
+    def __init__(self, widget=None, widget_type=None, name="time", position=(0, -100), size=50):
+        # Adds a clock, redrawn once a second
+        HUDWidget.__init__(self, name, 1, position, size)
         self.widget = widget
         self.widget_type = widget_type
+        self.update()
+
+    @property
+    def time(self):
+        return self.text
+
+    def render(self):
+        return datetime.now().strftime("%H:%M:%S")
+
     def update(self):
-        self.time = datetime.now().strftime("%H:%M:%S")
-        return self.time
+        return self.set_text(self.render())
 
     def set_widget(self, widget, widget_type):
         self.widget = widget
         self.widget_type = widget_type
 
-class DateWidget:
-    def __init__(self):
-        # Adds a clock
-        self.date = datetime.now().strftime("%Y.%m.%d")
+class DateWidget(HUDWidget):
+    def __init__(self, name="date", position=(0, 0), size=50):
+        # Adds a date, checked once a minute
+        HUDWidget.__init__(self, name, 60, position, size)
         self.display = None
+        self.update()
+
+    @property
+    def date(self):
+        return self.text
+
+    def render(self):
+        return datetime.now().strftime("%Y.%m.%d")
+
     def update(self):
-        self.date = datetime.now().strftime("%Y.%m.%d")
-        return self.date
+        return self.set_text(self.render())
 
-class TextWidget:
-    def __init__(self):
-        # Adds a clock
-        self.text = "widget text"
-    def update(self, text):
+class TextWidget(HUDWidget):
+    def __init__(self, text="widget text", name="text", position=(0, 0), size=50):
+        # Adds a text box, only redrawn when its text is changed
+        HUDWidget.__init__(self, name, None, position, size)
         self.text = text
-        return self.text
+
+    def update(self, text):
+        return self.set_text(text)
+
+class FrameRing:
+    """
+    slots: Frames kept. Readers can hold up to slots - 1 of them at once.
+    shape, dtype: Frame shape and type, e.g. (480, 640, 3) uint8 for a BGR webcam.
+
+    Preallocated frame buffers for one writer (the capture thread) and any number of readers. The writer always fills
+    the oldest slot nobody has pinned, so when readers fall behind old frames are dropped, never queued. Readers get
+    views of the buffers, not copies; a pinned frame is not overwritten until it is released.
+    """
+    def __init__(self, slots, shape, dtype=np.uint8):
+        self.frames = np.zeros((slots,) + tuple(shape), dtype=dtype)
+        self.sequence = np.zeros(slots, dtype=np.int64)  # Frame number held by each slot, 0 for none yet
+        self.stamps = np.zeros(slots)  # time.monotonic() at capture
+        self.pins = np.zeros(slots, dtype=np.intp)
+        self.latest_slot = -1
+        self.count = 0  # Frames committed
+        self.unread = 0  # Frames overwritten before any reader pinned them
+        self.read = np.zeros(slots, dtype=bool)
+        self.lock = threading.Lock()  # Only guards slot bookkeeping, never held during a capture or a read
+
+    def claim(self):
+        """
+        Writer side. Returns the slot to capture into next: the oldest one that is not pinned, the latest frame only if
+        nothing else is free. Returns None if readers have every slot pinned.
+        """
+        with self.lock:
+            free = [x for x in range(len(self.frames)) if not self.pins[x]]
+            if not free:
+                return None
+            return min(free, key=lambda x: (x == self.latest_slot, self.sequence[x]))
+
+    def commit(self, slot, stamp):
+        """
+        Writer side. Publishes a captured slot as the latest frame. A claim whose capture failed is never committed, so
+        the frame it would have replaced only counts as unread once another one actually takes its place.
+        """
+        with self.lock:
+            if self.sequence[slot] and not self.read[slot]:
+                self.unread += 1
+            self.count += 1
+            self.sequence[slot] = self.count
+            self.stamps[slot] = stamp
+            self.read[slot] = False
+            self.latest_slot = slot
+
+    def pin(self):
+        """
+        Returns (slot, sequence, frame view, capture time) for the latest frame and keeps it from being overwritten
+        until release(slot). Returns None before the first frame.
+        """
+        with self.lock:
+            slot = self.latest_slot
+            if slot < 0:
+                return None
+            self.pins[slot] += 1
+            self.read[slot] = True
+            return slot, int(self.sequence[slot]), self.frames[slot], self.stamps[slot]
+
+    def release(self, slot):
+        with self.lock:
+            self.pins[slot] -= 1
+
+
+class FileCaptureSource:
+    """
+    path: A .npy file of frames, shape (frames, height, width, channels), read through a memory map.
+    fps: Frame rate to play back at; 0 plays as fast as frames are read.
+    loop: Starts over at the end instead of reporting a failed read.
+
+    Stands in for cv2.VideoCapture, read(image=...) included, so capture can be tested and benchmarked without a
+    camera. Anything cv2 can open (a video file, say) can be passed to CameraCapture directly instead.
+    """
+    def __init__(self, path, fps=30, loop=True):
+        self.frames = np.load(path, mmap_mode="r")
+        self.period = 1 / fps if fps else 0
+        self.loop = loop
+        self.index = 0
+        self.next_frame = time.monotonic()
+        self.opened = True
+
+    def isOpened(self):
+        return self.opened
+
+    def read(self, image=None):
+        if self.index >= len(self.frames):
+            if not self.loop:
+                return False, image
+            self.index = 0
+        if self.period:
+            # Paced like a real camera: read blocks until the next frame is due
+            delay = self.next_frame - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self.next_frame = max(self.next_frame + self.period, time.monotonic() - self.period)
+        if image is None:
+            image = np.array(self.frames[self.index])
+        else:
+            np.copyto(image, self.frames[self.index])
+        self.index += 1
+        return True, image
+
+    def release(self):
+        self.opened = False
+
+
+class CameraCapture:
+    """
+    source: Camera index or video path for cv2.VideoCapture, a .npy path for a FileCaptureSource, or anything with
+    read(image=None) and release().
+    slots: Frames in the ring.
+
+    Reads frames on its own thread, straight into a FrameRing, so nothing on the event loop ever waits on the camera.
+    The ring is allocated from the first frame's shape; after that cv2 decodes into the ring buffers in place.
+    """
+    def __init__(self, source, slots=4):
+        if isinstance(source, str) and source.endswith(".npy"):
+            source = FileCaptureSource(source)
+        elif isinstance(source, (int, str)):
+            import cv2  # CameraWidget library
+            source = cv2.VideoCapture(source)
+        self.source = source
+        self.slots = slots
+        self.ring = None
+        self.failures = 0  # Failed reads in a row
+        self.ready = threading.Event()  # Set once the ring exists, or capture gave up
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.capture_loop, name="camera", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def capture_loop(self):
+        try:
+            ok, first = self.source.read()
+            if not ok:
+                return
+            self.ring = FrameRing(self.slots, first.shape, first.dtype)
+            slot = self.ring.claim()
+            np.copyto(self.ring.frames[slot], first)
+            self.ring.commit(slot, time.monotonic())
+            self.ready.set()
+            while not self.stop_event.is_set():
+                slot = self.ring.claim()
+                if slot is None:
+                    time.sleep(.001)  # Readers hold every frame; try again rather than overwrite one
+                    continue
+                buffer = self.ring.frames[slot]
+                ok, frame = self.source.read(image=buffer)
+                if not ok:
+                    self.failures += 1
+                    if self.failures > 100:
+                        break  # Camera unplugged or clip over
+                    time.sleep(.01)
+                    continue
+                self.failures = 0
+                if frame is not buffer and not np.shares_memory(frame, buffer):
+                    np.copyto(buffer, frame)  # The source allocated anyway, e.g. a different frame size
+                self.ring.commit(slot, time.monotonic())
+        finally:
+            self.ready.set()
+
+    def latest(self):
+        """
+        Returns the latest frame as a view, or None. It stays valid at least until slots - 1 newer frames arrive; use
+        pin() to hold it longer.
+        """
+        if self.ring is None:
+            return None
+        pinned = self.ring.pin()
+        if pinned is None:
+            return None
+        self.ring.release(pinned[0])
+        return pinned[2]
+
+    def pin(self):
+        """
+        Returns (slot, sequence, frame view, capture time), or None. Release the slot with release() when done.
+        """
+        return self.ring.pin() if self.ring is not None else None
+
+    def release(self, slot):
+        self.ring.release(slot)
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread.is_alive():
+            self.thread.join()
+        self.source.release()
+
 
 class CameraWidget(klampt.vis.glcommon.GLProgram):
     def __init__(self, i):
         klampt.vis.glcommon.GLProgram.__init__(self)
         # Launches with an index of a particular camera
-        self.camera = None
+        self.camera = None  # CameraCapture, started by cam_launch
         self.state = "minimized"  # Can also be "fullscreen", "windowed", "closed"
 
         self.ret = None
@@ -119,122 +371,225 @@ class CameraWidget(klampt.vis.glcommon.GLProgram):
 
 
     def cam_launch(self, index):
-        # Start the camera
+        # Start the camera. Frames are captured on their own thread from here on.
         try:
-            self.camera = cv2.VideoCapture(index)
-        except:
-            "Error: Exception launching camera input."
-
-        while not self.shutdown_flag:
-            asyncio.run(self.cam_loop())
+            self.camera = CameraCapture(index).start()
+        except Exception:
+            print("Error: Exception launching camera input.")
 
     def cam_loop_synchronous(self):
-        self.ret, self.frame = self.camera.read()
+        self.frame = self.camera.latest()
+        self.ret = self.frame is not None
 
         # Check if the frame was read successfully
         if not self.ret:
             print("Error: Could not read frame.")
+            return self.frame
 
         # Display the frame
+        import cv2
         cv2.imshow('Webcam', self.frame)
         return self.frame
 
     async def cam_loop(self):
-        self.ret, self.frame = self.camera.read()
+        # Never waits on the camera: returns whatever the capture thread has most recently
+        self.frame = self.camera.latest()
+        self.ret = self.frame is not None
 
         # Check if the frame was read successfully
         if not self.ret:
             print("Error: Could not read frame.")
-
-
-        # Display the frame
-        cv2.imshow('Webcam', self.frame)
         return self.frame
 
     def cam_shutdown(self):
         # Break the loop if the user presses the 'q' key
+        import cv2
         if cv2.waitKey(1) & 0xFF == ord('q'):
             self.shutdown_flag = True
-
-# Desktop Applications
+            self.camera.stop()
 
 """
-Simulation
+GPS
 """
-class Sim(klampt.sim.simulation.SimpleSimulator):
-    """
-    This is a class for Simulations. It will contain the substepping logic where forces are applied to simulated objects.
-    """
-    def __init__(self, wm, robot, timestep, collisions=True):  # Setting collisions to True for testing ONLY
-        klampt.sim.simulation.SimpleSimulator.__init__(self, wm)
-        self.world = wm
-        self.dt = timestep
-
-        self.robotmodel = robot
-        self.link_transforms_start = [self.robotmodel.link(x).getTransform() for x in range(self.robotmodel.numLinks())]
-        self.link_transforms_end = None
-        self.link_transforms_diff = None
-
-        if collisions:
-            self.collider = klampt.model.collide.WorldCollider(self.world)
-            self.planner = klampt.plan
-        else:
-            self.collider = None
+# Latest position from gpsd. stamp is time.monotonic() when it arrived; mode is 0/1 for no fix, 2 for 2D, 3 for 3D.
+GPSFix = collections.namedtuple("GPSFix", ["stamp", "mode", "lat", "lon", "alt", "speed", "track"])
 
-    async def pressures_to_forces(self, muscle_objects, pressures, force_multiplier):
-        force_list = []  # Makes a new empty list... of tuples? Needs link number, force, and transform
-        i = 0
-        try:
-            for muscle in muscle_objects:
-                triplet_a, triplet_b = muscle.update_muscle(pressures[i])  # Updates muscles w/ OSC argument
-                force_list.append(triplet_a)
-                force_list.append(triplet_b)
-                i += 1
-        except IndexError:
-            force_list.append([0,0,0])
-            force_list.append([0,0,0])
-        force_series = pd.Series(force_list)
-        return force_series * force_multiplier
-
-    async def simLoop(self, force_list):
-        """
-        robot: A RobotModel.
-        force_list: Not sure what data structure, maybe a dataframe? name of muscle as index, with force and transform
+GPSD_WATCH = b'?WATCH={"enable":true,"json":true}\n'
 
-        Should possibly return a list of new transforms to be used for calculating stuff in the next time step.
 
-        """
-        self.link_transforms_start = [self.robotmodel.link(x).getTransform() for x in range(self.robotmodel.numLinks())]
-        """
-        Below is where we apply each force in the simulation.
-        """
-        for force in force_list:
-            link = self.body(self.robotmodel.link(force[0]))  # From the force info, gets the link to apply force
-            force_vector = force[1]  # Gets the force vector
-            transform = force[2]  # Gets the transform at which to apply force
-            link.applyForceAtLocalPoint(force_vector, transform)  # Applys the force
-
-        self.simulate(self.dt)
-        self.updateWorld()
-        if self.collider:
-            pass
-            #klampt.model.contact.world_contact_map(self.world, padding=0.1, kFriction=1, collider=self.collider)
-            #print(self.collider.collisions())
-        """
-        Maybe here is where we have to get the updated link transforms and return them as "sensor" feedback.
-        """
-        self.link_transforms_end = [self.robotmodel.link(x).getTransform() for x in range(self.robotmodel.numLinks())]
+class GPSService:
+    """
+    host, port: Where gpsd listens.
+    backoff: Seconds to wait before reconnecting, doubling after every failed attempt up to the second value.
 
-        self.link_transforms_diff = [klampt.math.se3.error(self.link_transforms_start[x], self.link_transforms_end[x])
-                                for x in range(len(self.link_transforms_start))]  # Takes the Lie derivative from start -> end
-        return self.link_transforms_end  # I don't even know if we need to use this, depends on if we pass by ref or var
+    Keeps one connection to gpsd open on a background thread and streams its JSON reports. Every position report
+    replaces self.fix with a new immutable GPSFix, so reading the fix is one attribute read: no lock, no socket, never
+    blocks. If gpsd goes away the thread reconnects with exponential backoff; the last fix stays readable meanwhile.
+    """
+    def __init__(self, host="127.0.0.1", port=2947, backoff=(.5, 30)):
+        self.host = host
+        self.port = port
+        self.backoff = backoff
+        self.fix = None
+        self.connected = False
+        self.connects = 0
+        self.reports = 0
+        self.stop_event = threading.Event()
+        self.socket = None
+        self.thread = threading.Thread(target=self.run, name="gps", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def age(self):
+        # Seconds since the last fix arrived, or None
+        return None if self.fix is None else time.monotonic() - self.fix.stamp
+
+    def run(self):
+        delay = self.backoff[0]
+        while not self.stop_event.is_set():
+            try:
+                with socket.create_connection((self.host, self.port), timeout=2) as connection:
+                    self.socket = connection
+                    connection.settimeout(1)  # Wakes up to check for stop
+                    connection.sendall(GPSD_WATCH)
+                    self.connected = True
+                    self.connects += 1
+                    delay = self.backoff[0]
+                    self.stream(connection)
+            except OSError:
+                pass
+            finally:
+                self.connected = False
+                self.socket = None
+            self.stop_event.wait(delay)
+            delay = min(delay * 2, self.backoff[1])
+
+    def stream(self, connection):
+        pending = b""
+        while not self.stop_event.is_set():
+            try:
+                data = connection.recv(4096)
+            except socket.timeout:
+                continue
+            if not data:
+                return  # gpsd closed the connection
+            pending += data
+            *lines, pending = pending.split(b"\n")
+            for line in lines:
+                self.handle(line)
+
+    def handle(self, line):
+        try:
+            report = json.loads(line)
+        except ValueError:
+            return
+        if report.get("class") != "TPV":
+            return  # VERSION, DEVICES, WATCH, SKY...
+        self.reports += 1
+        self.fix = GPSFix(time.monotonic(), report.get("mode", 0), report.get("lat"), report.get("lon"),
+                          report.get("altMSL", report.get("alt")), report.get("speed"), report.get("track"))
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread.is_alive():
+            self.thread.join()
+
+
+def nmea_coordinate(value, hemisphere):
+    # ddmm.mmmm (or dddmm.mmmm) and N/S/E/W to signed decimal degrees
+    if not value:
+        return None
+    degrees = int(float(value) / 100)
+    decimal = degrees + (float(value) - degrees * 100) / 60
+    return -decimal if hemisphere in ("S", "W") else decimal
+
+
+def nmea_to_tpv(sentence):
+    """
+    Turns a GGA or RMC sentence into a gpsd TPV report. Returns None for other sentences or no fix.
+    """
+    fields = sentence.strip().split("*")[0].split(",")
+    kind = fields[0][-3:]
+    if kind == "GGA" and len(fields) > 9 and fields[6] not in ("", "0"):
+        return {"class": "TPV", "mode": 3 if fields[9] else 2, "lat": nmea_coordinate(fields[2], fields[3]),
+                "lon": nmea_coordinate(fields[4], fields[5]), "altMSL": float(fields[9]) if fields[9] else None}
+    if kind == "RMC" and len(fields) > 8 and fields[2] == "A":
+        return {"class": "TPV", "mode": 2, "lat": nmea_coordinate(fields[3], fields[4]),
+                "lon": nmea_coordinate(fields[5], fields[6]),
+                "speed": float(fields[7]) * 0.514444 if fields[7] else None,  # Knots to m/s, as gpsd reports
+                "track": float(fields[8]) if fields[8] else None}
+    return None
+
+
+class FakeGPSD:
+    """
+    track: Path of a track file, or a list of its lines. Lines are gpsd JSON reports or NMEA sentences (GGA/RMC),
+    which are converted to TPV reports.
+    host, port: Where to listen. Port 0 picks a free one; see self.port.
+    rate: Reports per second sent to each client.
+    loop: Replays the track forever.
+
+    A stand-in gpsd for tests and benchmarks. Greets each client with a VERSION report like gpsd, then replays the
+    track to it on its own thread.
+    """
+    def __init__(self, track, host="127.0.0.1", port=0, rate=1., loop=True):
+        if isinstance(track, str):
+            with open(track) as fn:
+                track = fn.readlines()
+        self.reports = []
+        for line in (line.strip() for line in track):
+            if line.startswith("$"):
+                report = nmea_to_tpv(line)
+                if report:
+                    self.reports.append(json.dumps(report).encode() + b"\n")
+            elif line:
+                self.reports.append(line.encode() + b"\n")
+        self.period = 1 / rate if rate else 0
+        self.loop = loop
+        self.server = socket.create_server((host, port))
+        self.host, self.port = self.server.getsockname()[:2]
+        self.stop_event = threading.Event()
+        self.clients = 0
+        self.thread = threading.Thread(target=self.accept_loop, name="fake-gpsd", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def accept_loop(self):
+        self.server.settimeout(.2)
+        while not self.stop_event.is_set():
+            try:
+                client, _ = self.server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                return  # Closed
+            self.clients += 1
+            threading.Thread(target=self.replay, args=(client,), daemon=True).start()
+
+    def replay(self, client):
+        with client:
+            try:
+                client.sendall(b'{"class":"VERSION","release":"fake","proto_major":3,"proto_minor":14}\n')
+                while not self.stop_event.is_set():
+                    for report in self.reports:
+                        if self.stop_event.is_set():
+                            return
+                        client.sendall(report)
+                        if self.period:
+                            self.stop_event.wait(self.period)
+                    if not self.loop:
+                        return
+            except OSError:
+                return  # Client went away
+
+    def stop(self):
+        self.stop_event.set()
+        self.server.close()
+        if self.thread.is_alive():
+            self.thread.join()
 
-    async def configure_sim(self):
-        """
-        Sets up the simulation to do whatever I want it to do.
-        """
-        self.setSetting("boundaryLayerCollisions", "1")
-        self.setSetting("rigidObjectCollisions", "1")
-        self.setSetting("robotSelfCollisions", "1")
-        self.setSetting("robotRobotCollisions", "1")
-        self.setSetting("instabilityPostCorrectionEnergy", "0.01")
+# Desktop Applications
@@ -0,0 +1,648 @@
+"""
+Audio input, speech recognition and speech output off the main thread.
+====
+Audio comes in from a source (the microphone through a callback-mode PyAudio stream, or a WAV file for headless runs)
+and is written into a bounded AudioRing. A SpeechRecognizer worker thread drains the ring into the recognizer and posts
+each recognized phrase to the event loop. Neither side waits on the other: the microphone callback never blocks, and
+if the recognizer falls behind the oldest audio is dropped and counted instead of overflowing the device buffer.
+
+Going out, announcements are queued on a SpeechQueue by priority and spoken by its own thread, so nobody waits for
+the speaker.
+"""
+import collections
+import heapq
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import wave
+
+import numpy as np
+
+RATE = 16000  # Hz, what the small vosk models are trained on
+VOSK_MODEL = "vosk-model-small-en-us-0.15"
+
+
+class AudioRing:
+    """
+    capacity: Samples held. Two seconds at 16 kHz is 32000.
+
+    Bounded single producer, single consumer buffer of 16 bit mono samples. write() from the audio thread, read() from
+    the recognizer thread.
+    """
+    def __init__(self, capacity=2 * RATE):
+        self.capacity = capacity
+        self.buffer = np.zeros(capacity, dtype=np.int16)
+        self.written = 0  # Samples ever written, including dropped ones
+        self.consumed = 0  # Samples ever read or dropped
+        self.dropped = 0
+        self.closed = False
+        self.condition = threading.Condition()
+
+    def available(self):
+        return self.written - self.consumed
+
+    def write(self, data, block=False):
+        """
+        data: Bytes or an int16 array.
+        block: Waits for room instead of dropping the oldest samples. For file sources, never for the microphone.
+        """
+        samples = np.frombuffer(data, dtype=np.int16)
+        with self.condition:
+            if block:
+                self.condition.wait_for(lambda: self.closed or
+                                        self.capacity - self.available() >= min(len(samples), self.capacity))
+            if len(samples) > self.capacity:  # Only the newest capacity samples can be kept
+                self.written += len(samples) - self.capacity
+                samples = samples[-self.capacity:]
+            start = self.written % self.capacity
+            first = min(len(samples), self.capacity - start)
+            self.buffer[start:start + first] = samples[:first]
+            self.buffer[:len(samples) - first] = samples[first:]
+            self.written += len(samples)
+            overflow = self.available() - self.capacity
+            if overflow > 0:
+                self.consumed += overflow
+                self.dropped += overflow
+            self.condition.notify_all()
+
+    def read(self, maximum, timeout=None):
+        """
+        Returns up to maximum samples as bytes, waiting up to timeout seconds for any. Returns None on timeout and b""
+        once the ring is closed and empty.
+        """
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.available() or self.closed, timeout):
+                return None
+            count = min(maximum, self.available())
+            start = self.consumed % self.capacity
+            first = min(count, self.capacity - start)
+            data = self.buffer[start:start + first].tobytes() + self.buffer[:count - first].tobytes()
+            self.consumed += count
+            self.condition.notify_all()
+            return data
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+
+class MicrophoneSource:
+    """
+    rate: Sample rate in Hz.
+    chunk: Samples per PyAudio callback.
+    device: PyAudio input device index, None for the default.
+
+    Callback-mode PyAudio stream. PortAudio calls back on its own thread with each chunk, which goes straight into the
+    ring; nothing ever calls the blocking stream.read().
+    """
+    def __init__(self, rate=RATE, chunk=1024, device=None):
+        self.rate = rate
+        self.chunk = chunk
+        self.device = device
+        self.pyaudio = None  # Module, imported when the stream opens
+        self.audio = None
+        self.stream = None
+        self.ring = None
+        self.overflows = 0  # Chunks PortAudio reported as overflowed before they reached us
+
+    def start(self, ring):
+        import pyaudio
+        self.pyaudio = pyaudio
+        self.ring = ring
+        self.audio = pyaudio.PyAudio()
+        self.stream = self.audio.open(format=pyaudio.paInt16, channels=1, rate=self.rate, input=True,
+                                      frames_per_buffer=self.chunk, input_device_index=self.device,
+                                      stream_callback=self.callback)
+        self.stream.start_stream()
+        return self
+
+    def callback(self, in_data, frame_count, time_info, status):
+        if status & self.pyaudio.paInputOverflow:
+            self.overflows += 1
+        self.ring.write(in_data)  # Drops the oldest audio rather than block the audio thread
+        return None, self.pyaudio.paContinue
+
+    def stop(self):
+        if self.stream is not None:
+            self.stream.stop_stream()
+            self.stream.close()
+            self.audio.terminate()
+            self.stream = None
+        if self.ring is not None:
+            self.ring.close()
+
+
+class WavFileSource:
+    """
+    path: 16 bit mono WAV file.
+    realtime: Plays the file at its own rate, like a microphone. Otherwise feeds it as fast as the recognizer takes it.
+    loop: Starts over at the end instead of closing the ring.
+    chunk: Samples per write.
+
+    Stands in for the microphone in headless runs and tests.
+    """
+    def __init__(self, path, realtime=True, loop=False, chunk=1024):
+        self.path = path
+        self.realtime = realtime
+        self.loop = loop
+        self.chunk = chunk
+        with wave.open(path, "rb") as wav:
+            if wav.getsampwidth() != 2 or wav.getnchannels() != 1:
+                raise ValueError(path + " must be 16 bit mono, it is " + str(8 * wav.getsampwidth()) + " bit with " +
+                                 str(wav.getnchannels()) + " channels")
+            self.rate = wav.getframerate()
+        self.ring = None
+        self.stop_event = threading.Event()
+        self.finished = threading.Event()  # Set once the whole file has been written (never when looping)
+        self.thread = threading.Thread(target=self.run, name="wav-source", daemon=True)
+
+    def start(self, ring):
+        self.ring = ring
+        self.thread.start()
+        return self
+
+    def run(self):
+        period = self.chunk / self.rate
+        next_write = time.monotonic()
+        while not self.stop_event.is_set():
+            with wave.open(self.path, "rb") as wav:
+                data = wav.readframes(self.chunk)
+                while data and not self.stop_event.is_set():
+                    self.ring.write(data, block=not self.realtime)
+                    if self.realtime:
+                        next_write += period
+                        self.stop_event.wait(max(0., next_write - time.monotonic()))
+                    data = wav.readframes(self.chunk)
+            if not self.loop:
+                break
+        self.finished.set()
+        self.ring.close()  # Lets the recognizer flush its last phrase and finish
+
+    def stop(self):
+        self.stop_event.set()
+        self.ring.close()
+        if self.thread.is_alive():
+            self.thread.join()
+
+
+class EnergyGate:
+    """
+    rate: Sample rate in Hz.
+    frame: Seconds per analysis frame.
+    ratio: How far above the noise floor, in RMS, a frame has to be to count as speech. 3 is about 10 dB.
+    minimum: RMS below which a frame is never speech, however quiet the room.
+    hangover: Seconds of audio still passed after the last loud frame, so word endings and short pauses get through.
+    preroll: Seconds of audio from before the first loud frame passed along with it, so word onsets get through.
+    adapt: How quickly the noise floor follows the background, per frame.
+
+    Voice activity front end. Passes only the audio around speech to the recognizer, which otherwise decodes silence
+    all day. The noise floor tracks the background while nobody is talking, so it works in a quiet room and next to
+    the pumps alike.
+    """
+    def __init__(self, rate=RATE, frame=.02, ratio=3., minimum=100., hangover=.4, preroll=.2, adapt=.05):
+        self.frame = int(rate * frame)
+        self.ratio = ratio
+        self.minimum = minimum
+        self.adapt = adapt
+        self.hangover = max(1, int(hangover / frame))  # In frames
+        self.preroll = collections.deque(maxlen=max(1, int(preroll / frame)))
+        self.noise = minimum / ratio  # Running RMS of the background
+        self.remaining = 0  # Hangover frames left; nonzero while in speech
+        self.pending = np.zeros(0, dtype=np.int16)  # Samples short of a whole frame, or after an utterance ended
+        self.frames = 0
+        self.voiced = 0  # Frames passed to the recognizer
+
+    def process(self, data):
+        """
+        Takes any amount of audio. Returns (voiced audio as bytes, ended), where ended means an utterance finished at the
+        end of the voiced audio. Audio after the end of an utterance is held back; call again with b"" to get it.
+        """
+        samples = np.concatenate((self.pending, np.frombuffer(data, dtype=np.int16)))
+        count = len(samples) // self.frame
+        frames = samples[:count * self.frame].reshape(count, self.frame)
+        rms = np.sqrt(np.mean(np.square(frames, dtype=np.float32), axis=1))
+        passed = []
+        ended = False
+        x = 0
+        while x < count and not ended:
+            loud = rms[x] > max(self.noise * self.ratio, self.minimum)
+            if loud:
+                if not self.remaining:  # Onset
+                    passed.extend(self.preroll)
+                    self.preroll.clear()
+                self.remaining = self.hangover
+                passed.append(frames[x])
+            elif self.remaining:
+                self.remaining -= 1
+                passed.append(frames[x])
+                ended = not self.remaining
+            else:
+                self.preroll.append(frames[x])
+                # Follows the background up slowly and down at once, so speech never drags it up
+                self.noise = min(rms[x], self.noise + self.adapt * (rms[x] - self.noise))
+            x += 1
+        self.frames += x
+        self.voiced += len(passed)
+        self.pending = samples[x * self.frame:]
+        return b"".join(frame.tobytes() for frame in passed), ended
+
+
+def vosk_recognizer(rate=RATE, model_name=VOSK_MODEL, grammar=None):
+    """
+    Loads the vosk model, which takes a while, and returns a recognizer for it.
+    grammar: Phrases to restrict recognition to, lowercase words only. Anything else comes back as nothing. Decoding
+    against a small grammar is much cheaper than open vocabulary.
+    """
+    import vosk
+    model = vosk.Model(model_name=model_name)
+    if grammar:
+        return vosk.KaldiRecognizer(model, rate, json.dumps(list(grammar) + ["[unk]"]))
+    return vosk.KaldiRecognizer(model, rate)
+
+
+class SpeechRecognizer:
+    """
+    recognizer: A vosk KaldiRecognizer, or anything with AcceptWaveform, Result and FinalResult that return vosk JSON.
+    source: MicrophoneSource or WavFileSource.
+    loop: Event loop that phrases are posted to.
+    post: Called on the loop with each recognized phrase.
+    seconds: Audio the ring holds while the recognizer is busy. Older audio is dropped beyond that.
+    chunk: Most samples handed to the recognizer at once.
+    gate: An EnergyGate to decode only the audio around speech, or None to decode everything.
+
+    Runs the recognizer on its own thread, so decoding never holds up the event loop and the control tick.
+    """
+    def __init__(self, recognizer, source, loop, post, seconds=2., chunk=4000, gate=None):
+        self.recognizer = recognizer
+        self.gate = gate
+        self.source = source
+        self.loop = loop
+        self.post = post
+        self.chunk = chunk
+        self.ring = AudioRing(int(seconds * source.rate))
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="speech", daemon=True)
+        self.phrases = 0
+        self.heard = 0  # Samples that came in
+        self.samples = 0  # Samples decoded
+        self.busy = 0.  # Seconds spent in the recognizer
+        self.cpu = 0.  # CPU seconds used by this thread, gate included
+
+    def start(self):
+        self.thread.start()
+        self.source.start(self.ring)
+        return self
+
+    def run(self):
+        start_cpu = time.thread_time()
+        while not self.stop_event.is_set():
+            data = self.ring.read(self.chunk, timeout=.1)
+            self.cpu = time.thread_time() - start_cpu
+            if data is None:
+                continue
+            if not data:
+                break  # Source finished
+            self.heard += len(data) // 2
+            if self.gate is None:
+                self.decode(data)
+                continue
+            voiced, ended = self.gate.process(data)
+            while True:
+                self.decode(voiced)
+                if not ended:
+                    break
+                self.emit(self.recognizer.FinalResult())  # End of an utterance; also resets the recognizer
+                voiced, ended = self.gate.process(b"")
+        self.emit(self.recognizer.FinalResult())
+        self.cpu = time.thread_time() - start_cpu
+
+    def decode(self, data):
+        if not data:
+            return
+        start = time.perf_counter()
+        accepted = self.recognizer.AcceptWaveform(data)
+        self.busy += time.perf_counter() - start
+        self.samples += len(data) // 2
+        if accepted:
+            self.emit(self.recognizer.Result())
+
+    def emit(self, result):
+        text = " ".join(word for word in json.loads(result).get("text", "").split() if word != "[unk]")
+        if not text:
+            return
+        self.phrases += 1
+        try:
+            self.loop.call_soon_threadsafe(self.post, text)
+        except RuntimeError:
+            pass  # The loop has closed, nobody is listening
+
+    def realtime_factor(self):
+        # Recognizer time per second of audio heard. Above 1 it cannot keep up and audio gets dropped.
+        return self.busy / (self.heard / self.source.rate) if self.heard else 0.
+
+    def stop(self):
+        self.source.stop()
+        self.stop_event.set()
+        if self.thread.is_alive():
+            self.thread.join()
+
+
+"""
+Speech output
+"""
+# Announcement priorities, most urgent first
+SAFETY, ERROR, STATUS, CHATTER = range(4)
+
+
+class Pyttsx3Backend:
+    """
+    voice_index: Index into the engine's voices.
+    rate: Speaking rate in words per minute.
+
+    Renders speech with pyttsx3 into a WAV file and plays it through PyAudio in small chunks, so playback can be cut
+    short between chunks. Everything runs on the SpeechQueue thread, from open() on.
+    """
+    def __init__(self, voice_index=0, rate=200, chunk=1024):
+        self.voice_index = voice_index
+        self.rate = rate
+        self.chunk = chunk
+        self.engine = None
+        self.pyaudio = None
+        self.audio = None
+        self.directory = None
+
+    def open(self):
+        if sys.platform == "win32":
+            import pythoncom
+            pythoncom.CoInitialize()  # SAPI5 is COM, used from this thread only
+        import pyttsx3  # Text to speech
+        import pyaudio
+        self.engine = pyttsx3.init()
+        self.engine.setProperty("rate", self.rate)
+        self.engine.setProperty("voice", self.engine.getProperty("voices")[self.voice_index].id)
+        self.pyaudio = pyaudio
+        self.audio = pyaudio.PyAudio()
+        self.directory = tempfile.mkdtemp(prefix="exos-tts-")
+
+    def render(self, text):
+        """
+        Returns a clip, (samples, rate) with samples int16 shaped (frames, channels), or None if the driver cannot write
+        WAV.
+        """
+        path = os.path.join(self.directory, "phrase.wav")
+        try:
+            self.engine.save_to_file(text, path)
+            self.engine.runAndWait()
+            with wave.open(path, "rb") as wav:
+                if wav.getsampwidth() != 2:
+                    return None
+                samples = np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16)
+                return samples.reshape(-1, wav.getnchannels()), wav.getframerate()
+        except (OSError, EOFError, wave.Error):
+            return None
+
+    def play(self, clip, interrupt):
+        """
+        Plays a rendered clip. Returns False if interrupt was set before it finished.
+        """
+        samples, rate = clip
+        stream = self.audio.open(format=self.pyaudio.paInt16, channels=samples.shape[1], rate=rate, output=True)
+        try:
+            for start in range(0, len(samples), self.chunk):
+                if interrupt.is_set():
+                    return False
+                stream.write(samples[start:start + self.chunk].tobytes())
+            return True
+        finally:
+            stream.stop_stream()
+            stream.close()
+
+    def speak(self, text):
+        # For text render() could not handle. Cannot be interrupted.
+        self.engine.say(text)
+        self.engine.runAndWait()
+
+    def close(self):
+        if self.engine is not None:
+            self.engine.stop()
+            self.audio.terminate()
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class NullBackend:
+    """
+    seconds_per_character: How long a phrase takes to say.
+    render_time: Seconds render() takes, standing in for the speech engine's synthesis time.
+
+    Speaks in silence, taking as long as a real voice would, and writes down what it played. For tests and machines
+    without sound hardware.
+    """
+    def __init__(self, seconds_per_character=.06, render_time=0.):
+        self.seconds_per_character = seconds_per_character
+        self.render_time = render_time
+        self.played = []  # (text, finished) in the order they played
+        self.rendered = []  # Texts in the order they were rendered
+
+    def open(self):
+        pass
+
+    def render(self, text):
+        time.sleep(self.render_time)
+        self.rendered.append(text)
+        return text, len(text) * self.seconds_per_character
+
+    def play(self, clip, interrupt):
+        text, seconds = clip
+        finished = not interrupt.wait(seconds)
+        self.played.append((text, finished))
+        return finished
+
+    def speak(self, text):
+        time.sleep(len(text) * self.seconds_per_character)
+        self.played.append((text, True))
+
+    def close(self):
+        pass
+
+
+class SpeechQueue:
+    """
+    backend: Pyttsx3Backend or NullBackend.
+    phrases: Texts rendered to audio as soon as the thread starts, so saying them later costs no synthesis time.
+    limit: Most announcements waiting at once. Past that, the least urgent ones are dropped.
+    preempt: Announcements at this priority or more urgent cut off a less urgent one that is playing.
+
+    Speaks announcements on its own thread in priority order, oldest first within a priority. say() never waits. Saying
+    text that is already waiting or playing does not queue it again.
+    """
+    def __init__(self, backend, phrases=(), limit=16, preempt=SAFETY):
+        self.backend = backend
+        self.phrases = list(phrases)
+        self.limit = limit
+        self.preempt = preempt
+        self.cache = {}  # Text -> rendered clip, filled from phrases
+        self.heap = []  # [priority, sequence, text, requested, live]; stale entries are marked dead, not removed
+        self.pending = {}  # Text -> its live heap entry
+        self.sequence = 0
+        self.current = None  # Entry being spoken
+        self.closed = False  # No more announcements accepted
+        self.stopping = False
+        self.condition = threading.Condition()
+        self.interrupt = threading.Event()
+        self.ready = threading.Event()  # Set once every phrase is rendered
+        self.latencies = []  # (text, seconds from say() to the start of playback, pre-rendered)
+        self.spoken = 0
+        self.coalesced = 0
+        self.preempted = 0
+        self.dropped = 0
+        self.thread = threading.Thread(target=self.run, name="tts", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def say(self, text, priority=CHATTER):
+        """
+        Queues text to be spoken. Returns False if it was dropped.
+        """
+        with self.condition:
+            if self.closed:
+                return False
+            if self.current is not None and self.current[2] == text and self.current[0] <= priority:
+                self.coalesced += 1  # Being said right now
+                return True
+            entry = self.pending.get(text)
+            if entry is not None:
+                self.coalesced += 1
+                if priority >= entry[0]:
+                    return True
+                entry[4] = False  # Requeued below at the more urgent priority
+                requested = entry[3]
+            else:
+                requested = time.monotonic()
+                if len(self.pending) >= self.limit:
+                    worst = max(self.pending.values(), key=lambda entry: (entry[0], entry[1]))
+                    if (priority, self.sequence) > (worst[0], worst[1]):
+                        self.dropped += 1
+                        return False
+                    worst[4] = False
+                    del self.pending[worst[2]]
+                    self.dropped += 1
+            self.sequence += 1
+            entry = [priority, self.sequence, text, requested, True]
+            heapq.heappush(self.heap, entry)
+            self.pending[text] = entry
+            if self.current is not None and priority <= self.preempt and priority < self.current[0]:
+                self.interrupt.set()
+            self.condition.notify_all()
+            return True
+
+    def next_entry(self):
+        # Pops the most urgent live entry, with the lock held
+        while self.heap:
+            entry = heapq.heappop(self.heap)
+            if entry[4]:
+                del self.pending[entry[2]]
+                return entry
+        return None
+
+    def run(self):
+        unrendered = list(self.phrases)
+        try:
+            self.backend.open()
+            if not unrendered:
+                self.ready.set()
+            while True:
+                with self.condition:
+                    self.condition.wait_for(lambda: self.pending or unrendered or self.stopping)
+                    if self.stopping:
+                        return
+                    entry = self.next_entry()
+                    self.current = entry
+                    self.interrupt.clear()
+                if entry is None:  # Nothing to say, so render the next phrase
+                    phrase = unrendered.pop(0)
+                    if phrase not in self.cache:
+                        self.cache[phrase] = self.backend.render(phrase)
+                    if not unrendered:
+                        self.ready.set()
+                    continue
+                self.speak(entry)
+                with self.condition:
+                    self.current = None
+                    self.condition.notify_all()
+        finally:
+            with self.condition:  # Whatever is still queued will not be said; nobody should wait on it
+                self.closed = True
+                self.pending.clear()
+                self.heap.clear()
+                self.current = None
+                self.condition.notify_all()
+            self.ready.set()
+            self.backend.close()
+
+    def speak(self, entry):
+        text = entry[2]
+        clip = self.cache.get(text)
+        cached = clip is not None
+        if not cached:
+            clip = self.backend.render(text)
+        self.latencies.append((text, time.monotonic() - entry[3], cached))
+        if clip is None:
+            self.backend.speak(text)
+        elif not self.backend.play(clip, self.interrupt):
+            self.preempted += 1
+        self.spoken += 1
+
+    def wait(self, timeout=None):
+        """
+        Waits until everything queued has been said. Returns False on timeout.
+        """
+        with self.condition:
+            return self.condition.wait_for(lambda: not self.pending and self.current is None, timeout)
+
+    def stop(self, timeout=5.):
+        """
+        Stops taking announcements, gives the queued ones up to timeout seconds to finish, then cuts off the rest.
+        """
+        with self.condition:
+            self.closed = True
+        if self.thread.is_alive():
+            self.wait(timeout)
+        with self.condition:
+            self.stopping = True
+            self.interrupt.set()
+            self.condition.notify_all()
+        if self.thread.is_alive():
+            self.thread.join()
+
+
+def main():
+    """
+    Transcribes a WAV file through the same path as the microphone: python -m pyonics.submodules.audio.audio speech.wav
+    """
+    import asyncio
+    if len(sys.argv) < 2:
+        print("Usage: python -m pyonics.submodules.audio.audio speech.wav [--realtime] [--gate]")
+        return
+
+    async def transcribe(path, realtime, gate):
+        source = WavFileSource(path, realtime=realtime)
+        listener = SpeechRecognizer(vosk_recognizer(source.rate), source, asyncio.get_running_loop(), print,
+                                    gate=EnergyGate(source.rate) if gate else None).start()
+        while listener.thread.is_alive():
+            await asyncio.sleep(.05)
+        await asyncio.sleep(0)  # Lets the last posted phrase print
+        print("{:.1f} s of audio, {} phrases, real-time factor {:.3f}, {} samples dropped".format(
+            listener.heard / source.rate, listener.phrases, listener.realtime_factor(), listener.ring.dropped))
+
+    asyncio.run(transcribe(sys.argv[1], "--realtime" in sys.argv, "--gate" in sys.argv))
+
+
+if __name__ == "__main__":
+    main()
@@ -8,20 +8,30 @@ to optimize with C/C++.
 """
 STANDARD LIBRARY IMPORTS
 """
-import pandas as pd
 import numpy as np
 import argparse
 import asyncio
+import csv
+import hashlib
+import heapq
+import json
 import math
+import os
+import struct
+import threading
+import time
+import warnings
 
 """
 OUTSIDE LIBRARY IMPORTS
 """
 import klampt
+import klampt.control  # OmniRobotInterface
+import klampt.io
+import klampt.math.se3 as kse3
 import klampt.math.vectorops as kmv
 import klampt.model.contact as kmc
-import klampt.plan.robotplanning as kmrp
-import klampt.plan.cspace as kmcs
+import klampt.sim  # ActuatorEmulator
 import pythonosc
 from pythonosc.dispatcher import Dispatcher
 import pythonosc.osc_server
@@ -30,6 +40,409 @@ import pythonosc.osc_server
 CUSTOM LIBRARY IMPORTS
 """
 
+"""
+FUNCTION DEFINITIONS
+"""
+"""
+Muscle Attachments
+"""
+ATTACHMENT_CACHE_VERSION = 1
+# Column name -> parser. transform_a / transform_b are comma separated offsets and become delta_a / delta_b.
+ATTACHMENT_COLUMNS = {"name": str, "link_a": int, "link_b": int, "transform_a": None, "transform_b": None,
+                      "label_a": str, "label_b": str, "turns": float, "r_0": float, "l_0": float,
+                      "weave_length": float, "max_pressure": float}
+
+
+def parse_attachments(path):
+    """
+    path: Filepath of a semicolon separated muscle attachments CSV.
+
+    Parses and validates the CSV into typed arrays, one entry per muscle: name, link_a, link_b, delta_a, delta_b
+    (N x 3 offsets), label_a, label_b, turns, r_0, l_0, weave_length, max_pressure. Blank lines are skipped. When a
+    column appears twice in the header the first one is used, as pandas did. Raises ValueError naming the file and
+    line of the first bad value.
+    """
+    with open(path, newline="") as fn:
+        reader = csv.reader(fn, delimiter=";")
+        header = [column.strip() for column in next(reader)]
+        columns = {}
+        for x, column in enumerate(header):
+            if column in columns:
+                warnings.warn("Duplicate column " + column + " in " + path + ", using the first one.")
+            else:
+                columns[column] = x
+        missing = [column for column in ATTACHMENT_COLUMNS if column not in columns]
+        if missing:
+            raise ValueError(path + " is missing columns: " + ", ".join(missing))
+
+        values = {column: [] for column in ATTACHMENT_COLUMNS}
+        for row in reader:
+            if not any(field.strip() for field in row):
+                continue
+            try:
+                for column, parse in ATTACHMENT_COLUMNS.items():
+                    field = row[columns[column]].strip()
+                    if parse is None:
+                        offset = [float(s) for s in field.split(",")]
+                        if len(offset) != 3:
+                            raise ValueError(column + " needs three values, got " + field)
+                        values[column].append(offset)
+                    else:
+                        values[column].append(parse(field))
+            except (ValueError, IndexError) as error:
+                raise ValueError(path + " line " + str(reader.line_num) + ": " + str(error)) from None
+
+    attachments = {"name": np.array(values["name"], dtype=str),
+                   "link_a": np.array(values["link_a"], dtype=np.int32),
+                   "link_b": np.array(values["link_b"], dtype=np.int32),
+                   "delta_a": np.array(values["transform_a"], dtype=float).reshape(-1, 3),
+                   "delta_b": np.array(values["transform_b"], dtype=float).reshape(-1, 3),
+                   "label_a": np.array(values["label_a"], dtype=str),
+                   "label_b": np.array(values["label_b"], dtype=str)}
+    for column in ("turns", "r_0", "l_0", "weave_length", "max_pressure"):
+        attachments[column] = np.array(values[column], dtype=float)
+
+    for column in ("link_a", "link_b"):
+        if np.any(attachments[column] < 0):
+            raise ValueError(path + ": " + column + " must be a link index, not negative")
+    for column in ("turns", "l_0", "weave_length", "max_pressure"):
+        if np.any(attachments[column] <= 0):
+            raise ValueError(path + ": " + column + " must be positive")
+    return attachments
+
+
+def file_digest(path):
+    with open(path, "rb") as fn:
+        return hashlib.sha256(fn.read()).hexdigest()
+
+
+def load_attachments(path, cache=True):
+    """
+    path: Filepath of a muscle attachments CSV.
+    cache: Reads and writes a binary sidecar next to the CSV (path + ".cache").
+
+    Returns the typed arrays from parse_attachments. The sidecar is used as is while the CSV's mtime and size match
+    what it recorded. If they changed, the CSV is hashed, and the sidecar is still used if the contents are the same.
+    Otherwise the CSV is parsed again and the sidecar rewritten.
+    """
+    sidecar = path + ".cache"
+    stat = os.stat(path)
+    digest = None
+    if cache and os.path.exists(sidecar):
+        try:
+            with open(sidecar, "rb") as fn:
+                meta = json.loads(fn.readline())
+                if meta["version"] == ATTACHMENT_CACHE_VERSION:
+                    if meta["mtime_ns"] != stat.st_mtime_ns or meta["size"] != stat.st_size:
+                        digest = file_digest(path)
+                    if digest is None or digest == meta["sha256"]:
+                        table = np.lib.format.read_array(fn)
+                        attachments = {column: table[column] for column in table.dtype.names}
+                        if digest is not None:
+                            save_attachment_cache(sidecar, attachments, stat, digest)  # Touched but unchanged
+                        return attachments
+        except (OSError, ValueError, KeyError):
+            pass  # Unreadable cache, parse again
+
+    attachments = parse_attachments(path)
+    if cache:
+        save_attachment_cache(sidecar, attachments, stat, digest or file_digest(path))
+    return attachments
+
+
+def save_attachment_cache(sidecar, attachments, stat, digest):
+    """
+    One line of JSON (version, CSV mtime, size and hash), then the attachments as one structured .npy array.
+    """
+    table = np.zeros(len(attachments["name"]), dtype=[(column, values.dtype, values.shape[1:])
+                                                     for column, values in attachments.items()])
+    for column, values in attachments.items():
+        table[column] = values
+    meta = {"version": ATTACHMENT_CACHE_VERSION, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "sha256": digest}
+    temporary = sidecar + ".tmp"
+    try:
+        with open(temporary, "wb") as fn:
+            fn.write(json.dumps(meta).encode() + b"\n")
+            np.lib.format.write_array(fn, table)
+        os.replace(temporary, sidecar)  # Readers never see a half written cache
+    except OSError:
+        pass  # Read-only install; parse every time
+
+"""
+Motion Planning
+"""
+ROADMAP_CACHE_VERSION = 2  # 1 was saved from klampt MotionPlans, which dropped restored edges
+
+# Everything that shapes the cspace and the roadmap. Part of the cache key, so changing any of it starts a new roadmap.
+PLANNER_SETTINGS = {"type": "prm", "edgeCheckResolution": 0.5, "neighbors": 10}
+
+
+def roadmap_key(robot_path, world_path, settings=PLANNER_SETTINGS):
+    """
+    Returns a hash of the robot file, the world file and the planner settings. A roadmap is only valid for the
+    geometry, joint limits and collision settings it was built with.
+    """
+    key = hashlib.sha256()
+    key.update(str(ROADMAP_CACHE_VERSION).encode())
+    key.update(file_digest(robot_path).encode())
+    key.update(file_digest(world_path).encode())
+    key.update(json.dumps(settings, sort_keys=True).encode())
+    return key.hexdigest()
+
+
+def roadmap_path(robot_path, key):
+    # Next to the robot file, one per key, so switching settings back and forth keeps both roadmaps
+    return robot_path + "." + key[:16] + ".roadmap"
+
+
+def load_roadmap(path, key):
+    """
+    Returns (milestones, edges) saved under key, or None if there is no usable roadmap at path.
+    """
+    try:
+        with open(path, "rb") as fn:
+            meta = json.loads(fn.readline())
+            if meta["version"] != ROADMAP_CACHE_VERSION or meta["key"] != key:
+                return None
+            milestones = np.lib.format.read_array(fn)
+            edges = np.lib.format.read_array(fn)
+    except (OSError, ValueError, KeyError):
+        return None  # Missing or unreadable, start a new roadmap
+    if len(edges) and (edges.min() < 0 or edges.max() >= len(milestones)):
+        return None  # Edges to milestones that are not there
+    return milestones, edges
+
+
+def save_roadmap(path, key, milestones, edges):
+    """
+    One line of JSON (version, key and sizes), then the milestones (one configuration per row) and the edges (pairs of
+    milestone indices) as .npy arrays.
+    """
+    milestones = np.asarray(milestones, dtype=np.float64)
+    edges = np.asarray(edges, dtype=np.int32).reshape(-1, 2)
+    meta = {"version": ROADMAP_CACHE_VERSION, "key": key, "milestones": len(milestones), "edges": len(edges)}
+    temporary = path + ".tmp"
+    try:
+        with open(temporary, "wb") as fn:
+            fn.write(json.dumps(meta).encode() + b"\n")
+            np.lib.format.write_array(fn, milestones)
+            np.lib.format.write_array(fn, edges)
+        os.replace(temporary, path)  # Readers never see a half written roadmap
+    except OSError:
+        pass  # Read-only install; the roadmap is rebuilt every boot
+
+class Roadmap:
+    """
+    cspace: A klampt CSpace. Its planning hooks are set up here if no MotionPlan has done it already.
+    milestones, edges: A saved graph, as from load_roadmap. Restored as it was, without checking it again.
+    neighbors: Nearest milestones each new one tries to connect to, like klampt's PRM.
+    radius: Longest edge tried, as distance in configuration space. None for no limit.
+
+    A probabilistic roadmap that keeps its own milestones and edges. klampt's MotionPlan takes no edges and no new
+    endpoints once it holds milestones, so it can neither be restored from a file nor queried twice. This one grows
+    like a PRM, saves and restores its graph whole, and answers a query by connecting only the start and the goal to
+    the graph and searching the stored edges.
+    """
+    def __init__(self, cspace, milestones=(), edges=(), neighbors=10, radius=None):
+        if cspace.cspace is None:
+            cspace.setup()
+        self.cspace = cspace
+        self.neighbors = neighbors
+        self.radius = radius
+        milestones = np.asarray(milestones, dtype=np.float64)
+        self.count = len(milestones)
+        self.points = milestones.reshape(self.count, -1).copy() if self.count else None  # Grows by doubling
+        self.edges = [tuple(edge) for edge in np.asarray(edges, dtype=np.intp).reshape(-1, 2).tolist()]
+        self.adjacency = [[] for _ in range(self.count)]
+        for a, b in self.edges:
+            self.adjacency[a].append(b)
+            self.adjacency[b].append(a)
+
+    @property
+    def milestones(self):
+        return self.points[:self.count] if self.count else np.zeros((0, 0))
+
+    def graph(self):
+        # (milestones, edges) as arrays, for save_roadmap
+        return self.milestones.copy(), np.asarray(self.edges, dtype=np.int32).reshape(-1, 2)
+
+    def nearest(self, q, count):
+        # Indices of the count milestones nearest q within radius, nearest first
+        if not self.count:
+            return []
+        distances = np.linalg.norm(self.milestones - q, axis=1)
+        order = np.argsort(distances)[:count]
+        if self.radius is not None:
+            order = order[distances[order] <= self.radius]
+        return order.tolist()
+
+    def add_milestone(self, q):
+        """
+        Adds a feasible configuration and connects it to the nearest milestones it can see. Returns its index.
+        """
+        q = np.asarray(q, dtype=np.float64)
+        neighbors = [x for x in self.nearest(q, self.neighbors)
+                     if self.cspace.isVisible(q.tolist(), self.points[x].tolist())]
+        if self.points is None:
+            self.points = np.zeros((64, len(q)))
+        elif self.count == len(self.points):
+            self.points = np.concatenate((self.points, np.zeros_like(self.points)))
+        index = self.count
+        self.points[index] = q
+        self.count += 1
+        self.adjacency.append(neighbors)
+        for x in neighbors:
+            self.adjacency[x].append(index)
+            self.edges.append((x, index))
+        return index
+
+    def plan_more(self, iterations):
+        # Samples iterations configurations and adds the feasible ones. Returns the number of milestones.
+        for _ in range(iterations):
+            q = self.cspace.sample()
+            if self.cspace.isFeasible(q):
+                self.add_milestone(q)
+        return self.count
+
+    def query(self, start, goal):
+        """
+        Returns a path from start to goal through the roadmap, as a list of configurations, or None. The start and the
+        goal are connected to their nearest visible milestones for this query only; the roadmap is left as it was.
+        """
+        start, goal = list(start), list(goal)
+        if not (self.cspace.isFeasible(start) and self.cspace.isFeasible(goal)):
+            return None
+        if self.cspace.isVisible(start, goal):
+            return [start, goal]
+        points = self.milestones
+        exits = {x: float(np.linalg.norm(points[x] - goal)) for x in self.nearest(np.asarray(goal), 2 * self.neighbors)
+                 if self.cspace.isVisible(points[x].tolist(), goal)}
+        if not exits:
+            return None
+        # Dijkstra from the start's visible neighbors over the stored edges, on to the goal (-1) from any milestone that
+        # sees it
+        cost = {}
+        previous = {}
+        frontier = []
+        for x in self.nearest(np.asarray(start), 2 * self.neighbors):
+            if self.cspace.isVisible(start, points[x].tolist()):
+                heapq.heappush(frontier, (float(np.linalg.norm(points[x] - start)), x, -2))  # -2 is the start
+        while frontier:
+            distance, x, before = heapq.heappop(frontier)
+            if x in cost:
+                continue
+            cost[x] = distance
+            previous[x] = before
+            if x == -1:  # The goal
+                break
+            if x in exits:
+                heapq.heappush(frontier, (distance + exits[x], -1, x))
+            for y in self.adjacency[x]:
+                if y not in cost:
+                    heapq.heappush(frontier, (distance + float(np.linalg.norm(points[x] - points[y])), y, x))
+        if -1 not in cost:
+            return None
+        path = [goal]
+        x = previous[-1]
+        while x != -2:
+            path.append(points[x].tolist())
+            x = previous[x]
+        path.append(start)
+        return path[::-1]
+
+"""
+Collision Filtering
+"""
+SELF_COLLISION_CACHE_VERSION = 1
+
+
+def sample_self_collision_pairs(robot, samples=2000, seed=0):
+    """
+    robot: A RobotModel. Its configuration is restored afterwards.
+    samples: Random configurations to try, uniform within the joint limits (unbounded joints within +-pi).
+    seed: Seeds the sampler, so a robot file always gives the same mask.
+
+    Returns a symmetric (numLinks, numLinks) boolean matrix, True for the link pairs worth testing: the pairs that
+    touched in at least one sample, minus adjacent links (they always touch at the joint) and pairs the robot file
+    disables. A pair that only touches in poses the samples missed is dropped too, so use plenty of samples. Slow, which
+    is why self_collision_mask caches the result.
+    """
+    import klampt.model.collide as kcollide
+    count = robot.numLinks()
+    geometries = [robot.link(x).geometry() for x in range(count)]
+    candidates = [(a, b) for a in range(count) for b in range(a + 1, count)
+                  if not geometries[a].empty() and not geometries[b].empty() and robot.selfCollisionEnabled(a, b)
+                  and robot.link(b).getParent() != a and robot.link(a).getParent() != b]
+    lower, upper = (np.clip(np.asarray(limit, dtype=np.float64), -math.pi, math.pi) for limit in robot.getJointLimits())
+    rng = np.random.default_rng(seed)
+    start = robot.getConfig()
+    touched = np.zeros((count, count), dtype=bool)
+    for _ in range(samples):
+        robot.setConfig(rng.uniform(lower, upper).tolist())
+        for a, b in kcollide.self_collision_iter(geometries, candidates):
+            touched[a, b] = touched[b, a] = True
+    robot.setConfig(start)
+    return touched
+
+
+def cached_self_collision_mask(robot_path, samples=2000):
+    """
+    Returns the mask from robot_path's ".pairs" sidecar, or None if there is none yet or it is stale or unreadable.
+    Never samples, so it is cheap enough for the boot path.
+    """
+    sidecar = robot_path + ".pairs"
+    if not os.path.exists(sidecar):
+        return None
+    try:
+        with open(sidecar, "rb") as fn:
+            meta = json.loads(fn.readline())
+            if (meta["version"] == SELF_COLLISION_CACHE_VERSION and meta["sha256"] == file_digest(robot_path)
+                    and meta["samples"] == samples):
+                return np.lib.format.read_array(fn)
+    except (OSError, ValueError, KeyError):
+        pass  # Unreadable cache, sample again
+    return None
+
+
+def self_collision_mask(robot_path, samples=2000, cache=True):
+    """
+    robot_path: Filepath of a .rob file.
+    cache: Reads and writes a sidecar next to the robot file (robot_path + ".pairs").
+
+    Returns the link pair mask from sample_self_collision_pairs. The sampling runs on a robot loaded just for it, so it
+    is safe to call while the controller's robot is in use, and only once per robot file: after that the sidecar is
+    used as long as the file's hash and the sample count match.
+    """
+    if cache:
+        mask = cached_self_collision_mask(robot_path, samples)
+        if mask is not None:
+            return mask
+
+    sidecar = robot_path + ".pairs"
+    digest = file_digest(robot_path)
+    world = klampt.WorldModel()
+    world.loadRobot(robot_path)
+    mask = sample_self_collision_pairs(world.robot(0), samples)
+    if cache:
+        meta = {"version": SELF_COLLISION_CACHE_VERSION, "sha256": digest, "samples": samples}
+        temporary = sidecar + ".tmp"
+        try:
+            with open(temporary, "wb") as fn:
+                fn.write(json.dumps(meta).encode() + b"\n")
+                np.lib.format.write_array(fn, mask)
+            os.replace(temporary, sidecar)  # Readers never see a half written cache
+        except OSError:
+            pass  # Read-only install; sample every time
+    return mask
+
+
+def sphere_box_overlap(centers, radii, lower, upper):
+    """
+    Returns a (spheres, boxes) boolean matrix, True where a sphere reaches into an axis-aligned box.
+    """
+    gap = np.maximum(np.maximum(lower[None, :, :] - centers[:, None, :], centers[:, None, :] - upper[None, :, :]), 0)
+    return np.einsum("sbi,sbi->sb", gap, gap) <= radii[:, None] ** 2
+
 """
 CLASS DEFINITIONS
 """
@@ -54,16 +467,16 @@ class Muscle(klampt.sim.ActuatorEmulator):
         self.b = int(row["link_b"])
 
         self.link_a = self.controller.bones[self.a]  # Refers to the **controller's** knowledge of the link *transform*
-        self.link_b = self.controller.bones[self.b]  # Might need to be updated
+        self.link_b = self.controller.bones[self.b]  # Row of the transform buffer: R column-major, then t
         """
         The below values describe the displacement of the muscle attachment from the origin of the robot link.
         """
-        self.delta_a = [float(s) for s in row["transform_a"].split(",")]
-        self.delta_b = [float(s) for s in row["transform_b"].split(",")]
+        self.delta_a = [float(s) for s in row["delta_a"]]
+        self.delta_b = [float(s) for s in row["delta_b"]]
 
-        # This starts out fine, but may eventually need to be updated each time step according to link position
-        self.transform_a = kmv.add(self.link_a[1], self.delta_a)
-        self.transform_b = kmv.add(self.link_b[1], self.delta_b)
+        # World positions of the attachment points, updated each time step from the link transforms
+        self.transform_a = self.attachment(self.link_a, self.delta_a)
+        self.transform_b = self.attachment(self.link_b, self.delta_b)
 
         # Now we add some attributes that the simulated and real robot will share
         self.geometry = klampt.GeometricPrimitive()
@@ -79,6 +492,11 @@ class Muscle(klampt.sim.ActuatorEmulator):
         self.displacement = 0  # This is a calculated value; should initialize at 0
         self.pressure = 0  # Should be pressure relative to external, so initialize at 0 - need units eventually
 
+    @staticmethod
+    def attachment(link, delta):
+        # Link transform row (R column-major, then t) applied to an offset in the link frame, as MuscleBank does it
+        return kse3.apply((link[:9].tolist(), link[9:].tolist()), delta)
+
     def collides(self):
         """
         Klampt syntactical sugar so this returns as having collision properties.
@@ -117,8 +535,8 @@ class Muscle(klampt.sim.ActuatorEmulator):
         self.link_a = self.controller.bones[self.a]
         self.link_b = self.controller.bones[self.b]
 
-        self.transform_a = kmv.add(self.link_a[1], self.delta_a)  # Adds link transform to muscle delta
-        self.transform_b = kmv.add(self.link_b[1], self.delta_b)
+        self.transform_a = self.attachment(self.link_a, self.delta_a)  # Moves muscle delta with the link
+        self.transform_b = self.attachment(self.link_b, self.delta_b)
 
         self.geometry.setSegment(self.transform_a, self.transform_b)  # Should be updating the transform
 
@@ -136,7 +554,7 @@ class Muscle(klampt.sim.ActuatorEmulator):
 
         # Calculating unit vectors by dividing 3-tuple by its length
         unit_a = kmv.div(direction_a, self.length)
-        unit_b = kmv.mul(direction_b, self.length)  # Redundant but I'm including this to make it easier to read for now
+        unit_b = kmv.div(direction_b, self.length)  # Redundant but I'm including this to make it easier to read for now
 
         # Combining unit vectors and force magnitude to give a force vector
         force_a = kmv.mul(kmv.mul(unit_a, force), .5)  # Half (.5) because of Newton's Third Law,
@@ -165,6 +583,402 @@ class Muscle(klampt.sim.ActuatorEmulator):
 class MuscleGroup():
     pass
 
+class TransformBuffer:
+    """
+    robot: A RobotModel.
+
+    Preallocated link transforms, one (numLinks, 12) row block per pose: the column-major rotation, then the
+    translation. Two blocks are kept, the previous and current pose, and capture() flips between them and refills the
+    new current block in place. Indexing returns a view of a row in the current pose, so readers never allocate.
+    """
+    def __init__(self, robot):
+        self.robot = robot
+        self.count = robot.numLinks()
+        self.blocks = np.zeros((2, self.count, 12))
+        self.index = 0
+        self.current = self.blocks[0]
+        self.previous = self.blocks[1]
+        self.diff_cache = np.zeros((self.count, 6))
+        self.diff_stale = True
+
+        self.capture()
+        self.previous[:] = self.current  # No motion yet
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, x):
+        return self.current[x]
+
+    def capture(self):
+        """
+        Makes the current pose the previous one and reads every link transform from the robot into the other block.
+        """
+        self.index ^= 1
+        self.current = self.blocks[self.index]
+        self.previous = self.blocks[self.index ^ 1]
+        for x in range(self.count):
+            rotation, translation = self.robot.link(x).getTransform()
+            self.current[x, :9] = rotation
+            self.current[x, 9:] = translation
+        self.diff_stale = True
+        return self.current
+
+    def rotations(self, block=None):
+        """
+        Returns a (numLinks, 3, 3) view of the rotation matrices in a block, current by default.
+        """
+        if block is None:
+            block = self.current
+        return block[:, :9].reshape(-1, 3, 3).transpose(0, 2, 1)  # klampt stores columns first
+
+    def translations(self, block=None):
+        if block is None:
+            block = self.current
+        return block[:, 9:]
+
+    def diff(self):
+        """
+        Returns klampt.math.se3.error(previous, current) for every link as a (numLinks, 6) array: the rotation vector of
+        previous * current^-1, then previous translation minus current translation. Only computed when asked for.
+        """
+        if not self.diff_stale:
+            return self.diff_cache
+        relative = self.rotations(self.previous) @ self.rotations().transpose(0, 2, 1)
+        cos_angle = np.clip((np.trace(relative, axis1=1, axis2=2) - 1) / 2, -1, 1)
+        angle = np.arccos(cos_angle)
+        sin_angle = np.sin(angle)
+        skew = np.stack([relative[:, 2, 1] - relative[:, 1, 2],
+                         relative[:, 0, 2] - relative[:, 2, 0],
+                         relative[:, 1, 0] - relative[:, 0, 1]], axis=1)
+
+        # Up to pi / 2 the axis comes from the skew part; near 0 the rotation vector is just half the skew part
+        scale = np.where(sin_angle > 1e-6, angle / np.maximum(2 * sin_angle, 1e-12), .5)
+        moment = skew * scale[:, None]
+
+        # Past pi / 2 the skew part shrinks toward nothing, so the axis comes from the symmetric part instead:
+        # (R + R^T) / 2 = cos I + (1 - cos) axis axis^T. Its column with the largest diagonal is the best conditioned
+        # multiple of the axis, and the skew part (2 sin axis) only decides the sign. At pi itself either sign is the
+        # same rotation, and the largest component is kept positive, as klampt does.
+        flipped = cos_angle < 0
+        if np.any(flipped):
+            rotation = relative[flipped]
+            cosine = cos_angle[flipped, None, None]
+            outer = ((rotation + rotation.transpose(0, 2, 1)) / 2 - cosine * np.eye(3)) / (1 - cosine)
+            rows = np.arange(len(rotation))
+            largest = np.argmax(np.diagonal(outer, axis1=1, axis2=2), axis=1)
+            axis = outer[rows, :, largest] / np.sqrt(np.maximum(outer[rows, largest, largest], 1e-12))[:, None]
+            sign = np.einsum("ni,ni->n", axis, skew[flipped])
+            axis[(sign < 0) & (sin_angle[flipped] > 1e-6)] *= -1
+            moment[flipped] = axis * angle[flipped, None]
+
+        self.diff_cache[:, :3] = moment
+        np.subtract(self.translations(self.previous), self.translations(), out=self.diff_cache[:, 3:])
+        self.diff_stale = False
+        return self.diff_cache
+
+class MuscleBank:
+    """
+    attachments: Typed muscle attachment arrays, as returned by load_attachments.
+    controller: A robot controller, or anything with bones (a TransformBuffer). Read on every update, as Muscle does.
+
+    Every muscle in one place. Attachment offsets, geometry parameters and pressures live in contiguous NumPy arrays,
+    so lengths, McKibben forces and both endpoint force vectors come out of one batched pass per control tick instead of
+    a Python loop over Muscle.update_muscle.
+    """
+    def __init__(self, attachments, controller):
+        self.controller = controller
+        self.count = len(attachments["name"])
+
+        self.link_a = attachments["link_a"].astype(np.intp)
+        self.link_b = attachments["link_b"].astype(np.intp)
+        # Attachment offsets from the link origin, in the link frame
+        self.delta_a = np.array(attachments["delta_a"], dtype=float)
+        self.delta_b = np.array(attachments["delta_b"], dtype=float)
+
+        self.turns = np.array(attachments["turns"], dtype=float)
+        self.weave_length = np.array(attachments["weave_length"], dtype=float)
+        self.max_pressure = np.array(attachments["max_pressure"], dtype=float)
+        self.l_0 = np.array(attachments["l_0"], dtype=float)
+        self.pressures = np.zeros(self.count)
+
+        # Constant part of the muscle formula, b^2 / (4 pi n^2), and b / sqrt(3)
+        self.stiffness = self.weave_length ** 2 / (4 * math.pi * self.turns ** 2)
+        self.weave_offset = self.weave_length / math.sqrt(3)
+
+        # Working arrays. Allocated once, overwritten on every update.
+        self.endpoints_a = np.zeros((self.count, 3))  # World position of each attachment point
+        self.endpoints_b = np.zeros((self.count, 3))
+        self.lengths = np.array(self.l_0)
+        self.displacements = np.zeros(self.count)
+        self.forces = np.zeros(self.count)  # Force magnitude per muscle
+        self.scales = np.zeros(self.count)  # Half the force over the length, for the force vectors
+        self.nonzero = np.zeros(self.count, dtype=bool)  # Muscles with a length to divide by
+
+        """
+        Force layout handed to the simulator: rows [0, count) pull link_b toward a at endpoint b, rows [count, 2 count)
+        pull link_a toward b at endpoint a. Same pairing as the triplets from Muscle.update_muscle.
+        """
+        self.force_links = np.concatenate([self.link_b, self.link_a])
+        self.force_vectors = np.zeros((2 * self.count, 3))
+        self.force_points = np.zeros((2 * self.count, 3))
+
+    def set_pressures(self, pressures):
+        """
+        pressures: Sequence of pressures, one per muscle. Missing trailing values leave those muscles unchanged.
+        """
+        n = min(len(pressures), self.count)
+        self.pressures[:n] = pressures[:n]
+
+    def update(self, force_multiplier=1):
+        """
+        force_multiplier: Scales every force vector.
+
+        Recomputes endpoints, lengths, McKibben forces and the endpoint force vectors for every muscle at once.
+        Returns link indices, force vectors and world application points, each with 2 * count rows.
+        """
+        transforms = self.controller.bones.current
+        n = self.count
+        # klampt rotations are column-major, so reshaping gives rotation[link, column, row]
+        rotations = transforms[:, :9].reshape(-1, 3, 3)
+        np.einsum("nji,nj->ni", rotations[self.link_a], self.delta_a, out=self.endpoints_a)
+        np.einsum("nji,nj->ni", rotations[self.link_b], self.delta_b, out=self.endpoints_b)
+        self.endpoints_a += transforms[self.link_a, 9:]
+        self.endpoints_b += transforms[self.link_b, 9:]
+
+        direction = self.force_vectors[:n]  # Reused as scratch, then scaled into the force on link b
+        np.subtract(self.endpoints_a, self.endpoints_b, out=direction)
+        np.sqrt(np.einsum("ni,ni->n", direction, direction), out=self.lengths)
+        np.subtract(self.lengths, self.l_0, out=self.displacements)
+
+        # Muscle formula, see Muscle.update_muscle
+        np.add(self.weave_offset, self.displacements, out=self.forces)
+        np.square(self.forces, out=self.forces)
+        self.forces -= 1
+        self.forces *= self.stiffness
+        self.forces *= self.pressures
+
+        # Unit direction times half the force (Newton's Third Law); zero-length muscles exert no force
+        np.greater(self.lengths, 0, out=self.nonzero)
+        self.scales.fill(0.)
+        np.multiply(self.forces, .5 * force_multiplier, out=self.scales, where=self.nonzero)
+        np.divide(self.scales, self.lengths, out=self.scales, where=self.nonzero)
+        direction *= self.scales[:, None]
+        np.negative(direction, out=self.force_vectors[n:])
+
+        self.force_points[:n] = self.endpoints_b
+        self.force_points[n:] = self.endpoints_a
+        return self.force_links, self.force_vectors, self.force_points
+
+    def sync_muscles(self, muscle_objects):
+        """
+        muscle_objects: The Muscle objects of the same attachments, in the same order.
+
+        Copies the batched results back onto the Muscle objects. Only the visualization needs this.
+        """
+        for x, muscle in enumerate(muscle_objects):
+            muscle.transform_a = self.endpoints_a[x].tolist()
+            muscle.transform_b = self.endpoints_b[x].tolist()
+            muscle.geometry.setSegment(muscle.transform_a, muscle.transform_b)
+            muscle.pressure = self.pressures[x]
+            muscle.length = self.lengths[x]
+            muscle.displacement = self.displacements[x]
+
+"""
+Collision
+"""
+class ContactBroadPhase:
+    """
+    world: The WorldModel.
+    robot: The RobotModel, in world.
+    bones: A TransformBuffer kept up to date with the robot, e.g. the controller's bones.
+    mask: Link pair mask from self_collision_mask.
+    padding: Padding on every geometry, as in kmc.world_contact_map.
+    tolerance: Transform changes below this do not count as motion.
+
+    Culls contact queries before they reach the narrow phase. Every link gets a bounding sphere fixed in its own frame
+    and moved with the transform buffer. Only links whose transform changed since the last update are moved, and only
+    the pairs they are in are tested again. Candidates are the masked link pairs with overlapping spheres, and links
+    whose spheres reach into a terrain or rigid object's bounding box.
+    """
+    def __init__(self, world, robot, bones, mask, padding=0.1, tolerance=1e-9):
+        self.world = world
+        self.bones = bones
+        self.padding = padding
+        self.tolerance = tolerance
+        count = robot.numLinks()
+        self.links = [robot.link(x) for x in range(count)]
+        self.geometries = [link.geometry() for link in self.links]
+        solid = np.array([not geometry.empty() for geometry in self.geometries])
+
+        # Local spheres from each link's world bounding box at the current pose, taken back into the link frame
+        self.local_centers = np.zeros((count, 3))
+        self.radii = np.zeros(count)
+        for x in np.flatnonzero(solid):
+            lower, upper = self.geometries[x].getBB()
+            corners = np.array([[a, b, c] for a in (lower[0], upper[0]) for b in (lower[1], upper[1])
+                                for c in (lower[2], upper[2])])
+            rotation, translation = self.links[x].getTransform()
+            local = (corners - translation) @ np.asarray(rotation).reshape(3, 3).T  # R^T (p - t), R column-major
+            self.local_centers[x] = (local.min(axis=0) + local.max(axis=0)) / 2
+            self.radii[x] = np.linalg.norm(local.max(axis=0) - local.min(axis=0)) / 2
+        self.reach = self.radii + 2 * padding  # Both geometries in a query are padded
+
+        self.pair_a, self.pair_b = np.nonzero(np.triu(mask & solid[:, None] & solid[None, :], 1))
+        self.pair_reach = (self.radii[self.pair_a] + self.radii[self.pair_b] + 2 * padding) ** 2
+        self.pair_overlap = np.zeros(len(self.pair_a), dtype=bool)
+        self.solid = np.flatnonzero(solid)
+
+        self.terrains = [world.terrain(x) for x in range(world.numTerrains())]
+        bounds = np.array([terrain.geometry().getBB() for terrain in self.terrains]).reshape(-1, 2, 3)
+        self.terrain_lower, self.terrain_upper = bounds[:, 0], bounds[:, 1]  # Terrains never move
+        self.terrain_overlap = np.zeros((count, len(self.terrains)), dtype=bool)
+        self.objects = [world.rigidObject(x) for x in range(world.numRigidObjects())]
+        self.object_overlap = np.zeros((count, len(self.objects)), dtype=bool)
+
+        self.centers = np.zeros((count, 3))
+        self.poses = np.full((count, 12), np.nan)  # Transforms the centers were last moved with; nan forces a first pass
+
+    def update(self):
+        """
+        Moves the spheres of links that moved and retests the pairs they are in. Returns the number of links moved.
+        """
+        current = self.bones.current
+        moved = np.zeros(len(self.links), dtype=bool)
+        moved[self.solid] = ~np.all(np.abs(current[self.solid] - self.poses[self.solid]) <= self.tolerance, axis=1)
+        rows = np.flatnonzero(moved)
+        if len(rows):
+            rotations = self.bones.rotations()[rows]
+            self.centers[rows] = np.einsum("lij,lj->li", rotations, self.local_centers[rows]) + current[rows, 9:]
+            self.poses[rows] = current[rows]
+            retest = moved[self.pair_a] | moved[self.pair_b]
+            offsets = self.centers[self.pair_a[retest]] - self.centers[self.pair_b[retest]]
+            self.pair_overlap[retest] = np.einsum("pi,pi->p", offsets, offsets) <= self.pair_reach[retest]
+            self.terrain_overlap[rows] = sphere_box_overlap(self.centers[rows], self.reach[rows],
+                                                            self.terrain_lower, self.terrain_upper)
+        if self.objects:  # Objects can move on their own, so their boxes are read every time
+            bounds = np.array([item.geometry().getBB() for item in self.objects])
+            self.object_overlap[self.solid] = sphere_box_overlap(self.centers[self.solid], self.reach[self.solid],
+                                                                 bounds[:, 0], bounds[:, 1])
+        return len(rows)
+
+    def candidates(self):
+        """
+        Yields (object_a, object_b) for every pair that passed the broad phase.
+        """
+        for x in np.flatnonzero(self.pair_overlap):
+            yield self.links[self.pair_a[x]], self.links[self.pair_b[x]]
+        for link, other in zip(*np.nonzero(self.terrain_overlap)):
+            yield self.links[link], self.terrains[other]
+        for link, other in zip(*np.nonzero(self.object_overlap)):
+            yield self.links[link], self.objects[other]
+
+    def contact_map(self, kFriction=1):
+        """
+        Returns {(object_a, object_b): [ContactPoint]} like kmc.world_contact_map, running the narrow phase only on the
+        broad phase candidates.
+        """
+        self.update()
+        contacts = {}
+        for object_a, object_b in self.candidates():
+            result = object_a.geometry().contacts(object_b.geometry(), self.padding, self.padding)
+            if not len(result.depths):
+                continue
+            points = []
+            for point_a, point_b, normal in zip(result.points1, result.points2, result.normals):
+                contact = kmc.ContactPoint(kmv.interpolate(point_a, point_b, .5), normal, kFriction)
+                contact.object1 = object_a
+                contact.object2 = object_b
+                points.append(contact)
+            contacts[(object_a, object_b)] = points
+        return contacts
+
+"""
+Timing
+"""
+class RateScheduler:
+    """
+    period: Seconds per tick, e.g. a controller's controlRate().
+    jitter_edges: Bin edges in seconds for the wake-up jitter histogram.
+
+    Runs a main coroutine function once per tick against absolute deadlines (start + tick * period), so time spent in
+    the tick does not drift the rate. Subtasks run every divisor-th tick after main. A tick that finishes past its next
+    deadline counts as an overrun; the missed deadlines are skipped rather than run back to back.
+    """
+    def __init__(self, period, jitter_edges=(0, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2e-3, 5e-3, 1e-2, float("inf")),
+                 overrun_history=1024):
+        self.period = period
+        self.tasks = []  # (name, coroutine function, divisor)
+        self.tick = 0  # Ticks run so far
+        self.skipped = 0  # Deadlines dropped after overruns
+        self.overruns = 0
+        self.overrun_log = np.zeros(overrun_history)  # Most recent overrun durations in seconds, as a ring
+        self.jitter_edges = np.array(jitter_edges)
+        self.jitter_counts = np.zeros(len(jitter_edges) - 1, dtype=np.int64)
+        self.shutdown_flag = False
+
+    def add_task(self, name, func, divisor=1):
+        """
+        name: Label for the subtask.
+        func: Coroutine function taking no arguments.
+        divisor: Runs func every divisor-th tick.
+        """
+        self.tasks.append((name, func, max(1, int(divisor))))
+
+    def divisor_for(self, rate):
+        """
+        Returns the divisor that runs a subtask as close as possible to rate (Hz), but no faster than the main tick.
+        """
+        return max(1, round(1 / (rate * self.period)))
+
+    def record_jitter(self, lateness):
+        index = np.searchsorted(self.jitter_edges, max(lateness, 0), side="right") - 1
+        self.jitter_counts[min(index, len(self.jitter_counts) - 1)] += 1
+
+    def record_overrun(self, overrun):
+        self.overrun_log[self.overruns % len(self.overrun_log)] = overrun
+        self.overruns += 1
+
+    async def run(self, main, until=None):
+        """
+        main: Coroutine function run every tick.
+        until: Optional callable; the scheduler stops once it returns True.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time()
+        while not self.shutdown_flag and not (until and until()):
+            self.record_jitter(loop.time() - deadline)
+
+            await main()
+            for name, func, divisor in self.tasks:
+                if self.tick % divisor == 0:
+                    await func()
+            self.tick += 1
+
+            deadline += self.period
+            now = loop.time()
+            if now > deadline:
+                self.record_overrun(now - deadline)
+                missed = int((now - deadline) // self.period) + 1
+                self.skipped += missed
+                deadline += missed * self.period
+            await asyncio.sleep(max(deadline - loop.time(), 0))
+
+    def stop(self):
+        self.shutdown_flag = True
+
+    def report(self):
+        """
+        Returns a summary of the timing so far.
+        """
+        recent = self.overrun_log[:min(self.overruns, len(self.overrun_log))]
+        return {"ticks": self.tick,
+                "overruns": self.overruns,
+                "skipped": self.skipped,
+                "max_recent_overrun": float(recent.max()) if recent.size else 0.0,
+                "jitter_edges": self.jitter_edges.tolist(),
+                "jitter_counts": self.jitter_counts.tolist()}
+
 """
 Network Controller
 """
@@ -207,6 +1021,180 @@ class AsyncServer:
         print("... performing mapping operation... ")
         self.dispatcher.map(pattern, func, args)
 
+    async def make_ingest_endpoint(self, ingest):
+        """
+        ingest: A PressureIngest.
+
+        Serves raw UDP straight into the ingest, skipping the pythonosc dispatcher. Use instead of make_endpoint.
+        """
+        assert type(self.ip) == str
+        self.transport, self.protocol = await asyncio.get_running_loop().create_datagram_endpoint(
+            lambda: IngestProtocol(ingest), local_addr=(self.ip, self.port))
+        print("Serving on {}".format(self.ip))
+        return
+
+
+class IngestProtocol(asyncio.DatagramProtocol):
+    """
+    Hands every datagram to a PressureIngest along with its arrival time.
+    """
+    def __init__(self, ingest):
+        self.ingest = ingest
+
+    def datagram_received(self, data, addr):
+        self.ingest.receive(data, time.monotonic())
+
+
+class PressureIngest:
+    """
+    count: Number of muscles, i.e. the length of the pressure vector.
+    stale_after: Seconds without an update after which a slot is flagged stale.
+
+    Decodes OSC packets (messages and bundles) straight into a preallocated pressure vector. Addresses map to slots in
+    the vector, so one address can carry every pressure, one limb's muscles or a single muscle. Each slot keeps the
+    arrival time and bundle timetag of its last write; bundles timetagged earlier than a slot's last write are dropped
+    as stale. Writes bump a sequence number before and after, so snapshot() never returns a half-updated vector.
+    """
+    BUNDLE = b"#bundle\0"
+    IMMEDIATE = 1  # OSC timetag meaning "now"
+
+    def __init__(self, count, stale_after=.1):
+        self.pressures = np.zeros(count)
+        self.arrival = np.zeros(count)  # time.monotonic() of each slot's last write
+        self.timetags = np.zeros(count)  # Seconds since 1900 of each slot's last bundle write, 0 if never
+        self.stale_after = stale_after
+        self.slots = {}  # OSC address as bytes -> (slot indices, trailing arguments to ignore)
+
+        self.sequence = 0  # Odd while a write is in progress
+        self.packets = 0
+        self.dropped_stale = 0
+        self.unmapped = 0
+        self.malformed = 0
+
+    def map_slots(self, address, indices, trailing=0):
+        """
+        address: OSC address, e.g. "/pressures/left_arm".
+        indices: Slots written by the address's arguments, in order.
+        trailing: Number of arguments at the end of each message to ignore.
+        """
+        self.slots[address.encode()] = (np.asarray(indices, dtype=np.intp), trailing)
+
+    def map_muscles(self, names, prefix="/pressures", trailing=0):
+        """
+        names: Muscle names in slot order.
+
+        Maps prefix to the whole vector and prefix/<name> to each muscle's slot.
+        """
+        self.map_slots(prefix, np.arange(len(names)), trailing)
+        for x, name in enumerate(names):
+            self.map_slots(prefix + "/" + str(name), [x])
+
+    def receive(self, packet, arrival=None):
+        """
+        packet: Raw OSC packet bytes.
+        arrival: Arrival time, time.monotonic() if None.
+        """
+        if arrival is None:
+            arrival = time.monotonic()
+        self.packets += 1
+        try:
+            if packet.startswith(self.BUNDLE):
+                self.receive_bundle(packet, arrival)
+            else:
+                self.receive_message(packet, 0, arrival)
+        except (ValueError, struct.error):
+            self.malformed += 1
+
+    def receive_bundle(self, bundle, arrival):
+        seconds, fraction = struct.unpack_from(">II", bundle, 8)
+        timetag = 0 if (seconds << 32 | fraction) == self.IMMEDIATE else seconds + fraction / 2 ** 32
+        offset = 16
+        while offset < len(bundle):
+            (size,) = struct.unpack_from(">i", bundle, offset)
+            element = bundle[offset + 4:offset + 4 + size]
+            if element.startswith(self.BUNDLE):
+                self.receive_bundle(element, arrival)
+            else:
+                self.receive_message(element, timetag, arrival)
+            offset += 4 + size
+
+    def receive_message(self, message, timetag, arrival):
+        end = message.index(b"\0")
+        mapping = self.slots.get(message[:end])
+        if mapping is None:
+            self.unmapped += 1
+            return
+        indices, trailing = mapping
+
+        start = (end + 4) & ~3  # Strings are null terminated and padded to 4 bytes
+        if message[start:start + 1] != b",":
+            raise ValueError("Missing OSC type tags.")
+        tags_end = message.index(b"\0", start)
+        tags = message[start + 1:tags_end]
+        offset = (tags_end + 4) & ~3
+
+        count = min(len(tags) - trailing, len(indices))
+        if count <= 0:
+            return
+        if tags.count(b"f") == len(tags):
+            values = np.frombuffer(message, dtype=">f4", count=count, offset=offset)  # Common case, no Python loop
+        else:
+            values = self.decode_arguments(message, tags, offset)[:count]
+
+        indices = indices[:count]
+        if timetag:
+            newer = timetag >= self.timetags[indices]
+            if not newer.all():
+                self.dropped_stale += int(count - newer.sum())
+                indices = indices[newer]
+                values = np.asarray(values)[newer]
+
+        self.sequence += 1
+        self.pressures[indices] = values
+        self.arrival[indices] = arrival
+        if timetag:
+            self.timetags[indices] = timetag
+        self.sequence += 1
+
+    def decode_arguments(self, message, tags, offset):
+        """
+        Slow path for messages that are not all float32: ints, doubles and booleans become floats, anything else 0.
+        """
+        values = []
+        for tag in tags:
+            if tag in b"fi":
+                values.append(struct.unpack_from(">f" if tag == ord("f") else ">i", message, offset)[0])
+                offset += 4
+            elif tag in b"dh":
+                values.append(struct.unpack_from(">d" if tag == ord("d") else ">q", message, offset)[0])
+                offset += 8
+            elif tag in b"TF":
+                values.append(1.0 if tag == ord("T") else 0.0)
+            else:
+                raise ValueError("Unsupported OSC argument type.")
+        return values
+
+    def snapshot(self, out):
+        """
+        out: Array the size of the pressure vector.
+
+        Copies a consistent pressure vector into out and returns the sequence number it was taken at.
+        """
+        while True:
+            sequence = self.sequence
+            if sequence % 2 == 0:
+                out[:] = self.pressures
+                if self.sequence == sequence:
+                    return sequence
+
+    def stale_mask(self, now=None):
+        """
+        Returns True for every slot not written within stale_after seconds.
+        """
+        if now is None:
+            now = time.monotonic()
+        return now - self.arrival > self.stale_after
+
 
 """
 Robot Controller
@@ -227,6 +1215,7 @@ class ExoController(klampt.control.OmniRobotInterface):
         self.shutdown_flag = False
         self.server = None
         self.collider = None
+        self.contact_filter = None  # ContactBroadPhase, made on the first collision_check
 
         if config_data["has_robworld"]:
             self.world = klampt.io.load('WorldModel', config_data["world_path"])  # Loads the world, this is where it's made
@@ -235,43 +1224,51 @@ class ExoController(klampt.control.OmniRobotInterface):
             self.interface = klampt.control.OmniRobotInterface.__init__(self, self.robot)
 
         self.dt = config_data["timestep"]  # Sets the core robot clock
-        # Creating a series of link transforms, I need to check if this gets updated automatically
-        self.bones = pd.Series([self.robot.link(x).getTransform() for x in range(self.robot.numLinks())])
+        # Link transforms, refreshed in place by whoever steps the robot (the simulation, for now)
+        self.bones = TransformBuffer(self.robot)
         # Loading all the muscles
         self.muscles = self.muscleLoader(config_data)
-        # Setting initial muscle pressure to zero
-        self.pressures = [0 for x in range(len(self.muscles))]
+        self.muscle_bank = MuscleBank(self.attachments, self)  # Batched muscle state, used by the control loop
+        # Setting initial muscle pressure to zero. OSC packets are decoded straight into this vector.
+        self.ingest = PressureIngest(len(self.muscles))
+        # Reaktor sends one extra value after the pressures on /pressures
+        self.ingest.map_muscles(list(self.muscles["name"]), "/pressures", trailing=1)
+        self.pressures = self.ingest.pressures
+        self.pressure_snapshot = np.zeros(len(self.muscles))  # What the control loop reads each tick
+        self.pressures_stale = np.zeros(len(self.muscles), dtype=bool)
         self.cspace = None
-        self.planner = None
-        asyncio.run(self.make_cspace_and_planner())  # Makes the planner
+        self.planner = None  # Made during startup or in start(), on the running event loop
+        self.planner_lock = threading.Lock()  # The roadmap grows on a worker thread between queries
+        self.roadmap_key = None
+        self.roadmap_file = None
+        self.roadmap_saved = 0  # Milestones in the roadmap file
+        self.roadmap_task = None
 
     def muscleLoader(self, config_df):
         """
         Given a dataframe with an ["attachments"] column containing a path
         to a .csv file detailing structured muscle parameters, generates a list of Muscle objects and
         assigns them to the robot model. This should generate all muscles.
-        """
-        with open(config_df["attachments"]) as attachments:
-            muscleinfo_df = pd.read_csv(attachments, sep=";")  # This dataframe contains info on every muscle attachment
-            rows = muscleinfo_df.shape[0]  # This is the number of rows, so the while loop should loop "row" many times
 
-            muscle_objects = []  # Placeholder list, made to be empty and populated with all muscle objects.
-
-            for x in range(rows):
-                row = muscleinfo_df.iloc[x] # Locates the muscle information in the dataframe
-                muscle = Muscle(row, self) # Calls the muscle class constructor
-                muscle_objects.append(muscle) # Adds the muscle to the list
+        The CSV goes through load_attachments, so after the first run it comes from the binary cache. The typed arrays
+        are kept in self.attachments for the MuscleBank.
+        """
+        import pandas as pd  # Only the Muscle table needs pandas; the batch runner works from the arrays alone
+        self.attachments = load_attachments(config_df["attachments"])
+        columns = {column: values for column, values in self.attachments.items() if values.ndim == 1}
+        columns["delta_a"] = list(self.attachments["delta_a"])
+        columns["delta_b"] = list(self.attachments["delta_b"])
+        muscleinfo_df = pd.DataFrame(columns)  # This dataframe contains info on every muscle attachment
 
-            muscle_series = pd.Series(data=muscle_objects, name="muscle_objects")
-            pressure_series = pd.Series(data=0, name="pressure")
-            muscleinfo_df = pd.concat([muscleinfo_df, muscle_series, pressure_series], axis=1)
+        # Calls the muscle class constructor for every row
+        muscleinfo_df["muscle_objects"] = [Muscle(row, self) for _, row in muscleinfo_df.iterrows()]
+        muscleinfo_df["pressure"] = 0.0
 
-            """
-            This dataframe should end with all the info in the muscle attachments CSV, plus corresponding muscle objects
-            in each row.
-            # """
-            # print(str(muscleinfo_df) + " muscleinfo df") # Doing test prints
-            return muscleinfo_df
+        """
+        This dataframe should end with all the info in the muscle attachments CSV, plus corresponding muscle objects
+        in each row.
+        # """
+        return muscleinfo_df
 
     """
     Kinematics and Control
@@ -291,20 +1288,42 @@ class ExoController(klampt.control.OmniRobotInterface):
         *args: Length-n list of arguments each containing a float corresponding to some pressure.
         """
         args = list(args[2:-1])  # Removing unnecessary elements, we are getting four values now
-        self.pressures = [pressure for pressure in args]
+        n = min(len(args), len(self.pressures))
+        self.ingest.sequence += 1
+        self.pressures[:n] = args[:n]
+        self.ingest.arrival[:n] = time.monotonic()
+        self.ingest.sequence += 1
         return
 
+    def read_pressures(self):
+        """
+        Returns a consistent copy of the latest pressures and refreshes pressures_stale. Called once per control tick.
+        """
+        self.ingest.snapshot(self.pressure_snapshot)
+        self.pressures_stale[:] = self.ingest.stale_mask()
+        return self.pressure_snapshot
+
     def controlRate(self):
         """
         Should be the same as the physical device, Reaktor control rate, simulation timestep
         """
         return self.dt
 
+    async def start(self):
+        """
+        Everything that needs the running event loop: the planner, the idle state and the OSC endpoint.
+        """
+        if self.config["has_planner"] and self.planner is None:  # ExOS may have built it during startup already
+            await self.make_cspace_and_planner()  # Makes the planner
+        if self.planner:
+            self.roadmap_task = asyncio.create_task(self.grow_roadmap())  # Keeps refining it while idle
+        await self.idle(self.bones)
+        await self.idle_configuration()
+
     async def idle_configuration(self):
         # Does the mapping and last minute settings stuff necessary to begin controller idle
         self.server = AsyncServer(self.config["address"], self.config["port"], "/pressures", self.set_pressures)
-        await self.server.map("/pressures", self.set_pressures)
-        await self.server.make_endpoint()
+        await self.server.make_ingest_endpoint(self.ingest)
 
     async def idle(self, bones_transforms):
         """
@@ -318,6 +1337,12 @@ class ExoController(klampt.control.OmniRobotInterface):
 
     async def shutdown(self):
         self.shutdown_flag = True
+        if self.server and self.server.transport:
+            self.server.transport.close()  # Stops the OSC endpoint
+        if self.roadmap_task:
+            self.roadmap_task.cancel()
+        if self.planner:
+            await asyncio.to_thread(self.save_planner_roadmap)  # Next boot starts from everything grown this session
 
     """
     OPTIMIZATION
@@ -325,22 +1350,95 @@ class ExoController(klampt.control.OmniRobotInterface):
 
     async def collision_check(self):
         """
-        Low level collision checker for the robot given its loaded world.
+        Low level collision checker for the robot given its loaded world. Same contact map as kmc.world_contact_map,
+        but only link pairs that can touch, and that the broad phase passes, are queried.
         """
-        result = kmc.world_contact_map(self.world, padding=0.1, kFriction=0.97)
+        if self.contact_filter is None:
+            # Samples the robot on a worker thread the first time, after that the mask comes from its sidecar
+            mask = await asyncio.to_thread(self_collision_mask, self.config["core"])
+            self.contact_filter = ContactBroadPhase(self.world, self.robot, self.bones, mask, padding=0.1)
+        result = self.contact_filter.contact_map(kFriction=0.97)
         # print(x.n for x in result)
         return result
 
     async def make_cspace_and_planner(self):
-        self.cspace = kmrp.make_space(self.world, self.robot, edgeCheckResolution=0.5)
-        self.planner = kmcs.MotionPlan(self.cspace, type="prm")
-        self.planner.setOptions()
+        self.build_planner()
+
+    def build_planner(self):
+        # klampt.plan is only imported when a config asks for the planner. Blocking, so it can run on a startup thread.
+        # The roadmap saved under the same robot, world and settings is loaded back in, so it is not rebuilt from
+        # nothing on every boot.
+        import klampt.plan.robotplanning as kmrp
+        self.roadmap_key = roadmap_key(self.config["core"], self.config["world_path"], PLANNER_SETTINGS)
+        self.roadmap_file = roadmap_path(self.config["core"], self.roadmap_key)
+        self.cspace = kmrp.make_space(self.world, self.robot,
+                                      edgeCheckResolution=PLANNER_SETTINGS["edgeCheckResolution"])
+        saved = load_roadmap(self.roadmap_file, self.roadmap_key)
+        if saved is not None:
+            # Milestones and edges as they were saved
+            self.planner = Roadmap(self.cspace, *saved, neighbors=PLANNER_SETTINGS["neighbors"])
+            self.roadmap_saved = self.planner.count
+        else:
+            self.planner = Roadmap(self.cspace, neighbors=PLANNER_SETTINGS["neighbors"])
+
+    def plan_more(self, iterations):
+        # Returns the number of milestones in the roadmap afterwards
+        with self.planner_lock:
+            return self.planner.plan_more(iterations)
+
+    def plan_path(self, start, goal, iterations=100):
+        """
+        start, goal: Robot configurations.
+
+        iterations: Grows the roadmap by this many samples, then tries once more, if the roadmap cannot connect them.
+
+        Plans between two configurations on the shared roadmap. Returns the path as a list of configurations, or None.
+        """
+        with self.planner_lock:  # The query shares the cspace, and with it the robot, with the roadmap growth
+            path = self.planner.query(start, goal)
+            if path is None and iterations:
+                self.planner.plan_more(iterations)
+                path = self.planner.query(start, goal)
+            return path
+
+    def save_planner_roadmap(self):
+        """
+        Writes the roadmap to its file if it has grown since the last save. Returns the number of milestones.
+        """
+        with self.planner_lock:
+            milestones, edges = self.planner.graph()
+        if len(milestones) != self.roadmap_saved:
+            save_roadmap(self.roadmap_file, self.roadmap_key, milestones, edges)
+            self.roadmap_saved = len(milestones)
+        return self.roadmap_saved
+
+    async def grow_roadmap(self, iterations=10, interval=.05, save_interval=60, max_milestones=20000):
+        """
+        iterations: PRM iterations per step. Small, so the planner lock is never held for long.
+        interval: Seconds between steps.
+        save_interval: Seconds between roadmap saves. It is also saved on shutdown.
+        max_milestones: Stops growing past this size.
+
+        Grows the roadmap in the background while the controller idles. Steps run on a worker thread, so the control
+        loop never waits on one.
+        """
+        last_save = time.monotonic()
+        with self.planner_lock:
+            size = self.planner.count
+        while not self.shutdown_flag:
+            if size < max_milestones:
+                size = await asyncio.to_thread(self.plan_more, iterations)
+            if time.monotonic() - last_save > save_interval:
+                await asyncio.to_thread(self.save_planner_roadmap)
+                last_save = time.monotonic()
+            await asyncio.sleep(interval)
 
     async def explore(self):
         self.robot.randomizeConfig()  # Random configuration, use the robotmodel methods to take advantage of them
 
     async def close_planner(self):
-        self.planner.close()
+        if self.planner is not None:
+            self.planner.cspace.close()
 
     """
     DIAGNOSTIC
@@ -353,7 +1451,14 @@ class ExoController(klampt.control.OmniRobotInterface):
         return len(self.bones)
 
 def main():
-    pass
+    parser = argparse.ArgumentParser(description="Precomputes the self-collision pair mask for a robot file.")
+    parser.add_argument("robot", help="Filepath of the .rob file")
+    parser.add_argument("--samples", type=int, default=2000, help="Random configurations to sample")
+    args = parser.parse_args()
+    mask = self_collision_mask(args.robot, args.samples)
+    count = len(mask)
+    print("{} of {} link pairs can touch; mask saved to {}".format(int(mask.sum()) // 2, count * (count - 1) // 2,
+                                                                 args.robot + ".pairs"))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,245 @@
+"""
+Simulation without a display. The HUD apps live in apps; nothing here imports klampt.vis, so batch runs and workers
+can use it headless.
+"""
+import numpy as np
+
+import klampt
+import klampt.model.collide
+import klampt.sim.simulation
+
+from ..control.control import TransformBuffer
+
+"""
+Simulation
+"""
+class LinkWrenchAccumulator:
+    """
+    sim: A klampt Simulator.
+    robot: The RobotModel being simulated.
+
+    Sums every muscle force on a link, and the moments those forces induce about the link's center of mass, into one
+    wrench per link. SimBody handles are looked up once here, so each step costs one applyWrench per loaded link
+    instead of a body lookup and applyForceAtPoint per force.
+    """
+    def __init__(self, sim, robot):
+        self.bodies = [sim.body(robot.link(x)) for x in range(robot.numLinks())]
+        self.forces = np.zeros((len(self.bodies), 3))
+        self.moments = np.zeros((len(self.bodies), 3))  # Moments about the world origin, shifted to the COM on apply
+
+    def accumulate(self, links, force_vectors, points):
+        """
+        links: Link index per force.
+        force_vectors: World-frame force vectors, one row per force.
+        points: World-frame application points, one row per force.
+        """
+        np.add.at(self.forces, links, force_vectors)
+        np.add.at(self.moments, links, np.cross(points, force_vectors))
+
+    def apply(self):
+        """
+        Applies the summed wrench to every link that has one, then clears the accumulator for the next step.
+        """
+        for x in np.flatnonzero(np.any(self.forces != 0, axis=1)):
+            body = self.bodies[x]
+            com = body.getTransform()[1]  # SimBody transforms are centered at the COM
+            # Moment about the COM: sum of p x f minus com x (sum of f)
+            torque = self.moments[x] - np.cross(com, self.forces[x])
+            body.applyWrench(self.forces[x].tolist(), torque.tolist())
+        self.forces.fill(0)
+        self.moments.fill(0)
+
+class Sim(klampt.sim.simulation.SimpleSimulator):
+    """
+    This is a class for Simulations. It will contain the substepping logic where forces are applied to simulated objects.
+    """
+    def __init__(self, wm, robot, timestep, collisions=True, transforms=None):  # Setting collisions to True for testing ONLY
+        """
+        transforms: A control.TransformBuffer to refresh every step, e.g. the controller's bones. Made here if None.
+        """
+        klampt.sim.simulation.SimpleSimulator.__init__(self, wm)
+        self.world = wm
+        self.dt = timestep
+
+        self.robotmodel = robot
+        if transforms is None:
+            transforms = TransformBuffer(self.robotmodel)
+        self.link_transforms = transforms  # Previous and current link poses, updated in place
+
+        if collisions:
+            self.collider = klampt.model.collide.WorldCollider(self.world)
+            self.planner = None  # The controller builds the planner when its config enables it
+        else:
+            self.collider = None
+
+        self.wrenches = LinkWrenchAccumulator(self, self.robotmodel)  # Caches a SimBody handle per link
+
+    async def pressures_to_forces(self, muscle_bank, pressures, force_multiplier):
+        """
+        muscle_bank: A control.MuscleBank holding every muscle.
+        pressures: Sequence of muscle pressures, e.g. the latest OSC values.
+        force_multiplier: Scales every force vector.
+
+        Returns link indices, force vectors and world application points for every muscle endpoint, in one batch.
+        """
+        muscle_bank.set_pressures(pressures)  # Updates muscles w/ OSC arguments
+        return muscle_bank.update(force_multiplier)
+
+    async def simLoop(self, force_list):
+        """
+        robot: A RobotModel.
+        force_list: Link indices, force vectors and world application points, as returned by pressures_to_forces.
+
+        Returns the TransformBuffer holding the new link transforms, to be used in the next time step.
+
+        """
+        """
+        Below is where we apply each force in the simulation.
+        """
+        self.wrenches.accumulate(*force_list)  # Sums forces and moments per link
+        self.wrenches.apply()  # One wrench per loaded link
+
+        self.simulate(self.dt)
+        self.updateWorld()
+        if self.collider:
+            pass
+            #klampt.model.contact.world_contact_map(self.world, padding=0.1, kFriction=1, collider=self.collider)
+            #print(self.collider.collisions())
+        """
+        Maybe here is where we have to get the updated link transforms and return them as "sensor" feedback.
+        """
+        self.link_transforms.capture()  # Start pose becomes the previous block, end pose is read in place
+        return self.link_transforms
+
+    @property
+    def link_transforms_diff(self):
+        """
+        Lie derivative from start -> end of the last step for every link, computed only when asked for.
+        """
+        return self.link_transforms.diff()
+
+    async def configure_sim(self):
+        """
+        Sets up the simulation to do whatever I want it to do.
+        """
+        self.setSetting("boundaryLayerCollisions", "1")
+        self.setSetting("rigidObjectCollisions", "1")
+        self.setSetting("robotSelfCollisions", "1")
+        self.setSetting("robotRobotCollisions", "1")
+        self.setSetting("instabilityPostCorrectionEnergy", "0.01")
+
+"""
+Contacts
+"""
+# One row per contact point: world IDs of both objects, the point and normal, and the total contact force magnitude
+# between the two objects (the simulator reports force per pair, not per point)
+CONTACT_DTYPE = np.dtype([("a", "<i4"), ("b", "<i4"), ("point", "<f8", (3,)), ("normal", "<f8", (3,)), ("force", "<f4")])
+
+
+class ContactService:
+    """
+    sim: A Sim with contact feedback enabled.
+    robot: The simulated RobotModel.
+    mask: Link pair mask from control.self_collision_mask. Without one, links are only checked against terrains and
+    rigid objects until set_mask() installs one.
+    divisor: Control ticks per update, for the scheduler.
+    capacity: Contact rows to start with; doubles whenever a step has more contacts.
+
+    Contact state at a fraction of the control rate. Only pairs that can touch are asked about, instead of every pair of
+    world IDs like sim_contact_map. Active contacts are kept in a compact structured array (CONTACT_DTYPE), and every
+    update reports only the pairs that came into or out of contact since the last one, to whoever subscribed.
+    """
+    def __init__(self, sim, robot, mask=None, divisor=1, capacity=64):
+        self.sim = sim
+        self.divisor = divisor
+        world = sim.world
+        links = [robot.link(x).getID() for x in range(robot.numLinks())]
+        others = ([world.terrain(x).getID() for x in range(world.numTerrains())] +
+                  [world.rigidObject(x).getID() for x in range(world.numRigidObjects())])
+        self.links = links
+        self.world_pairs = [(a, b) for a in links for b in others]
+        self.link_of_id = np.full(max(links + others, default=0) + 1, -1, dtype=np.intp)  # World ID -> link index
+        self.link_of_id[links] = np.arange(len(links))
+        self.mask = None
+        self.pairs = self.world_pairs
+        if mask is not None:
+            self.set_mask(mask)
+
+        self.blocks = [np.zeros(capacity, CONTACT_DTYPE), np.zeros(capacity, CONTACT_DTYPE)]  # Current and previous
+        self.index = 0
+        self.count = 0
+        self.listeners = []
+        self.updates = 0
+
+    def set_mask(self, mask):
+        """
+        Adds the link pairs of a self-collision mask to the pairs checked. Safe to call from another thread while the
+        service runs: the new pair list replaces the old one whole, and takes effect on the next update.
+        """
+        links = self.links
+        self.pairs = self.world_pairs + [(links[a], links[b]) for a, b in zip(*np.nonzero(np.triu(mask, 1)))]
+        self.mask = mask
+
+    @property
+    def active(self):
+        """
+        The contacts from the last update, as a view. Valid until the next update.
+        """
+        return self.blocks[self.index][:self.count]
+
+    def subscribe(self, callback):
+        """
+        callback: Called as callback(appeared, disappeared) after every update that changed which pairs are in contact.
+        """
+        self.listeners.append(callback)
+
+    @staticmethod
+    def pair_keys(contacts):
+        return contacts["a"].astype(np.int64) << 32 | contacts["b"].astype(np.int64)
+
+    def update(self):
+        """
+        Reads the contacts of the last simulation step. Returns (appeared, disappeared): the contact rows of pairs that
+        came into contact, and the last rows of pairs that are no longer in contact.
+        """
+        previous = self.active
+        self.index ^= 1
+        block = self.blocks[self.index]
+        count = 0
+        for a, b in self.pairs:
+            if not self.sim.inContact(a, b):
+                continue
+            points = self.sim.getContacts(a, b)  # [x, y, z, nx, ny, nz, kFriction] per point
+            force = np.linalg.norm(self.sim.contactForce(a, b))
+            if count + len(points) > len(block):
+                grown = np.zeros(max(2 * len(block), count + len(points)), CONTACT_DTYPE)
+                grown[:count] = block[:count]
+                block = self.blocks[self.index] = grown
+            for point in points:
+                block[count] = (a, b, point[:3], point[3:6], force)
+                count += 1
+        self.count = count
+        self.updates += 1
+
+        current = self.active
+        current_keys, previous_keys = self.pair_keys(current), self.pair_keys(previous)
+        appeared = current[~np.isin(current_keys, previous_keys)]
+        disappeared = previous[~np.isin(previous_keys, current_keys)]
+        if len(appeared) or len(disappeared):
+            for callback in self.listeners:
+                callback(appeared, disappeared)
+        return appeared, disappeared
+
+    def link_forces(self, out):
+        """
+        out: Array with one entry per robot link, overwritten.
+
+        Fills out with the largest contact force on each link in the active contacts, e.g. for BoneVis.
+        """
+        out.fill(0)
+        contacts = self.active
+        for side in ("a", "b"):
+            links = self.link_of_id[contacts[side]]
+            touching = links >= 0
+            np.maximum.at(out, links[touching], contacts["force"][touching])
+        return out
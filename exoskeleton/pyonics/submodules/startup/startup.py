@@ -0,0 +1,220 @@
+"""
+Startup orchestration. Each subsystem is a step that names the steps it needs; steps whose needs are met are built at
+the same time on worker threads, so the world load, speech models, language model and log key derivation overlap
+instead of queueing. Every step is timestamped, and the timeline shows what each one waited on.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+
+class StartupError(RuntimeError):
+    """
+    One or more startup steps failed. failed maps step names to their exceptions.
+    """
+    def __init__(self, failed):
+        self.failed = failed
+        RuntimeError.__init__(self, "Startup failed: " + "; ".join(name + ": " + repr(error)
+                                                                  for name, error in failed.items()))
+
+
+class StartupStep:
+    """
+    name: Unique step name.
+    build: Called with no arguments to build the subsystem. Its return value goes in the results.
+    after: Names of the steps that must finish first.
+    main_thread: Runs on the calling thread, for libraries with thread affinity (GUI toolkits, COM speech engines).
+    background: Runs on its own thread and startup does not wait for it. No other step may need it.
+    """
+    def __init__(self, name, build, after=(), main_thread=False, background=False):
+        self.name = name
+        self.build = build
+        self.after = tuple(after)
+        self.main_thread = main_thread
+        self.background = background
+        self.state = "waiting"  # waiting, running, done, failed or skipped
+        self.value = None
+        self.error = None
+        self.thread = None
+        self.ready = None  # Seconds from the start of run() until every dependency had finished
+        self.start = None
+        self.end = None
+        self.blocked_on = None  # The dependency that finished last, i.e. what this step waited for
+
+
+class StartupOrchestrator:
+    """
+    workers: Threads for steps that are not pinned to the main thread.
+    on_background: Called with each background step once it has finished, from that step's thread.
+
+    Add steps in any order, then call run(). Threads rather than processes, since every subsystem has to end up as an
+    object in this process; the heavy builders (klampt loading, vosk, TensorFlow, PBKDF2) do their work in native code
+    and release the GIL while they do.
+    """
+    def __init__(self, workers=4, on_background=None):
+        self.workers = workers
+        self.on_background = on_background
+        self.steps = {}  # Insertion ordered, which is also the order main thread steps run in when several are ready
+        self.background = []  # Threads of the background steps
+        self.origin = None
+        self.lock = threading.Lock()
+
+    def add(self, name, build, after=(), main_thread=False, background=False):
+        if name in self.steps:
+            raise ValueError("Startup step " + name + " was added twice.")
+        if main_thread and background:
+            raise ValueError("Startup step " + name + " cannot be both on the main thread and in the background.")
+        self.steps[name] = StartupStep(name, build, after, main_thread, background)
+        return self.steps[name]
+
+    def check(self):
+        """
+        Raises ValueError on unknown dependencies or dependency cycles.
+        """
+        for step in self.steps.values():
+            for dependency in step.after:
+                if dependency not in self.steps:
+                    raise ValueError("Startup step " + step.name + " needs unknown step " + dependency + ".")
+                if self.steps[dependency].background:
+                    raise ValueError("Startup step " + step.name + " needs background step " + dependency + ".")
+        visiting, finished = set(), set()
+
+        def visit(name, path):
+            if name in finished:
+                return
+            if name in visiting:
+                raise ValueError("Startup dependency cycle: " + " -> ".join(path + [name]))
+            visiting.add(name)
+            for dependency in self.steps[name].after:
+                visit(dependency, path + [name])
+            finished.add(name)
+
+        for name in self.steps:
+            visit(name, [])
+
+    def clock(self):
+        return time.perf_counter() - self.origin
+
+    def execute(self, step):
+        step.thread = threading.current_thread().name
+        step.start = self.clock()
+        try:
+            step.value = step.build()
+            step.state = "done"
+        except Exception as error:  # Reported together once every other step has had its chance
+            step.error = error
+            step.state = "failed"
+        step.end = self.clock()
+        return step
+
+    def execute_background(self, step):
+        self.execute(step)
+        if self.on_background:
+            self.on_background(step)
+
+    def wait_background(self, timeout=None):
+        """
+        Waits for the background steps to finish. Returns True if they all did within timeout seconds.
+        """
+        end = None if timeout is None else time.perf_counter() + timeout
+        for thread in self.background:
+            thread.join(None if end is None else max(0., end - time.perf_counter()))
+        return not any(thread.is_alive() for thread in self.background)
+
+    def launch(self, pending, inline, pool, futures):
+        """
+        Moves every pending step whose dependencies are settled onto the pool or the main thread queue.
+        """
+        for step in [self.steps[name] for name in pending]:
+            dependencies = [self.steps[name] for name in step.after]
+            if any(dependency.state in ("waiting", "running") for dependency in dependencies):
+                continue
+            pending.remove(step.name)
+            if any(dependency.state in ("failed", "skipped") for dependency in dependencies):
+                step.state = "skipped"
+                step.ready = step.start = step.end = self.clock()
+                continue
+            if dependencies:
+                last = max(dependencies, key=lambda dependency: dependency.end)
+                step.ready, step.blocked_on = last.end, last.name
+            else:
+                step.ready = 0.0
+            step.state = "running"
+            if step.background:
+                thread = threading.Thread(target=self.execute_background, args=(step,), name="startup-bg", daemon=True)
+                self.background.append(thread)
+                thread.start()
+            elif step.main_thread:
+                inline.append(step)
+            else:
+                futures.add(pool.submit(self.execute, step))
+
+    def run(self):
+        """
+        Builds every step, as concurrently as the dependencies allow. Returns {name: value} once every step but the
+        background ones has finished. Raises StartupError after the run if any step failed; steps that needed a failed
+        step are skipped. Background steps report their own failures through on_background and the timeline.
+        """
+        self.check()
+        self.origin = time.perf_counter()
+        pending = list(self.steps)
+        inline = []
+        futures = set()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="startup") as pool:
+            while pending or inline or futures:
+                self.launch(pending, inline, pool, futures)
+                if inline:
+                    self.execute(inline.pop(0))  # Workers keep going meanwhile
+                    continue
+                if futures:
+                    done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                elif pending:
+                    raise RuntimeError("Startup stalled on " + ", ".join(pending))  # Unreachable after check()
+        foreground = [step for step in self.steps.values() if not step.background]
+        failed = {step.name: step.error for step in foreground if step.state == "failed"}
+        if failed:
+            raise StartupError(failed) from next(iter(failed.values()))
+        return {step.name: step.value for step in foreground}
+
+    def critical_path(self):
+        """
+        Returns the chain of steps that set the total startup time, first to last.
+        """
+        finished = [step for step in self.steps.values() if step.end is not None and not step.background]
+        if not finished:
+            return []
+        step = max(finished, key=lambda step: step.end)
+        path = [step.name]
+        while step.blocked_on:
+            step = self.steps[step.blocked_on]
+            path.insert(0, step.name)
+        return path
+
+    def timeline(self, width=40):
+        """
+        Returns the startup timeline as text: one row per step with its thread, ready, start and end times in
+        milliseconds, what it waited on, and a bar on a shared time axis. Background steps still running are drawn up to
+        now.
+        """
+        steps = sorted((step for step in self.steps.values() if step.start is not None), key=lambda step: step.start)
+        ends = {step.name: step.end if step.end is not None else self.clock() for step in steps}
+        startup = max([ends[step.name] for step in steps if not step.background] + [1e-9])
+        total = max([startup] + list(ends.values()))
+        rows = ["{:<12}{:<12}{:>9}{:>9}{:>9}  {:<14}".format("step", "thread", "ready", "start", "end", "waited on")]
+        for step in steps:
+            end = ends[step.name]
+            first = int(step.start / total * width)
+            bar = " " * first + "#" * max(1, int(end / total * width) - first)
+            waited = step.blocked_on or "-"
+            if step.start - step.ready > .001:  # Also had to wait for a free thread
+                waited += " +{:.0f} ms queued".format((step.start - step.ready) * 1000)
+            if step.state != "done":
+                waited = step.state
+            if step.background:
+                waited += " (bg)"
+            rows.append("{:<12}{:<12}{:9.1f}{:9.1f}{:9.1f}  {:<14}|{:<{width}}|".format(
+                step.name, (step.thread or "-")[:11], step.ready * 1000, step.start * 1000, end * 1000, waited,
+                bar, width=width))
+        rows.append("Startup took {:.1f} ms. Critical path: {}".format(startup * 1000,
+                                                                         " -> ".join(self.critical_path())))
+        return "\n".join(rows)
@@ -0,0 +1,314 @@
+"""
+Telemetry for the control loop. Every tick becomes one fixed-size binary record in a preallocated ring; a background
+thread writes the ring out in large blocks so file I/O stays off the control path. Logs are a small JSON header
+followed by raw records, so a reader can memory-map hours of data as a NumPy structured array.
+"""
+import asyncio
+import json
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+# cryptography is imported by the encryption classes, plain logs do not need it
+
+MAGIC = b"EXOTLM01"
+HEADER_ALIGN = 64  # Records start on a 64 byte boundary
+
+ENCRYPTED_MAGIC = b"EXOENC01"
+ENCRYPTED_HEADER = struct.Struct("<8s16sII")  # Magic, salt, PBKDF2 iterations, plaintext bytes per chunk
+CHUNK_INDEX = struct.Struct("<QB")  # Chunk index and final-chunk flag, authenticated with every chunk
+NONCE_SIZE = 12
+TAG_SIZE = 16
+
+
+def record_dtype(num_muscles, num_links):
+    """
+    One record per control tick: time, tick index, muscle pressures, link transforms (R column-major, then t) and
+    muscle force magnitudes.
+    """
+    return np.dtype([("time", "<f8"),
+                     ("tick", "<u8"),
+                     ("pressures", "<f4", (num_muscles,)),
+                     ("transforms", "<f8", (num_links, 12)),
+                     ("forces", "<f4", (num_muscles,))])
+
+
+def encode_header(dtype, **metadata):
+    """
+    Returns the file header: magic, header length, then a JSON description of the record dtype padded with spaces.
+    """
+    fields = [[name, dtype.fields[name][0].base.str, list(dtype.fields[name][0].shape)] for name in dtype.names]
+    body = json.dumps({"fields": fields, "itemsize": dtype.itemsize, **metadata}).encode()
+    length = len(MAGIC) + 4 + len(body)
+    body += b" " * (-length % HEADER_ALIGN)
+    return MAGIC + struct.pack("<I", len(body)) + body
+
+
+def decode_header(head):
+    """
+    head: The first bytes of a log, at least the full header.
+
+    Returns the record dtype, the header length in bytes and the header metadata.
+    """
+    if head[:len(MAGIC)] != MAGIC:
+        raise ValueError("Not an ExOS telemetry log.")
+    (body_length,) = struct.unpack_from("<I", head, len(MAGIC))
+    start = len(MAGIC) + 4
+    metadata = json.loads(head[start:start + body_length])
+    dtype = np.dtype([(name, base, tuple(shape)) for name, base, shape in metadata.pop("fields")])
+    return dtype, start + body_length, metadata
+
+
+class TelemetryWriter:
+    """
+    sink: Binary file-like object with write() and flush(), e.g. an open .exo file.
+    num_muscles: Number of muscles per record.
+    num_links: Number of link transforms per record.
+    capacity: Records held in the ring before the control loop starts dropping them.
+    block: Records per write. The writer also flushes whatever is pending every flush_interval seconds.
+    threaded: Starts a writer thread. If False, run flush_task() on the event loop instead.
+
+    The control loop calls record() once per tick, which only copies into a preallocated slot. It never blocks: if the
+    writer has fallen a full ring behind, the record is dropped and counted.
+    """
+    def __init__(self, sink, num_muscles, num_links, capacity=8192, block=1024, flush_interval=.5, threaded=True):
+        self.sink = sink
+        self.dtype = record_dtype(num_muscles, num_links)
+        self.ring = np.zeros(capacity, dtype=self.dtype)
+        self.capacity = capacity
+        self.block = min(block, capacity)
+        self.flush_interval = flush_interval
+
+        self.head = 0  # Records produced, only ever written by the control loop
+        self.tail = 0  # Records written out, only ever written by the writer thread
+        self.dropped = 0
+
+        self.shutdown_flag = False
+        self.wakeup = threading.Event()
+        self.flush_lock = threading.Lock()  # close() may flush while a flush_task write is still in its worker thread
+        self.sink.write(encode_header(self.dtype, created=time.time()))
+        if threaded:
+            self.thread = threading.Thread(target=self.writer_loop, name="telemetry-writer", daemon=True)
+            self.thread.start()
+        else:
+            self.thread = None
+
+    def record(self, timestamp, tick, pressures, transforms, forces):
+        """
+        Copies one tick of state into the ring. Returns False if the ring was full and the record was dropped.
+        """
+        if self.head - self.tail >= self.capacity:
+            self.dropped += 1
+            return False
+        slot = self.head % self.capacity
+        ring = self.ring
+        ring["time"][slot] = timestamp
+        ring["tick"][slot] = tick
+        ring["pressures"][slot] = pressures
+        ring["transforms"][slot] = transforms
+        ring["forces"][slot] = forces
+        self.head += 1  # Publishes the slot to the writer
+        if self.head - self.tail >= self.block:
+            self.wakeup.set()
+        return True
+
+    def writer_loop(self):
+        while not self.shutdown_flag:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            self.flush()
+        self.flush()
+
+    async def flush_task(self):
+        """
+        Event loop version of the writer thread: every flush_interval, hands the pending records to a worker thread so
+        the file I/O never runs on the loop. Runs until close().
+        """
+        while not self.shutdown_flag:
+            await asyncio.sleep(self.flush_interval)
+            await asyncio.to_thread(self.flush)
+
+    def flush(self):
+        """
+        Writes every pending record, in at most two contiguous slices of the ring.
+        """
+        with self.flush_lock:
+            head = self.head
+            while self.tail < head:
+                start = self.tail % self.capacity
+                count = min(head - self.tail, self.capacity - start)
+                self.sink.write(self.ring[start:start + count].data)
+                self.tail += count
+            self.sink.flush()
+
+    def close(self):
+        self.shutdown_flag = True
+        self.wakeup.set()
+        if self.thread:
+            self.thread.join()
+        else:
+            self.flush()
+
+
+def open_telemetry(path):
+    """
+    path: Filepath of a telemetry log.
+
+    Memory-maps the log as a read-only structured array without loading it. A partly written last record is ignored.
+    """
+    with open(path, "rb") as log:
+        head = log.read(len(MAGIC) + 4)
+        (body_length,) = struct.unpack_from("<I", head, len(MAGIC))
+        dtype, header_length, _ = decode_header(head + log.read(body_length))
+        log.seek(0, 2)
+        count = (log.tell() - header_length) // dtype.itemsize
+    return np.memmap(path, dtype=dtype, mode="r", offset=header_length, shape=(count,))
+
+
+"""
+Encryption
+"""
+def derive_log_key(password, salt, iterations=100000):
+    """
+    password: Bytes.
+    salt: 16 random bytes, stored in the log header.
+
+    PBKDF2-SHA256 down to a 256 bit AES key. Slow on purpose, so do it once per session, not per write.
+    """
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+    kdf = PBKDF2HMAC(algorithm=hashes.SHA256(), length=32, salt=salt, iterations=iterations)
+    return kdf.derive(password)
+
+
+class LogEncryptor:
+    """
+    sink: Binary file-like object the encrypted log goes to.
+    key: 32 byte AES key, e.g. from derive_log_key.
+    salt: The salt the key was derived with; stored in the header so a reader can derive the key again.
+    chunk_size: Plaintext bytes per chunk.
+
+    Streaming AES-GCM. Plaintext is cut into fixed-size chunks, each sealed with its own random nonce and with its index
+    and the file header as associated data, so chunks cannot be reordered, swapped between logs or silently dropped.
+    The last chunk carries a final flag, so a truncated log is detected. Only one partial chunk is ever held in memory.
+
+    Has write(), flush() and close(), so a TelemetryWriter can use it as its sink.
+    """
+    def __init__(self, sink, key, salt, iterations=100000, chunk_size=1 << 16):
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+        self.sink = sink
+        self.cipher = AESGCM(key)
+        self.chunk_size = chunk_size
+        self.header = ENCRYPTED_HEADER.pack(ENCRYPTED_MAGIC, salt, iterations, chunk_size)
+        self.pending = bytearray()
+        self.index = 0
+        self.closed = False
+        self.sink.write(self.header)
+
+    @classmethod
+    def from_password(cls, sink, password, iterations=100000, chunk_size=1 << 16):
+        """
+        Derives the session key once, with a fresh salt.
+        """
+        salt = os.urandom(16)
+        return cls(sink, derive_log_key(password, salt, iterations), salt, iterations, chunk_size)
+
+    def seal(self, plaintext, final):
+        nonce = os.urandom(NONCE_SIZE)
+        aad = self.header + CHUNK_INDEX.pack(self.index, final)
+        self.sink.write(nonce + self.cipher.encrypt(nonce, bytes(plaintext), aad))
+        self.index += 1
+
+    def write(self, data):
+        self.pending += data
+        full = len(self.pending) // self.chunk_size * self.chunk_size
+        for start in range(0, full, self.chunk_size):
+            self.seal(memoryview(self.pending)[start:start + self.chunk_size], False)
+        del self.pending[:full]
+        return len(data)
+
+    def flush(self):
+        # A partial chunk stays pending until it fills up or the log is closed
+        self.sink.flush()
+
+    def close(self):
+        if not self.closed:
+            self.seal(self.pending, True)
+            self.pending.clear()
+            self.sink.flush()
+            self.closed = True
+
+
+class EncryptedLogReader:
+    """
+    path: Filepath of a log written through a LogEncryptor.
+    password: Bytes.
+
+    Random access to the plaintext. Each chunk is read, decrypted and verified on its own, so nothing else of the log is
+    read or held in memory. Raises ValueError if a chunk fails to verify or the log was cut short.
+    """
+    def __init__(self, path, password):
+        self.log = open(path, "rb")
+        self.header = self.log.read(ENCRYPTED_HEADER.size)
+        magic, salt, iterations, self.chunk_size = ENCRYPTED_HEADER.unpack(self.header)
+        if magic != ENCRYPTED_MAGIC:
+            raise ValueError("Not an encrypted ExOS log.")
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+        self.cipher = AESGCM(derive_log_key(password, salt, iterations))
+        self.stride = NONCE_SIZE + self.chunk_size + TAG_SIZE
+
+        self.log.seek(0, 2)
+        body = self.log.tell() - ENCRYPTED_HEADER.size
+        self.chunks = -(-body // self.stride)
+        last = body - (self.chunks - 1) * self.stride - NONCE_SIZE - TAG_SIZE
+        if self.chunks == 0 or last < 0:
+            raise ValueError("Encrypted log is truncated.")
+        self.size = (self.chunks - 1) * self.chunk_size + last  # Plaintext bytes
+        self.telemetry = None
+
+    def chunk(self, index):
+        """
+        Returns the verified plaintext of one chunk.
+        """
+        if not 0 <= index < self.chunks:
+            raise IndexError(index)
+        self.log.seek(ENCRYPTED_HEADER.size + index * self.stride)
+        sealed = self.log.read(self.stride)
+        aad = self.header + CHUNK_INDEX.pack(index, index == self.chunks - 1)
+        from cryptography.exceptions import InvalidTag
+        try:
+            return self.cipher.decrypt(sealed[:NONCE_SIZE], sealed[NONCE_SIZE:], aad)
+        except InvalidTag:
+            raise ValueError("Chunk " + str(index) + " failed to verify.") from None
+
+    def __iter__(self):
+        for index in range(self.chunks):
+            yield self.chunk(index)
+
+    def read(self, offset, size):
+        """
+        Returns size plaintext bytes starting at offset, decrypting only the chunks they fall in.
+        """
+        end = min(offset + size, self.size)
+        out = bytearray()
+        for index in range(offset // self.chunk_size, -(-end // self.chunk_size)):
+            start = index * self.chunk_size
+            out += self.chunk(index)[max(offset - start, 0):end - start]
+        return bytes(out)
+
+    def records(self, start, count):
+        """
+        Treats the plaintext as a telemetry log and returns records [start, start + count) as a structured array.
+        """
+        if self.telemetry is None:
+            head = self.read(0, len(MAGIC) + 4)
+            (body_length,) = struct.unpack_from("<I", head, len(MAGIC))
+            self.telemetry = decode_header(self.read(0, len(head) + body_length))
+        dtype, header_length, _ = self.telemetry
+        count = max(min(count, (self.size - header_length) // dtype.itemsize - start), 0)
+        return np.frombuffer(self.read(header_length + start * dtype.itemsize, count * dtype.itemsize), dtype=dtype)
+
+    def close(self):
+        self.log.close()
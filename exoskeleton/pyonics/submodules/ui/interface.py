@@ -7,27 +7,26 @@ LIBRARY IMPORTS
 import sys
 import logging
 import asyncio
+import collections
+import concurrent.futures
+import queue
 import random
-import pyaudio
-import tkinter as tk
+import threading
+import time
 import numpy as np
 from math import pi
-from OpenGL.GL import *
-from OpenGL.GLUT import *
-from PyQt5 import QtGui, QtCore
 
 # Klampt Libraries
 import klampt
 import klampt.vis as kvis
 
 # Third Party Libraries
-import transformers
-import customtkinter as ctk  # Different UI options
-import pyttsx3  # Text to speech
-import vosk  # Voice recognition library
+# transformers, pyttsx3, vosk, pyaudio, PyQt5 and customtkinter are imported by the classes that use them, so only the
+# subsystems a config enables pay for them.
 
 # My Custom Libraries
 from . import system_strings as sysvx
+from ..audio import audio
 from ..apps.apps import Map, CameraWidget, Clock, DateWidget, TextWidget
 
 """
@@ -56,40 +55,172 @@ CLASS DEFINITIONS
 """
 # Parent Class
 
+# Generation settings for the persona; any of them can be overridden per prompt
+GENERATION = {"max_length": 100, "num_beams": 5, "no_repeat_ngram_size": 2, "top_k": 50, "top_p": 0.95,
+              "temperature": 0.7}
+
+
+class GPT2LanguageModel:
+    """
+    model_name: "gpt2", or a bigger variation like "gpt2-medium", "gpt2-large" or "gpt2-xl".
+
+    TensorFlow GPT-2. Loading is the slow part, so Personality only builds this on first use.
+    """
+    def __init__(self, model_name="gpt2"):
+        from transformers import TFGPT2LMHeadModel, GPT2Tokenizer
+        self.tokenizer = GPT2Tokenizer.from_pretrained(model_name)
+        self.tokenizer.pad_token = self.tokenizer.eos_token  # GPT-2 has no padding token of its own
+        self.tokenizer.padding_side = "left"  # Generation continues from the right, so padding goes on the left
+        self.model = TFGPT2LMHeadModel.from_pretrained(model_name)
+
+    def generate(self, prompts, **settings):
+        """
+        Returns the generated text for each prompt, generated as one padded batch.
+        """
+        inputs = self.tokenizer(prompts, return_tensors="tf", padding=True)
+        output = self.model.generate(inputs["input_ids"], attention_mask=inputs["attention_mask"],
+                                     pad_token_id=self.tokenizer.eos_token_id, **settings)
+        return self.tokenizer.batch_decode(output, skip_special_tokens=True)
+
+
+class StubLanguageModel:
+    """
+    delay: Seconds each batch takes, standing in for inference time.
+
+    Answers every prompt with a canned affirmative, without transformers or a download. For tests and offline runs.
+    """
+    def __init__(self, delay=0.):
+        self.delay = delay
+        self.batches = []  # Prompts of every batch generated
+
+    def generate(self, prompts, **settings):
+        time.sleep(self.delay)
+        self.batches.append(list(prompts))
+        return [prompt + " " + sysvx.affirmatives[len(prompt) % len(sysvx.affirmatives)] for prompt in prompts]
+
+
 class Personality:
-    def __init__(self):
-        from transformers import TFGPT2LMHeadModel, TFGPT2Tokenizer
+    def __init__(self, model="gpt2", cache_size=128, batch_size=8, batch_window=.02):
+        """
+        model: GPT-2 variation to load on first use, "stub" for StubLanguageModel, or a language model object.
+        cache_size: Responses remembered, keyed on the prompt and the generation settings.
+        batch_size: Most prompts generated together.
+        batch_window: Seconds the worker waits for more prompts to batch with the first.
+
+        Nothing is loaded here, so the persona never holds up startup. Generation runs on a worker thread; submit()
+        returns a future.
+        """
         self.friendliness = 0.5
         self.formality = 0.5
         self.humor = 0.5
         self.excitement = 1
-        model_name = "gpt2"  # You can use other variations like "gpt2-medium", "gpt2-large", or "gpt2-xl"
-        self.tokenizer = TFGPT2Tokenizer.from_pretrained(model_name)
-        self.model = TFGPT2LMHeadModel.from_pretrained(model_name)
+        if model == "stub":
+            model = StubLanguageModel()
+        self.model_name = model if isinstance(model, str) else None
+        self.model = None if isinstance(model, str) else model
+        self.cache_size = cache_size
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.cache = collections.OrderedDict()  # (prompt, settings) -> response, least recently used first
+        self.in_flight = {}  # (prompt, settings) -> future, so the same prompt twice is generated once
+        self.lock = threading.Lock()
+        self.requests = queue.Queue()
+        self.thread = None  # Started by the first prompt
+        self.closed = False  # Set by close(); later prompts fail at once instead of waiting on a stopped worker
+        self.hits = 0
+        self.batches = 0
+
+    def load(self):
+        # Loads the language model if it is not loaded yet. The worker does this on first use.
+        if self.model is None:
+            self.model = GPT2LanguageModel(self.model_name)
+        return self.model
+
+    def submit(self, input_text, **settings):
+        """
+        Returns a concurrent.futures.Future for the response. Settings override GENERATION. After close(), the future
+        has already failed with RuntimeError.
+        """
+        settings = dict(GENERATION, **settings)
+        key = (input_text, tuple(sorted(settings.items())))
+        future = concurrent.futures.Future()
+        with self.lock:
+            if self.closed:
+                future.set_exception(RuntimeError("The persona is closed."))
+                return future
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                self.hits += 1
+                future.set_result(self.cache[key])
+                return future
+            if key in self.in_flight:
+                return self.in_flight[key]
+            self.in_flight[key] = future
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="persona", daemon=True)
+                self.thread.start()
+            self.requests.put(key)  # Under the lock, so it cannot land behind close()'s sentinel
+        return future
+
+    async def respond(self, input_text, **settings):
+        # Awaitable submit() for the event loop
+        return await asyncio.wrap_future(self.submit(input_text, **settings))
 
     def process_input(self, input_text):
+        # Blocks until the response is ready
+        return self.submit(input_text).result()
+
+    def run(self):
+        while True:
+            key = self.requests.get()
+            if key is None:
+                return
+            batch = [key]
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.batch_size:
+                try:
+                    key = self.requests.get(timeout=max(0., deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if key is None:
+                    self.requests.put(None)  # Finish this batch, then stop
+                    break
+                batch.append(key)
+            groups = {}  # Only prompts with the same settings can share a generate call
+            for key in batch:
+                groups.setdefault(key[1], []).append(key)
+            for settings, keys in groups.items():
+                self.generate(keys, dict(settings))
+
+    def generate(self, keys, settings):
+        try:
+            responses = self.load().generate([key[0] for key in keys], **settings)
+        except Exception as error:  # Reaches whoever waits on the futures
+            with self.lock:
+                futures = [self.in_flight.pop(key) for key in keys]
+            for future in futures:
+                future.set_exception(error)
+            return
+        with self.lock:
+            self.batches += 1
+            futures = [self.in_flight.pop(key) for key in keys]
+            for key, response in zip(keys, responses):
+                self.cache[key] = response
+                self.cache.move_to_end(key)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        for future, response in zip(futures, responses):
+            future.set_result(response)
+
+    def close(self):
+        # Stops the worker once the prompts already submitted are answered. Later prompts fail at once.
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            if self.thread is not None:
+                self.requests.put(None)
 
-        input_ids = self.tokenizer.encode(input_text, return_tensors="pt")
-        output = self.model.generate(input_ids, max_length=100, num_beams=5, no_repeat_ngram_size=2, top_k=50, top_p=0.95,
-                            temperature=0.7)
-        generated_text = self.tokenizer.decode(output[0], skip_special_tokens=True)
-        return generated_text
-
-    # Example text generation
-    def encode_input(self, input_text):
-        input_ids = self.tokenizer.encode(input_text, return_tensors="pt")
-        return input_ids
-
-    # Generate text
-    def generate_output(self, input_ids):
-        output = self.model.generate(input_ids, max_length=100, num_beams=5, no_repeat_ngram_size=2, top_k=50, top_p=0.95,
-                            temperature=0.7)
-        return output
-
-    # Decode and print the generated text
-    def decodeprint_output(self, output):
-        generated_text = self.tokenizer.decode(output[0], skip_special_tokens=True)
-        return generated_text
     def ask(self):
         return ""
 
@@ -104,67 +235,86 @@ class Personality:
 
 class VoiceAssistantUI: # For voice control
     # Should be most of the audio interaction with a UI
-    def __init__(self, voice_index: int, rate: int):
-        # TTS Engine Initialization
+    def __init__(self, voice_index: int, rate: int, voice_input="", gate=True, grammar=False, output="speaker"):
+        """
+        voice_input: WAV file to listen to instead of the microphone, for headless runs. Empty for the microphone.
+        gate: Decodes only the audio around speech instead of everything the microphone hears.
+        grammar: Recognizes only the command phrases in system_strings, which costs far less than open vocabulary.
+        output: "speaker", or "null" to speak in silence without sound hardware.
+        """
         logging.basicConfig(stream=sys.stderr, level=logging.CRITICAL)
         # Makes it the least verbose, critical messages only ^^^
 
-        self.voice_engine = pyttsx3.init()
-        self.voices = self.voice_engine.getProperty("voices")
-        self.voice_engine.setProperty('rate', rate)
-        self.voice_engine.setProperty('voice', self.voices[voice_index].id)
+        # TTS Engine Initialization. The engine lives on the speech queue's thread, which pre-renders the fixed
+        # phrases first so they play back at once.
+        self.rate = rate
+        backend = audio.NullBackend() if output == "null" else audio.Pyttsx3Backend(voice_index, rate)
+        self.speech = audio.SpeechQueue(backend, [sysvx.error_string1, sysvx.shutdown_string1] + sysvx.affirmatives +
+                                        sysvx.negatives + sysvx.confused).start()
 
-        self.recog_model = None
-        self.voice_recog = None
         self.user_cam = None
-
-        self.mic = None
-        self.stream = None
-        # Voice Recognition Initialization
-        self.recog_model = vosk.Model(model_name="vosk-model-small-en-us-0.15")
-        self.voice_recog = vosk.KaldiRecognizer(self.recog_model, 16000)
-
-        self.mic = pyaudio.PyAudio()
-
-        self.stream = self.mic.open(format=pyaudio.paInt16, channels=1, rate=16000, input=True, frames_per_buffer=81)
-        self.stream.start_stream()
-        # Tests/ Strings
-        self.voice_engine.runAndWait()
-
-    def shutdown_assistant(self):
-        # Shuts down and releases resources
-        self.voice_engine.stop()
-
-    def announce(self, stringvar):
+        self.voice_input = voice_input
+        self.gate = gate
+        self.listener = None  # Recognition runs on its own thread once listen() is called
+        # Voice Recognition Initialization. Loading the model is the slow part, so it happens at startup.
+        self.voice_recog = audio.vosk_recognizer(audio.RATE, grammar=list(sysvx.commands) if grammar else None)
+
+    def shutdown_assistant(self, timeout=5.):
+        # Shuts down and releases resources, giving queued announcements up to timeout seconds to finish
+        self.stop_listening()
+        self.speech.stop(timeout)
+
+    def announce(self, stringvar, priority=audio.CHATTER):
+        # Queues the announcement and returns at once. SAFETY announcements cut off anything less urgent.
         print(stringvar)
-        self.voice_engine.say(stringvar)
-        self.voice_engine.runAndWait()
+        self.speech.say(stringvar, priority)
         return stringvar
 
-    def voice_loop(self):
-        data = self.stream.read(1024)
-        if self.voice_recog.AcceptWaveform(data):
-            text = self.voice_recog.Result()
-            print(f"{text[14:-3]}")
-            return(text)
-
-    def voice_test(self):
-        # Plays all the strings and voices in the catalog to test for audio quality.
+    def listen(self, loop, post):
+        """
+        Starts recognizing speech from the microphone, or the voice_input file. post(phrase) is called on loop for each
+        phrase heard.
+        """
+        if self.voice_input:
+            source = audio.WavFileSource(self.voice_input)
+            if source.rate != audio.RATE:
+                raise ValueError(self.voice_input + " is " + str(source.rate) + " Hz, the recognizer takes " +
+                                 str(audio.RATE))
+        else:
+            source = audio.MicrophoneSource(audio.RATE)
+        gate = audio.EnergyGate(audio.RATE) if self.gate else None
+        self.listener = audio.SpeechRecognizer(self.voice_recog, source, loop, post, gate=gate).start()
+        return self.listener
+
+    def stop_listening(self):
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+    def voice_test(self, voices=4):
+        # Says a random string from the catalog in each of the first few voices to test for audio quality. Blocks.
         test_strings = sysvx.confused + sysvx.affirmatives + sysvx.negatives
-        i = 0
-        for voice in self.voices:
-            print(voice, voice.id)
-            self.voice_engine.setProperty('voice', voice.id)
-            self.voice_engine.say(test_strings[random.randint(0, len(test_strings))]) # What they say goes here
-            self.voice_engine.runAndWait()
-            self.voice_engine.stop()
-            i = (i + 1) % len(self.voices)
+        for voice_index in range(voices):
+            print("Voice", voice_index)
+            speech = audio.SpeechQueue(audio.Pyttsx3Backend(voice_index, self.rate)).start()
+            speech.say(random.choice(test_strings))  # What they say goes here
+            speech.stop(timeout=30)
 
 class AugmentOverlayKlUI(kvis.glcommon.GLProgram):
     # For a Heads-Up Display or Helmet Mounted Display. This version uses Klampt vis plugins from the ground up.
     # Also includes voice assistant by default.
-    def __init__(self):
+    def __init__(self, rate=30, frame_budget=.002):
+        """
+        rate: HUD frames per second.
+        frame_budget: Seconds of redrawing allowed per frame. Widgets that do not fit wait for the next frame.
+
+        Sets up the display. The HUD then runs as a task on the caller's event loop, see run().
+        """
         self.shutdown_flag = False
+        self.rate = rate
+        self.frame_budget = frame_budget
+        self.frames = 0
+        self.redraws = 0
         # Add text to the visualization
 
         # Creates the HUD display world
@@ -175,34 +325,27 @@ class AugmentOverlayKlUI(kvis.glcommon.GLProgram):
         self.g = .2
         self.b = 1
         self.input = None
-        # Sets up widgets on the display
+        # Sets up widgets on the display. Each declares how often it changes; only changed ones are redrawn.
 
-        self.date = DateWidget()
-        self.clock = Clock()
+        self.date = DateWidget(position=(0, 0), size=50)
+        self.clock = Clock(position=(0, -100), size=50)
         self.map = Map()
-        self.missions = TextWidget()
-        self.missions.update("No Missions")
+        # Length 2 is relative to xy, length 3 is in world coordinates
+        self.missions = TextWidget("No Missions", name="missions", position=(-300, 0), size=50)
         #self.camera = CameraWidget(0)
         # Convert the image data to a NumPy array
         self.image_array = None
 
-        self.subtitles = TextWidget()
-        self.subtitles.update("this is where the subtitles of whoever you are listening to will go")
+        self.subtitles = TextWidget("this is where the subtitles of whoever you are listening to will go",
+                                    name="subtitles", position=(400, 500), size=40)
+        self.widgets = [self.clock, self.date, self.missions, self.subtitles, self.map]
 
         # Create the visualization
         kvis.add("world", self.holodeck)
-
-
-        kvis.addText("time", self.clock.time, position=(0,-100), size=50)
-        kvis.addText("date", self.date.date, position=(0,0), size=50)
-
-        # Length 2 is relative to xy, length 3 is in world coordinates
-        kvis.addText("missions", self.missions.text, position=(-300,0), size=50)
-        kvis.addText("subtitles", self.subtitles.text, position=(400, 500), size=40)
-        kvis.setColor("time", self.r, self.g, self.b)
-        kvis.setColor("date", self.r, self.g, self.b)
-        kvis.setColor("missions", self.r, self.g, self.b)
-        kvis.setColor("subtitles", self.r, self.g, self.b)
+        for widget in self.widgets:
+            kvis.addText(widget.name, widget.text, position=widget.position, size=widget.size)
+            kvis.setColor(widget.name, *widget.color)
+            widget.dirty = False
         self.artificial_horizon = kvis.GeometricPrimitive()
         self.artificial_horizon.setSphere((0,0,0), 3)
         kvis.add("horizon", self.artificial_horizon)
@@ -223,9 +366,8 @@ class AugmentOverlayKlUI(kvis.glcommon.GLProgram):
 
 
         #asyncio.run(self.camera.cam_launch(0))
+        from PyQt5 import QtGui
         self.window = QtGui.QGuiApplication(sys.argv)
-        while not self.shutdown_flag:
-            asyncio.run(self.idle())
 
     async def plugin_handler(self):
         # Pushes kvis plugins
@@ -238,39 +380,55 @@ class AugmentOverlayKlUI(kvis.glcommon.GLProgram):
         pass
         return
 
+    async def run(self):
+        """
+        Draws HUD frames at self.rate until shutdown. Run it as a task on the main event loop.
+        """
+        loop = asyncio.get_running_loop()
+        period = 1 / self.rate
+        deadline = loop.time()
+        while not self.shutdown_flag:
+            await self.idle()
+            deadline += period
+            if deadline < loop.time():
+                deadline = loop.time()  # Fell behind, do not try to catch up
+            await asyncio.sleep(deadline - loop.time())
+
     async def idle(self):
         """
-        Idle function for the desktopGUI that sends commands to the controller, gets forces from it, and sends to the sim.
+        One HUD frame: refreshes the widgets that are due, then redraws the changed ones, longest waiting first, until
+        the frame budget is spent. Returns the number of widgets redrawn.
         """
         #await self.camera.cam_loop()
+        now = time.time()
+        for widget in self.widgets:
+            if widget.due(now):
+                widget.refresh(now)
+        dirty = sorted((widget for widget in self.widgets if widget.dirty), key=lambda widget: widget.dirty_since)
+        self.frames += 1
+        if not dirty:
+            return 0  # Nothing changed, nothing to draw
+
+        budget_end = time.perf_counter() + self.frame_budget
+        drawn = 0
         kvis.lock()  # Locks the klampt visualization
-        kvis.clearText()
-        self.clock.update()
-        self.date.update()
-        #await self.camera.cam_loop()  # Calls the camera
-        self.missions.update("mission text")
-
-
-        kvis.addText("time", self.clock.time, position=(0,-100), size=50)
-        kvis.addText("date", self.date.date, position=(0,0), size=50)
-        # Length 2 is relative to xy, length 3 is in world coordinates
-        kvis.addText("missions", self.missions.text, position=(-300,0), size=50)
-        kvis.addText("subtitles", self.subtitles.text, position=(400, 500), size=40)
-
-        #print("Size policy is: " + str(self.sizePolicy))
-
-        kvis.setColor("time", 1,1,1,1)
-        kvis.setColor("date", 1,1,1,1)
-        kvis.setColor("missions", 1,1,1,1)
-        kvis.setColor("subtitles", 1,1,1,1)
-        kvis.unlock()  # Unlocks the klampt visualization
+        try:
+            for widget in dirty:
+                kvis.addText(widget.name, widget.text, position=widget.position, size=widget.size)
+                kvis.setColor(widget.name, *widget.color)
+                widget.dirty = False
+                drawn += 1
+                if time.perf_counter() > budget_end:
+                    break  # The rest stay dirty and go first next frame
+        finally:
+            kvis.unlock()  # Unlocks the klampt visualization
 
         #frame = self.camera.frame
 
         #kvis.add("camera_screen", frame)
         kvis.update()
-        self.display()
-        return True
+        self.redraws += drawn
+        return drawn
 
 
     async def options_menu(self):
@@ -298,13 +456,17 @@ class AugmentOverlayKlUI(kvis.glcommon.GLProgram):
         """
         Shutdown
         """
+    def stop(self):
+        # Ends run() after the current frame. Safe to call from synchronous code; the window stays up until shutdown().
+        self.shutdown_flag = True
+
     async def async_shutdown(self):
-        self.hud.close_all()
+        self.stop()
         kvis.kill()
         return ("Shutting down.")
 
     def shutdown(self):
-        self.hud.close_all()
+        self.stop()
         kvis.kill()
         return ("Shutting down heads-up display.")
 
@@ -313,6 +475,7 @@ class AugmentOverlayTkUI:
     def __init__(self, controller, assistant, has_missions=True, has_map=True,
                  has_camera=True, has_clock=True, has_date=True, has_compass=False):
         # boolean values are rapidly becoming more of them
+        import customtkinter as ctk  # Different UI options
         self.root_HUD = ctk.CTk()  # root_HUD is the tkinter root window
 
         if not assistant:
@@ -15,6 +15,8 @@ login_failed_string1 = "Login failed. User not found."
 login_failed_string2 = "Login failed."
 system_crit_string1 = "System condition critical. Initiating safe mode."
 system_crit_string2 = "System condition critical. Initializing emergency procedures."
+error_string1 = "Error:"
+shutdown_string1 = "Shutting down systems."
 
 """
 Dictionaries
@@ -30,4 +32,12 @@ confused = ["I'm not sure I understand, sir.", "Sir, I'm confused.", "Sir, I'm a
             "...sir?", "I'm afraid I don't know what you mean, sir.", "I'm sorry, sir, but I'm afraid I don't understand",
             "My apologies?", "I'm afraid I don't think I understand."]
 
+"""
+Voice commands
+"""
+# Phrases ExOS acts on, spelled the way the recognizer writes them (lowercase words, no punctuation), and the command
+# each one triggers. In grammar mode these are the only phrases the recognizer listens for.
+commands = {"shut down": "shutdown", "shut down systems": "shutdown", "power off": "shutdown",
+            "status": "status", "status report": "status", "system status": "status"}
+
 # Text strings
\ No newline at end of file
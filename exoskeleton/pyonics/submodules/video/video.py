@@ -1,6 +1,9 @@
 # Here should go video processing custom made for the exoskeleton. Most vis methods should end up in here.
+import threading
+import time
+
 import klampt
-import pandas as pd
+import numpy as np
 import klampt.vis as kvis
 import klampt.vis.colorize
 
@@ -23,7 +26,7 @@ def color_calc(current_pressure, max_pressure):
     else:
         return 1
 
-def display_muscle_row(row=pd.Series):
+def display_muscle_row(row):
     """
     row: Pandas DataFrame row (as a Pandas Series) containing muscle information.
     """
@@ -55,10 +58,228 @@ async def display_bones(robby, mask=None):
     for x in range(robby.numLinks()):
         kvis.colorize.colorize(robby.link(x), value="n", feature="faces", colormap="magma")
     return 1
-def display_muscles(df=pd.DataFrame):
+def display_muscles(df):
     """
     df: Pandas Dataframe containing muscle information.
     """
     # Should take the muscles dataframe and display them
 
-    df.apply(display_muscle_row, axis=1)
\ No newline at end of file
+    df.apply(display_muscle_row, axis=1)
+
+"""
+Retained-mode visualization
+"""
+def pressure_lut(size=256):
+    """
+    Returns a (size, 4) RGBA table from no pressure (dark green) to full pressure (bright green). Index it with
+    lut_index.
+    """
+    fraction = np.linspace(0, 1, size)
+    lut = np.zeros((size, 4))
+    lut[:, 1] = 0.2 + 0.8 * fraction
+    lut[:, 3] = 1
+    return lut
+
+
+def lut_index(values, maximum, size):
+    """
+    Maps values in [0, maximum] (clipped) to LUT rows, vectorized.
+    """
+    fraction = np.clip(np.divide(values, maximum, out=np.zeros(np.shape(values)), where=np.asarray(maximum) > 0), 0, 1)
+    return (fraction * (size - 1) + .5).astype(np.intp)
+
+
+class MuscleVis:
+    """
+    names: Muscle names, used as vis item names.
+    max_pressure: Pressure at the top of the color scale, per muscle.
+    lut: RGBA lookup table, pressure_lut by default.
+    tolerance: Endpoint moves below this (meters) are not redrawn.
+
+    Each muscle is added to the visualization once, as its own segment. update() then compares the new state against
+    what was last drawn and only touches muscles whose endpoints moved or whose color step changed, so a frame where
+    nothing moved costs a few array comparisons, whatever the muscle count.
+    """
+    def __init__(self, names, max_pressure, lut=None, tolerance=1e-4):
+        self.names = list(names)
+        self.max_pressure = np.asarray(max_pressure, dtype=float)
+        self.lut = pressure_lut() if lut is None else lut
+        self.tolerance = tolerance
+        count = len(self.names)
+        self.segments = [klampt.GeometricPrimitive() for _ in range(count)]
+        self.drawn_a = np.full((count, 3), np.nan)  # Endpoints last pushed to the vis; nan forces the first push
+        self.drawn_b = np.full((count, 3), np.nan)
+        self.drawn_color = np.full(count, -1, dtype=np.intp)
+        for name, segment in zip(self.names, self.segments):
+            segment.setSegment([0, 0, 0], [0, 0, 0])
+            kvis.add(name, segment)
+            kvis.hideLabel(name)
+
+    def update(self, endpoints_a, endpoints_b, pressures):
+        """
+        endpoints_a, endpoints_b: (muscles, 3) world attachment points, e.g. from a MuscleBank.
+        pressures: Muscle pressures.
+
+        Returns the number of muscles that were redrawn.
+        """
+        moved = ~(np.all(np.abs(endpoints_a - self.drawn_a) <= self.tolerance, axis=1) &
+                  np.all(np.abs(endpoints_b - self.drawn_b) <= self.tolerance, axis=1))
+        colors = lut_index(pressures, self.max_pressure, len(self.lut))
+        recolored = colors != self.drawn_color
+        for x in np.flatnonzero(moved):
+            self.segments[x].setSegment(endpoints_a[x].tolist(), endpoints_b[x].tolist())
+            kvis.dirty(self.names[x])
+        for x in np.flatnonzero(recolored):
+            kvis.setColor(self.names[x], *self.lut[colors[x]])
+        self.drawn_a[moved] = endpoints_a[moved]
+        self.drawn_b[moved] = endpoints_b[moved]
+        self.drawn_color[recolored] = colors[recolored]
+        return int(np.count_nonzero(moved | recolored))
+
+
+class BoneVis:
+    """
+    robot: The RobotModel on display.
+    maximum: Value at full tint, e.g. a contact force in newtons.
+    steps: Tint levels. Values are quantized to these, so small changes do not cause redraws.
+    tint: RGBA color links are tinted towards.
+
+    Links are colorized once here. After that, update() tints only the links whose level changed, e.g. to show contact
+    forces, instead of colorizing every link again.
+    """
+    def __init__(self, robot, maximum=100., steps=32, tint=(1, 0, 0, 1)):
+        self.links = [robot.link(x) for x in range(robot.numLinks())]
+        self.maximum = maximum
+        self.steps = steps
+        self.tint = list(tint)
+        self.drawn = np.zeros(len(self.links), dtype=np.intp)
+        for link in self.links:
+            kvis.colorize.colorize(link, value="n", feature="faces", colormap="magma")
+
+    def update(self, values):
+        """
+        values: One value per link, 0 for no tint.
+
+        Returns the number of links that were retinted.
+        """
+        levels = lut_index(values, self.maximum, self.steps)
+        changed = np.flatnonzero(levels != self.drawn)
+        for x in changed:
+            self.links[x].appearance().setTintColor(self.tint, levels[x] / (self.steps - 1))
+        self.drawn[changed] = levels[changed]
+        return len(changed)
+
+
+"""
+Render thread
+"""
+def snapshot_dtype(num_muscles, num_links):
+    """
+    Everything a frame is drawn from: the robot configuration, link transforms (R column-major, then t), muscle
+    endpoints and pressures, and the largest contact force on each link.
+    """
+    return np.dtype([("time", "<f8"),
+                     ("tick", "<u8"),
+                     ("config", "<f8", (num_links,)),
+                     ("transforms", "<f8", (num_links, 12)),
+                     ("endpoints_a", "<f8", (num_muscles, 3)),
+                     ("endpoints_b", "<f8", (num_muscles, 3)),
+                     ("pressures", "<f8", (num_muscles,)),
+                     ("link_forces", "<f8", (num_links,))])
+
+
+class SnapshotBuffer:
+    """
+    num_muscles, num_links: Sizes of the state arrays.
+
+    Hands state from the control loop to the render thread without either waiting on the other. There are two slots:
+    the front one, last published, and the back one, being written. The reader pins the front slot while it draws.
+    publish() fills the back slot and swaps; if the reader still has the back slot pinned from before the last swap,
+    publish() skips that snapshot rather than wait. A newer one comes next tick anyway. A pinned slot is never written,
+    so a frame never mixes two ticks.
+    """
+    def __init__(self, num_muscles, num_links):
+        dtype = snapshot_dtype(num_muscles, num_links)
+        self.slots = [np.zeros((), dtype=dtype), np.zeros((), dtype=dtype)]
+        self.front = 0
+        self.pinned = None
+        self.sequence = 0  # Snapshots published so far
+        self.skipped = 0  # Snapshots dropped because the reader held the back slot
+        self.lock = threading.Lock()  # Only guards the slot indices, never held while copying or drawing
+
+    def publish(self, tick, config, transforms, endpoints_a, endpoints_b, pressures, link_forces):
+        """
+        Copies the state into the back slot and makes it the front. Returns False if it had to skip.
+        """
+        back = self.front ^ 1
+        with self.lock:
+            if self.pinned == back:
+                self.skipped += 1
+                return False
+        slot = self.slots[back]
+        slot["time"] = time.time()
+        slot["tick"] = tick
+        slot["config"] = config
+        slot["transforms"] = transforms
+        slot["endpoints_a"] = endpoints_a
+        slot["endpoints_b"] = endpoints_b
+        slot["pressures"] = pressures
+        slot["link_forces"] = link_forces
+        with self.lock:
+            self.front = back
+            self.sequence += 1
+        return True
+
+    def pin(self):
+        """
+        Returns (sequence, snapshot) for the front slot and keeps it from being written until release().
+        """
+        with self.lock:
+            self.pinned = self.front
+            return self.sequence, self.slots[self.front]
+
+    def release(self):
+        with self.lock:
+            self.pinned = None
+
+
+class RenderThread(threading.Thread):
+    """
+    snapshots: The SnapshotBuffer to draw from.
+    draw: Called with each new snapshot, while the vis is locked.
+    rate: Frames per second, 30 to 60 is plenty.
+
+    Draws from the latest published snapshot at its own rate, so the control loop never holds or waits on the vis lock.
+    Frames with no new snapshot are skipped.
+    """
+    def __init__(self, snapshots, draw, rate=60):
+        threading.Thread.__init__(self, name="render", daemon=True)
+        self.snapshots = snapshots
+        self.draw = draw
+        self.period = 1 / rate
+        self.stop_event = threading.Event()
+        self.drawn = 0  # Sequence number of the last snapshot drawn
+        self.frames = 0
+
+    def run(self):
+        while not self.stop_event.wait(self.period):
+            if not kvis.shown():
+                continue
+            sequence, snapshot = self.snapshots.pin()
+            try:
+                if sequence == self.drawn:
+                    continue
+                kvis.lock()
+                try:
+                    self.draw(snapshot)
+                finally:
+                    kvis.unlock()
+            finally:
+                self.snapshots.release()
+            self.drawn = sequence
+            self.frames += 1
+            kvis.update()
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
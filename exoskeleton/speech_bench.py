@@ -0,0 +1,110 @@
+"""
+Speech recognition CPU benchmark
+================================
+Reports what the always-on recognizer costs in CPU per hour of ambient audio, with and without the energy gate and
+the command grammar. Audio is fed from a WAV file as fast as the recognizer takes it, through the same ring and worker
+thread as the microphone, and the worker thread's CPU time is measured.
+
+With no WAV given, a synthetic ambient recording is generated: background noise and pump hum with short bursts of
+speech-like sound. Without vosk installed only the front end (ring, worker and gate) is measured.
+
+Usage: python speech_bench.py --wav ambient.wav
+       python speech_bench.py --minutes 10 --speech .05
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import wave
+
+import numpy as np
+
+from pyonics.submodules.audio import audio
+from pyonics.submodules.ui import system_strings as sysvx
+
+
+class NullRecognizer:
+    """
+    Hears nothing, costs nothing. Stands in for vosk to measure the front end alone.
+    """
+    def AcceptWaveform(self, data):
+        return False
+
+    def Result(self):
+        return json.dumps({"text": ""})
+
+    def FinalResult(self):
+        return json.dumps({"text": ""})
+
+
+def synthetic_ambient(path, minutes=10., speech=.05, rate=audio.RATE, seed=0):
+    """
+    Writes minutes of 16 bit mono audio: quiet noise and 60 Hz hum throughout, and speech-like bursts (a 150 Hz voice
+    with harmonics, syllables at 4 Hz) for about the speech fraction of the time.
+    """
+    generator = np.random.default_rng(seed)
+    samples = int(minutes * 60 * rate)
+    times = np.arange(samples) / rate
+    signal = generator.normal(0, 30, samples) + 40 * np.sin(2 * np.pi * 60 * times)
+    position = 0
+    while position < samples:
+        position += int(generator.uniform(1.5, 3) / speech * rate)  # Gap, then a burst of 1.5 to 3 s
+        length = min(int(generator.uniform(1.5, 3) * rate), samples - position)
+        if length <= 0:
+            break
+        burst = times[:length]
+        voice = sum(np.sin(2 * np.pi * 150 * harmonic * burst) / harmonic for harmonic in range(1, 6))
+        signal[position:position + length] += 3000 * voice * (.5 + .5 * np.sin(2 * np.pi * 4 * burst)) ** 2
+        position += length
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(np.clip(signal, -32768, 32767).astype(np.int16).tobytes())
+    return path
+
+
+async def measure(path, recognizer, gated):
+    phrases = []
+    source = audio.WavFileSource(path, realtime=False)
+    gate = audio.EnergyGate(source.rate) if gated else None
+    listener = audio.SpeechRecognizer(recognizer, source, asyncio.get_running_loop(), phrases.append,
+                                      gate=gate).start()
+    while listener.thread.is_alive():
+        await asyncio.sleep(.05)
+    seconds = listener.heard / source.rate
+    return {"cpu per hour": listener.cpu / seconds * 3600, "decoded": listener.samples / max(1, listener.heard),
+            "phrases": len(phrases), "seconds": seconds}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures recognizer CPU per hour of ambient audio.")
+    parser.add_argument("--wav", default=None, help="16 bit mono 16 kHz recording of the usual surroundings")
+    parser.add_argument("--minutes", type=float, default=10, help="Length of the synthetic recording")
+    parser.add_argument("--speech", type=float, default=.05, help="Fraction of the synthetic recording with speech")
+    args = parser.parse_args()
+
+    path = args.wav or synthetic_ambient(os.path.join(tempfile.mkdtemp(), "ambient.wav"), args.minutes, args.speech)
+    try:
+        import vosk  # Only to check it is there; the recognizers load their own models
+        configurations = [("open vocabulary", None, False), ("open vocabulary, gated", None, True),
+                          ("grammar", list(sysvx.commands), False), ("grammar, gated", list(sysvx.commands), True)]
+    except ImportError:
+        print("vosk is not installed, measuring the front end only.")
+        configurations = [("front end", None, False), ("front end, gated", None, True)]
+
+    print("{:<26}{:>16}{:>10}{:>10}".format("recognizer", "CPU s / hour", "decoded", "phrases"))
+    for name, grammar, gated in configurations:
+        if name.startswith("front end"):
+            recognizer = NullRecognizer()
+        else:
+            recognizer = audio.vosk_recognizer(audio.RATE, grammar=grammar)
+        result = asyncio.run(measure(path, recognizer, gated))
+        print("{:<26}{:16.1f}{:9.1f}%{:10d}".format(name, result["cpu per hour"], result["decoded"] * 100,
+                                                    result["phrases"]))
+    print("Over {:.1f} minutes of audio.".format(result["seconds"] / 60))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""
+Startup benchmark
+=================
+Reports what each ExOS subsystem costs at startup: the time its imports add, then the time to build it. Every repeat
+runs in a fresh interpreter so nothing is already cached in sys.modules, and the median is reported.
+
+Stages run in order, each timed on top of the ones before it. The headless stages import exactly what batchsim.py
+imports, and the run checks that no GUI or pandas module came in with them. Stages a config leaves off are skipped,
+and stages whose libraries are not installed show as missing. Stage failures are reported and the rest still run.
+
+Usage: python startup_bench.py --config config/desktopsim_testconfig2.txt --repeat 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# (stage, modules) in import order. The headless group is what batchsim.py imports, and all it imports.
+HEADLESS_IMPORTS = [("numpy", ["numpy"]),
+                    ("klampt", ["klampt", "klampt.io", "klampt.sim.batch"]),
+                    ("config", ["config.schema"]),
+                    ("control", ["pyonics.submodules.control.control"]),
+                    ("sim", ["pyonics.submodules.sim.sim"]),
+                    ("batchsim", ["batchsim"])]
+
+# Modules a headless import must not load
+GUI_MODULES = ("klampt.vis", "OpenGL", "PyQt5", "pandas", "cv2")
+
+# What ExOS adds on top for a desktop run: exos itself, then the display side when the config has it
+DESKTOP_IMPORTS = [("telemetry", ["pyonics.submodules.telemetry.telemetry"]),
+                   ("exos", ["exos"])]
+
+# (stage, config flag, modules) for the optional subsystems. None means always measured.
+OPTIONAL_IMPORTS = [("pandas", "has_robworld", ["pandas"]),  # The controller's muscle table
+                    ("vis", "has_vis", ["klampt.vis", "pyonics.submodules.video.video"]),
+                    ("planner", "has_planner", ["klampt.plan.robotplanning", "klampt.plan.cspace"]),
+                    ("encryption", None, ["cryptography.hazmat.primitives.ciphers.aead",
+                                          "cryptography.hazmat.primitives.kdf.pbkdf2"]),
+                    ("voice", "has_voice", ["pyttsx3", "vosk", "pyaudio"]),
+                    ("persona", "has_persona", ["transformers"]),
+                    ("hud", "has_hud", ["PyQt5.QtGui", "pyonics.submodules.apps.apps",
+                                        "pyonics.submodules.ui.interface"]),
+                    ("camera", "has_hud", ["cv2"])]
+
+
+def timed(stage, func, results):
+    """
+    Runs func, recording its wall time in milliseconds or why it could not run.
+    """
+    start = time.perf_counter()
+    try:
+        value = func()
+    except ImportError as error:
+        results.append({"stage": stage, "ms": None, "status": "missing " + str(error.name or error)})
+        return None
+    except Exception as error:  # A broken subsystem should not hide the cost of the others
+        results.append({"stage": stage, "ms": None, "status": type(error).__name__ + ": " + str(error)})
+        return None
+    results.append({"stage": stage, "ms": (time.perf_counter() - start) * 1000, "status": "ok"})
+    return value
+
+
+def import_all(modules):
+    import importlib
+    for module in modules:
+        importlib.import_module(module)
+
+
+def measure(config_path):
+    """
+    Runs in the child interpreter. Returns one result per stage.
+    """
+    import asyncio
+    results = []
+    for stage, modules in HEADLESS_IMPORTS:
+        timed("import " + stage, lambda: import_all(modules), results)
+    leaked = [gui for gui in GUI_MODULES if any(name == gui or name.startswith(gui + ".") for name in sys.modules)]
+    results.append({"stage": "headless check", "ms": None,
+                    "status": "ok" if not leaked else "loads " + ", ".join(leaked)})
+    for stage, modules in DESKTOP_IMPORTS:
+        timed("import " + stage, lambda: import_all(modules), results)
+
+    config = None
+    if config_path:
+        import config.schema as cfg
+        config = timed("init config", lambda: cfg.load_config(config_path), results)
+
+    def enabled(flag):
+        return flag is None or (config is not None and config[flag])
+
+    for stage, flag, modules in OPTIONAL_IMPORTS:
+        if enabled(flag):
+            timed("import " + stage, lambda: import_all(modules), results)
+
+    if config is None or not config.has_robworld:
+        return results
+    # Modules are already loaded by now, so these time construction only
+    def controller():
+        import pyonics.submodules.control.control as ctrl
+        return ctrl.ExoController(config)  # World, robot and muscles
+
+    def sim():
+        import pyonics.submodules.sim.sim as xsim
+        return xsim.Sim(pcm.world, pcm.robot, pcm.controlRate(), transforms=pcm.bones)
+
+    def interface():
+        import exos
+        return exos.load_interface()
+
+    pcm = timed("init controller", controller, results)
+    if pcm is None:
+        return results
+    if config.has_planner:
+        timed("init planner", lambda: asyncio.run(pcm.make_cspace_and_planner()), results)
+    if config.has_sim:
+        timed("init sim", sim, results)
+    if config.has_voice:
+        timed("init voice", lambda: interface().VoiceAssistantUI(config.voice_id, config.voice_rate), results)
+    if config.has_persona:
+        persona = timed("init persona", lambda: interface().Personality(config.persona_model), results)
+        if persona is not None:
+            timed("load persona model", persona.load, results)  # Off the startup path, paid on first use
+    # The HUD runs its own window loop from its constructor, so only its imports are measured
+    return results
+
+
+def run_child(config_path):
+    command = [sys.executable, os.path.abspath(__file__), "--child"]
+    if config_path:
+        command += ["--config", config_path]
+    start = time.perf_counter()
+    output = subprocess.run(command, capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+    total = (time.perf_counter() - start) * 1000  # Includes interpreter startup
+    return json.loads(output.splitlines()[-1]), total
+
+
+def report(runs, totals):
+    """
+    Prints the median time of every stage over all runs.
+    """
+    print("{:<22}{:>12}  {}".format("stage", "median ms", "status"))
+    for x, first in enumerate(runs[0]):
+        times = [run[x]["ms"] for run in runs if run[x]["ms"] is not None]
+        median = "{:12.1f}".format(statistics.median(times)) if times else "{:>12}".format("-")
+        print("{:<22}{}  {}".format(first["stage"], median, first["status"]))
+    headless = [sum(stage["ms"] or 0 for stage in run if stage["stage"] in
+                    ["import " + name for name, _ in HEADLESS_IMPORTS]) for run in runs]
+    print("{:<22}{:12.1f}".format("headless imports", statistics.median(headless)))
+    print("{:<22}{:12.1f}".format("process total", statistics.median(totals)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures ExOS import and initialization cost per subsystem.")
+    parser.add_argument("--config", default=None, help="Config to initialize; without one only imports are timed")
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters to run")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        print(json.dumps(measure(args.config)))
+        return
+
+    runs, totals = [], []
+    for _ in range(args.repeat):
+        run, total = run_child(args.config)
+        runs.append(run)
+        totals.append(total)
+    report(runs, totals)
+
+
+if __name__ == "__main__":
+    main()
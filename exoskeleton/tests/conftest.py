@@ -0,0 +1,7 @@
+"""
+Tests run from the exoskeleton folder's point of view, like exos.py and the bench scripts.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,86 @@
+"""
+HUD app back ends that run without a display: the camera frame ring and the gpsd client, against the fake gpsd.
+"""
+import time
+
+import pytest
+
+pytest.importorskip("OpenGL")  # apps draws its widgets through klampt.vis
+import pyonics.submodules.apps.apps as xapp
+
+
+def test_frame_ring_counts_only_frames_replaced_unread():
+    ring = xapp.FrameRing(3, (2, 2))
+    for stamp in range(3):
+        ring.commit(ring.claim(), stamp)
+    assert ring.unread == 0
+    for _ in range(10):
+        ring.claim()  # Failed reads: claimed, never committed
+    assert ring.unread == 0
+    ring.commit(ring.claim(), 3)  # Replaces frame 1, which nobody read
+    assert ring.unread == 1
+
+
+def test_frame_ring_keeps_pinned_frames():
+    ring = xapp.FrameRing(2, (2, 2))
+    ring.commit(ring.claim(), 0)
+    slot, sequence, frame, stamp = ring.pin()
+    for stamp in range(1, 5):
+        ring.commit(ring.claim(), stamp)
+    assert ring.sequence[slot] == sequence == 1
+    ring.release(slot)
+    assert ring.unread == 3  # Frames 2 to 5 took turns in the one free slot; 2, 3 and 4 were replaced unread
+
+
+GGA = "$GPGGA,123519,4807.038,N,01131.000,E,1,08,0.9,545.4,M,46.9,M,,*47"
+RMC = "$GPRMC,123519,A,4807.038,N,01131.000,W,022.4,084.4,230394,003.1,W*6A"
+
+
+def wait_for(condition, timeout=5.):
+    end = time.monotonic() + timeout
+    while not condition() and time.monotonic() < end:
+        time.sleep(.01)
+    return condition()
+
+
+def test_nmea_to_tpv():
+    report = xapp.nmea_to_tpv(GGA)
+    assert report["class"] == "TPV" and report["mode"] == 3
+    assert report["lat"] == pytest.approx(48.1173) and report["lon"] == pytest.approx(11.516667)
+    assert report["altMSL"] == pytest.approx(545.4)
+    assert xapp.nmea_to_tpv(RMC)["lon"] == pytest.approx(-11.516667)
+    assert xapp.nmea_to_tpv("$GPGSV,3,1,11,03,03,111,00*74") is None
+
+
+def test_gps_service_reads_fake_gpsd():
+    server = xapp.FakeGPSD([GGA, "not a report"], rate=50).start()
+    gps = xapp.GPSService(server.host, server.port).start()
+    try:
+        assert wait_for(lambda: gps.fix is not None)
+        assert gps.connected and gps.fix.lat == pytest.approx(48.1173) and gps.fix.alt == pytest.approx(545.4)
+        assert gps.age() < 5
+    finally:
+        gps.stop()
+        server.stop()
+
+
+def test_gps_service_without_gpsd():
+    gps = xapp.GPSService(port=1, backoff=(.01, .05)).start()  # Nothing listens there
+    time.sleep(.2)
+    assert gps.fix is None and not gps.connected
+    start = time.monotonic()
+    gps.stop()
+    assert time.monotonic() - start < 1  # Does not sit out the backoff
+
+
+def test_map_widget_keeps_its_name():
+    server = xapp.FakeGPSD([GGA], rate=50).start()
+    gps = xapp.GPSService(server.host, server.port).start()
+    try:
+        wait_for(lambda: gps.fix is not None)
+        widget = xapp.Map(name="map", gps=gps)
+        assert widget.name == "map"  # The vis item the HUD draws its text into
+        assert widget.refresh(time.time()).startswith("Latitude: 48.11")
+    finally:
+        gps.stop()
+        server.stop()
@@ -0,0 +1,81 @@
+"""
+Muscle attachment CSV parsing and its sidecar cache: hits, touched-but-unchanged files, and edits that invalidate it.
+"""
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("klampt")
+import pyonics.submodules.control.control as ctrl
+
+HEADER = "name;link_a;link_b;transform_a;transform_b;label_a;label_b;turns;r_0;l_0;weave_length;max_pressure\n"
+ROWS = ["bicep;5;7;.5,-.8,-1;0,-.8,1;superior;inferior;20;1;2;2;80000\n",
+        "\n",
+        "tricep;7;9;0,.1,0;.2,0,-.3;superior;inferior;15;1;1.5;2.5;60000\n"]
+
+
+def write_csv(path, rows=ROWS):
+    with open(path, "w") as fn:
+        fn.write(HEADER + "".join(rows))
+
+
+def fail_to_parse(path):
+    raise AssertionError("Parsed " + path + " instead of using the cache")
+
+
+def test_parse_attachments(tmp_path):
+    path = str(tmp_path / "muscles.csv")
+    write_csv(path)
+    attachments = ctrl.parse_attachments(path)
+    assert attachments["name"].tolist() == ["bicep", "tricep"]  # Blank line skipped
+    assert attachments["link_b"].tolist() == [7, 9]
+    np.testing.assert_allclose(attachments["delta_a"], [[.5, -.8, -1], [0, .1, 0]])
+    np.testing.assert_allclose(attachments["max_pressure"], [80000, 60000])
+
+
+def test_bad_values_name_the_line(tmp_path):
+    path = str(tmp_path / "muscles.csv")
+    write_csv(path, ROWS[:2] + ["tricep;7;9;0,.1;.2,0,-.3;superior;inferior;15;1;1.5;2.5;60000\n"])
+    with pytest.raises(ValueError, match="line 4: transform_a needs three values"):
+        ctrl.load_attachments(path)
+    write_csv(path, ROWS[:1] + ["tricep;7;9;0,.1,0;.2,0,-.3;superior;inferior;-15;1;1.5;2.5;60000\n"])
+    with pytest.raises(ValueError, match="turns must be positive"):
+        ctrl.load_attachments(path)
+
+
+def test_cache_is_used_until_the_csv_changes(tmp_path, monkeypatch):
+    path = str(tmp_path / "muscles.csv")
+    write_csv(path)
+    first = ctrl.load_attachments(path)
+    assert os.path.exists(path + ".cache")
+
+    parse = ctrl.parse_attachments
+    monkeypatch.setattr(ctrl, "parse_attachments", fail_to_parse)
+    cached = ctrl.load_attachments(path)
+    assert cached.keys() == first.keys()
+    for column in first:
+        np.testing.assert_array_equal(cached[column], first[column])
+
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))  # Touched, same contents
+    ctrl.load_attachments(path)  # Still the cache: the hash matches
+    with open(path + ".cache", "rb") as fn:
+        assert str(stat.st_mtime_ns + 10 ** 9) in fn.readline().decode()  # And it now records the new mtime
+
+    write_csv(path, ROWS[:1] + ["tricep;7;9;0,.1,0;.2,0,-.3;superior;inferior;15;1;1.5;2.5;70000\n"])
+    with pytest.raises(AssertionError, match="Parsed"):
+        ctrl.load_attachments(path)
+    monkeypatch.setattr(ctrl, "parse_attachments", parse)
+    assert ctrl.load_attachments(path)["max_pressure"].tolist() == [80000, 70000]
+    monkeypatch.setattr(ctrl, "parse_attachments", fail_to_parse)
+    assert ctrl.load_attachments(path)["max_pressure"].tolist() == [80000, 70000]  # Rewritten cache
+
+
+def test_unreadable_cache_is_parsed_again(tmp_path):
+    path = str(tmp_path / "muscles.csv")
+    write_csv(path)
+    with open(path + ".cache", "wb") as fn:
+        fn.write(b"not a cache\n")
+    assert ctrl.load_attachments(path)["name"].tolist() == ["bicep", "tricep"]
+    assert ctrl.load_attachments(path, cache=False)["name"].tolist() == ["bicep", "tricep"]
@@ -0,0 +1,142 @@
+"""
+Speech input and output without sound hardware: WAV files in, a stand-in recognizer, and the silent backend out.
+"""
+import asyncio
+import json
+import time
+import wave
+
+import numpy as np
+import pytest
+
+from pyonics.submodules.audio import audio
+
+
+def write_wav(path, samples, rate=audio.RATE):
+    with wave.open(str(path), "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(np.asarray(samples, dtype=np.int16).tobytes())
+    return str(path)
+
+
+class CountingRecognizer:
+    # Reports a phrase for every second of audio it is given, like vosk does at the end of an utterance
+    def __init__(self, rate=audio.RATE):
+        self.rate = rate
+        self.samples = 0
+
+    def AcceptWaveform(self, data):
+        before = self.samples
+        self.samples += len(data) // 2
+        return self.samples // self.rate > before // self.rate
+
+    def Result(self):
+        return json.dumps({"text": "second {}".format(self.samples // self.rate)})
+
+    def FinalResult(self):
+        return json.dumps({"text": "[unk]"})
+
+
+def test_audio_ring_drops_oldest():
+    ring = audio.AudioRing(10)
+    ring.write(np.arange(6, dtype=np.int16))
+    ring.write(np.arange(6, 12, dtype=np.int16))
+    assert ring.dropped == 2
+    assert np.frombuffer(ring.read(100), np.int16).tolist() == list(range(2, 12))
+    assert ring.read(1, timeout=.01) is None
+    ring.close()
+    assert ring.read(1) == b""
+
+
+def test_recognizer_hears_whole_wav_file(tmp_path):
+    path = write_wav(tmp_path / "speech.wav", np.random.default_rng(0).normal(0, 1000, 3 * audio.RATE))
+    phrases = []
+
+    async def listen():
+        source = audio.WavFileSource(path, realtime=False)
+        listener = audio.SpeechRecognizer(CountingRecognizer(), source, asyncio.get_running_loop(), phrases.append,
+                                          seconds=.5).start()
+        while listener.thread.is_alive():
+            await asyncio.sleep(.01)
+        await asyncio.sleep(0)  # Lets the last posted phrase through
+        return listener
+
+    listener = asyncio.run(listen())
+    assert listener.heard == listener.samples == 3 * audio.RATE
+    assert listener.ring.dropped == 0  # File sources wait for room instead of dropping
+    assert phrases == ["second 1", "second 2", "second 3"]  # "[unk]" alone is not a phrase
+
+
+def test_wav_source_needs_16_bit_mono(tmp_path):
+    path = str(tmp_path / "stereo.wav")
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(2)
+        wav.setsampwidth(2)
+        wav.setframerate(audio.RATE)
+        wav.writeframes(bytes(400))
+    with pytest.raises(ValueError, match="mono"):
+        audio.WavFileSource(path)
+
+
+def test_energy_gate_passes_only_speech():
+    rng = np.random.default_rng(0)
+    quiet = rng.normal(0, 30, audio.RATE)  # A second of background
+    loud = 3000 * np.sin(2 * np.pi * 150 * np.arange(audio.RATE // 2) / audio.RATE)  # Half a second of voice
+    recording = np.concatenate((quiet, loud, quiet)).astype(np.int16).tobytes()
+    gate = audio.EnergyGate()
+    voiced, ended = gate.process(recording)
+    assert ended
+    seconds = len(voiced) / 2 / audio.RATE
+    assert .5 <= seconds <= .5 + .2 + .4 + .02  # The voice, plus at most the preroll and hangover
+    rest, ended = gate.process(b"")  # The background after the utterance was held back, and is not speech
+    assert rest == b"" and not ended
+    assert gate.voiced * gate.frame == len(voiced) // 2
+
+
+def until(condition, timeout=5.):
+    end = time.monotonic() + timeout
+    while not condition() and time.monotonic() < end:
+        time.sleep(.001)
+    assert condition()
+
+
+def test_speech_queue_orders_and_coalesces():
+    backend = audio.NullBackend(seconds_per_character=.001)
+    queue = audio.SpeechQueue(backend, ["Affirmative."]).start()
+    assert queue.ready.wait(5)
+    queue.say("a long chatter line that keeps the speech thread busy for a while" * 3)
+    until(lambda: queue.current is not None)  # The long line is playing
+    queue.say("chatter")
+    queue.say("chatter")  # Already waiting
+    queue.say("status", audio.STATUS)
+    queue.say("Affirmative.", audio.ERROR)
+    assert queue.wait(5)
+    assert [text for text, finished in backend.played][1:] == ["Affirmative.", "status", "chatter"]
+    assert queue.coalesced == 1
+    assert backend.rendered.count("Affirmative.") == 1  # Rendered once at start, then played from the cache
+    assert [cached for text, latency, cached in queue.latencies if text == "Affirmative."] == [True]
+    queue.stop()
+    assert not queue.say("late")
+
+
+def test_safety_announcement_preempts_chatter():
+    backend = audio.NullBackend(seconds_per_character=.05)
+    queue = audio.SpeechQueue(backend).start()
+    queue.say("chatter that would take several seconds to say out loud")
+    until(lambda: queue.current is not None)
+    queue.say("Stop.", audio.SAFETY)
+    assert queue.wait(5)
+    assert backend.played == [("chatter that would take several seconds to say out loud", False), ("Stop.", True)]
+    assert queue.preempted == 1
+    queue.stop()
+
+
+def test_speech_queue_drops_least_urgent_past_limit():
+    backend = audio.NullBackend(seconds_per_character=.01)
+    queue = audio.SpeechQueue(backend, limit=2)  # Not started, so nothing is taken off the queue
+    assert queue.say("chatter one") and queue.say("status", audio.STATUS)
+    assert queue.say("error", audio.ERROR)  # Pushes out the chatter
+    assert not queue.say("chatter two")  # Less urgent than everything waiting
+    assert queue.dropped == 2 and set(queue.pending) == {"status", "error"}
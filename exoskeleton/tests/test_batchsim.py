@@ -0,0 +1,36 @@
+"""
+The batch runner has to work on a headless box: no klampt.vis, no GUI toolkits, no pandas in the workers.
+"""
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+pytest.importorskip("klampt")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize("module", ["batchsim", "exos"])  # exos loads the display side only for HAS_VIS configs
+def test_headless_import(module):
+    # A fresh interpreter, so nothing another test imported can hide a missing import
+    code = ("import sys, " + module + "; "
+            "print(sorted(m for m in sys.modules if m.startswith(('klampt.vis', 'OpenGL', 'PyQt5', 'pandas'))))")
+    output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert output.stdout.strip() == "[]"
+
+
+def test_short_case(monkeypatch, tmp_path):
+    monkeypatch.chdir(ROOT)  # Config paths are relative to the exoskeleton folder
+    import batchsim
+    import config.schema as cfg
+    config, run = cfg.load_batch("config/batch_input/sim_batch_input_1.txt",
+                                 base=cfg.load_config("config/desktopsim_testconfig2.txt"))[0]
+    run = dict(run, duration=.05)  # The batch file asks for 5 s
+    result = batchsim.run_case(0, config, run, .05, force_multiplier=2, record_every=1)
+    assert result["sim_time"] == pytest.approx(.05, abs=2 * config["timestep"])
+    assert len(result["contact_counts"]) == len(result["force_history"]) > 0
+    assert np.all(np.isfinite(result["final_transforms"]))
+    batchsim.save_results([result], str(tmp_path / "results.npz"))
+    assert np.load(str(tmp_path / "results.npz"))["case"].tolist() == [0]
@@ -0,0 +1,92 @@
+"""
+Config files: parsing, validation of bad values, and the compiled config cache.
+"""
+import os
+
+import pytest
+
+import config.schema as cfg
+
+HEADLESS = "HAS_ROBWORLD:\nFalse\nHAS_PLANNER:\nFalse\n"
+
+
+def write_config(tmp_path, text, name="config.txt"):
+    path = str(tmp_path / name)
+    with open(path, "w") as fn:
+        fn.write(text)
+    return path
+
+
+def test_parse_values(tmp_path):
+    path = write_config(tmp_path, HEADLESS + "\nCONTROL RATE:\n.002\n\nDISPLAY RESOLUTION:\n640\n480\nVOICE GATE:\nno\n")
+    config = cfg.load_config(path)
+    assert config.timestep == .002 and config["timestep"] == .002
+    assert (config.width, config.height) == (640, 480)
+    assert config.voice_gate is False and config.has_robworld is False
+    assert config.port == 5005 and config.source == path  # Unset labels keep their defaults
+
+
+@pytest.mark.parametrize("text, problem", [
+    ("CONTROL RATE:\n0\n", "CONTROL RATE must be positive"),
+    ("CONTACT RATE:\n-5\n", "CONTACT RATE must be positive"),
+    ("CONTROL PORT:\n70000\n", "CONTROL PORT must be between"),
+    ("NETWORK MODE:\nboth\n", "NETWORK MODE must be one of"),
+    ("VOICE OUTPUT:\nheadphones\n", "VOICE OUTPUT must be one of"),
+    ("DISPLAY RESOLUTION:\n0\n1080\n", "DISPLAY RESOLUTION must be positive"),
+    ("HAS_SIM:\nTrue\n", "HAS_SIM needs HAS_ROBWORLD"),
+    ("VOICE INPUT:\nmissing.wav\n", "voice_input missing.wav does not exist"),
+    ("CONTROL PORT:\nfive\n", "line 6: invalid literal"),
+    ("HAS_VIS:\nmaybe\n", "line 6: expected True or False, got maybe"),
+    ("SPEED:\n11\n", "line 5: unknown label SPEED"),
+    ("DISPLAY RESOLUTION:\n1920\n", "line 5: missing value"),
+    ("CONTROL PORT:\n5005\n5006\n", "line 7: value 5006 has no label"),
+])
+def test_bad_values_are_rejected(tmp_path, text, problem):
+    path = write_config(tmp_path, HEADLESS + text)
+    with pytest.raises(cfg.ConfigError, match=problem) as error:
+        cfg.load_config(path)
+    assert str(error.value).startswith(path)
+
+
+def test_missing_robot_files_are_rejected(tmp_path):
+    path = write_config(tmp_path, "CORE:\nrobots/missing.rob\n")
+    with pytest.raises(cfg.ConfigError) as error:
+        cfg.load_config(path)
+    assert "core robots/missing.rob does not exist" in str(error.value)
+    assert "attachments is required" in str(error.value)  # Every problem at once, not just the first
+    with pytest.raises(cfg.ConfigError, match="CONTROL RATE"):
+        cfg.load_config(write_config(tmp_path, HEADLESS, "ok.txt")).replace(timestep=-1)
+
+
+def test_compiled_configs_are_cached(tmp_path, monkeypatch):
+    path = write_config(tmp_path, HEADLESS + "CONTROL PORT:\n6000\n")
+    first = cfg.load_config(path)
+
+    def fail_to_parse(*args):
+        raise AssertionError("Parsed the config again")
+
+    monkeypatch.setattr(cfg, "parse_block", fail_to_parse)
+    assert cfg.load_config(path) is first
+    monkeypatch.chdir(tmp_path)
+    assert cfg.load_config("config.txt") is first  # Same file by another name
+
+    write_config(tmp_path, HEADLESS + "CONTROL PORT:\n6001\n")
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))  # Edited, even within the clock's resolution
+    with pytest.raises(AssertionError, match="again"):
+        cfg.load_config(path)
+    monkeypatch.undo()
+    assert cfg.load_config(path).port == 6001
+
+
+def test_batch_cases_share_a_compiled_config(tmp_path):
+    base = write_config(tmp_path, HEADLESS, "base.txt")
+    batch = write_config(tmp_path, "CONFIG:\n" + base + "\nDURATION:\n2\n\nCONFIG:\n" + base + "\nCONTROL PORT:\n6000\n"
+                         "\nCONFIG:\n" + base + "\nCONTROL RATE:\n0\n", "batch.txt")
+    with pytest.raises(cfg.ConfigError, match="batch.txt line 11: CONTROL RATE must be positive"):
+        cfg.load_batch(batch)
+    batch = write_config(tmp_path, "CONFIG:\n" + base + "\nDURATION:\n2\n\nCONFIG:\n" + base + "\nCONTROL PORT:\n6000\n",
+                         "batch.txt")
+    (first, run), (second, _) = cfg.load_batch(batch)
+    assert first is cfg.load_config(base) and run == {"config": base, "duration": 2}
+    assert second.port == 6000 and second.timestep == first.timestep
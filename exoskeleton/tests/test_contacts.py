@@ -0,0 +1,93 @@
+"""
+ContactBroadPhase against a brute force pass over every link pair, terrain and object, as the robot and a loose object
+move.
+"""
+import os
+
+import numpy as np
+import pytest
+
+klampt = pytest.importorskip("klampt")
+from klampt.model.geometry import box, sphere
+import pyonics.submodules.control.control as ctrl
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PADDING = .1
+
+
+def label(item):
+    return type(item).__name__, item.getID()  # World-wide ID: links, terrains and objects alike
+
+
+def brute_force(world, robot):
+    # Every solid link against every other solid link, terrain and object, straight to the narrow phase
+    links = [robot.link(x) for x in range(robot.numLinks()) if not robot.link(x).geometry().empty()]
+    others = [world.terrain(x) for x in range(world.numTerrains())]
+    others += [world.rigidObject(x) for x in range(world.numRigidObjects())]
+    pairs = [(a, b) for x, a in enumerate(links) for b in links[x + 1:]] + [(a, b) for a in links for b in others]
+    touching = set()
+    for a, b in pairs:
+        result = a.geometry().contacts(b.geometry(), PADDING, PADDING)  # Held: depths is a view into the result
+        if len(result.depths):
+            touching.add((label(a), label(b)))
+    return touching
+
+
+@pytest.fixture(scope="module")
+def scene():
+    world = klampt.WorldModel()
+    world.loadRobot(os.path.join(ROOT, "robots", "core_bot_test4.rob"))
+    world.makeTerrain("floor").geometry().set(box(4, 4, .2, center=(0, 0, -.1)))
+    world.makeRigidObject("ball").geometry().set(sphere(.2, center=(0, 0, 0)))
+    return world, world.robot(0)
+
+
+def test_broad_phase_finds_every_contact(scene):
+    world, robot = scene
+    bones = ctrl.TransformBuffer(robot)
+    bones.capture()
+    mask = np.ones((robot.numLinks(), robot.numLinks()), dtype=bool)
+    broad = ctrl.ContactBroadPhase(world, robot, bones, mask, padding=PADDING)
+    ball = world.rigidObject(0)
+    rng = np.random.default_rng(0)
+    start = robot.getConfig()
+
+    poses = [(start, [0, 0, 10]),  # As loaded, ball out of reach
+             (start, robot.link(robot.numLinks() - 1).getTransform()[1])]  # Ball on the last link
+    for _ in range(4):  # One arm and one leg swing through the others, the rest of the links stay put
+        bent = list(start)
+        for x in (12, 14, 20, 26, 32):
+            bent[x] += rng.uniform(-1.5, 1.5)
+        poses.append((bent, [0, 0, 10]))
+    dropped = list(bent)
+    dropped[2] -= 2.9
+    poses.append((dropped, [0, 0, 10]))  # Down onto the floor
+    for config, ball_position in poses:
+        robot.setConfig(config)
+        bones.capture()
+        ball.setTransform(ball.getTransform()[0], list(ball_position))
+
+        found = {(label(a), label(b)) for a, b in broad.contact_map()}
+        assert found == brute_force(world, robot)
+        candidates = {(label(a), label(b)) for a, b in broad.candidates()}
+        assert found <= candidates
+
+    assert any(b[0] == "TerrainModel" for a, b in found)  # The floor was reached, so the terrain path was tested
+    robot.setConfig(start)
+
+
+def test_only_moved_links_are_retested(scene):
+    world, robot = scene
+    bones = ctrl.TransformBuffer(robot)
+    bones.capture()
+    mask = np.ones((robot.numLinks(), robot.numLinks()), dtype=bool)
+    broad = ctrl.ContactBroadPhase(world, robot, bones, mask, padding=PADDING)
+    assert broad.update() == len(broad.solid)  # Everything moves on the first pass
+    assert broad.update() == 0
+    config = robot.getConfig()
+    config[-1] += .5
+    robot.setConfig(config)
+    bones.capture()
+    assert 0 < broad.update() < len(broad.solid)
+    config[-1] -= .5
+    robot.setConfig(config)
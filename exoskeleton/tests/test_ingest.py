@@ -0,0 +1,137 @@
+"""
+PressureIngest: OSC messages and bundles decoded into the pressure vector, stale bundles, and snapshots that wait out
+a write in progress.
+"""
+import struct
+import threading
+import time
+
+import numpy as np
+import pytest
+
+pytest.importorskip("klampt")
+import pyonics.submodules.control.control as ctrl
+
+NAMES = ["bicep", "tricep", "calf", "quad"]
+
+
+def osc_string(text):
+    data = text.encode() + b"\0"
+    return data + b"\0" * (-len(data) % 4)
+
+
+def message(address, *arguments, tags=None):
+    tags = tags or "f" * len(arguments)
+    data = osc_string(address) + osc_string("," + tags)
+    for tag, argument in zip(tags, arguments):
+        if tag == "s":
+            data += osc_string(argument)
+        elif tag not in "TF":  # Booleans live in the type tags alone
+            data += struct.pack({"f": ">f", "i": ">i", "d": ">d", "h": ">q"}[tag], argument)
+    return data
+
+
+def bundle(timetag, *elements):
+    data = b"#bundle\0" + struct.pack(">Q", timetag)
+    for element in elements:
+        data += struct.pack(">i", len(element)) + element
+    return data
+
+
+def timetag(seconds):
+    return int(seconds * 2 ** 32)
+
+
+def make_ingest():
+    ingest = ctrl.PressureIngest(len(NAMES), stale_after=.1)
+    ingest.map_muscles(NAMES, "/pressures", trailing=1)
+    return ingest
+
+
+def test_messages_fill_their_slots():
+    ingest = make_ingest()
+    ingest.receive(message("/pressures", .5, .25, 1, 2, 99), arrival=1)  # Last argument is ignored
+    np.testing.assert_allclose(ingest.pressures, [.5, .25, 1, 2])
+    ingest.receive(message("/pressures/calf", 3), arrival=2)
+    np.testing.assert_allclose(ingest.pressures, [.5, .25, 3, 2])
+    np.testing.assert_allclose(ingest.arrival, [1, 1, 2, 1])
+    ingest.receive(message("/pressures", 4, 5.5, None, 0, tags="idTf"), arrival=3)  # Slow path, mixed types
+    np.testing.assert_allclose(ingest.pressures, [4, 5.5, 1, 2])
+    ingest.receive(message("/pressures", .1, 0), arrival=4)  # Fewer arguments than slots: only those written
+    np.testing.assert_allclose(ingest.pressures, [.1, 5.5, 1, 2])
+    assert ingest.packets == 4 and ingest.unmapped == ingest.malformed == 0
+
+
+def test_unmapped_and_malformed_packets_are_counted():
+    ingest = make_ingest()
+    ingest.receive(message("/elsewhere", 1), arrival=1)
+    ingest.receive(osc_string("/pressures"), arrival=1)  # No type tags
+    ingest.receive(message("/pressures", "one", "two", tags="ss"), arrival=1)
+    ingest.receive(message("/pressures", 1, 2, 3, 4, 5)[:-6], arrival=1)  # Cut short
+    assert ingest.unmapped == 1 and ingest.malformed == 3
+    assert not ingest.pressures.any()
+
+
+def test_bundles_and_stale_timetags():
+    ingest = make_ingest()
+    ingest.receive(bundle(timetag(100), message("/pressures", 1, 1, 1, 1, 0)), arrival=1)
+    ingest.receive(bundle(timetag(101), message("/pressures/bicep", 2)), arrival=2)
+    ingest.receive(bundle(timetag(100.5), message("/pressures", 3, 3, 3, 3, 0)), arrival=3)  # Late for bicep only
+    np.testing.assert_allclose(ingest.pressures, [2, 3, 3, 3])
+    np.testing.assert_allclose(ingest.timetags, [101, 100.5, 100.5, 100.5])
+    assert ingest.dropped_stale == 1
+
+    inner = bundle(timetag(102), message("/pressures/quad", 4))
+    ingest.receive(bundle(ctrl.PressureIngest.IMMEDIATE, message("/pressures/calf", 5), inner), arrival=4)
+    np.testing.assert_allclose(ingest.pressures, [2, 3, 5, 4])
+    assert ingest.timetags[2] == 100.5  # Immediate bundles leave the timetag alone
+    assert ingest.timetags[3] == 102
+
+
+def test_stale_mask():
+    ingest = make_ingest()
+    ingest.receive(message("/pressures", 1, 1, 1, 1, 0), arrival=10)
+    ingest.receive(message("/pressures/calf", 2), arrival=10.08)
+    assert not ingest.stale_mask(now=10.05).any()
+    assert ingest.stale_mask(now=10.15).tolist() == [True, True, False, True]
+    assert ingest.stale_mask(now=11).all()
+
+
+def test_snapshot_waits_out_a_write():
+    ingest = make_ingest()
+    ingest.receive(message("/pressures", 1, 1, 1, 1, 0), arrival=1)
+    out = np.zeros(len(NAMES))
+    assert ingest.snapshot(out) == 2 and out.tolist() == [1, 1, 1, 1]
+
+    ingest.sequence += 1  # A write has started, and only half the vector is in
+    ingest.pressures[:2] = 2
+    results = []
+    reader = threading.Thread(target=lambda: results.append(ingest.snapshot(out)), daemon=True)
+    reader.start()
+    time.sleep(.05)
+    assert reader.is_alive() and not results  # Still retrying, nothing torn handed back
+    ingest.pressures[2:] = 2
+    ingest.sequence += 1
+    reader.join(5)
+    assert results == [4] and out.tolist() == [2, 2, 2, 2]
+
+
+def test_snapshots_alongside_a_writer():
+    ingest = make_ingest()
+    done = threading.Event()
+
+    def write():
+        for value in range(1, 2000):
+            ingest.receive(message("/pressures", *([value] * len(NAMES)), 0))
+        done.set()
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    out = np.zeros(len(NAMES))
+    last = 0
+    while not done.is_set():
+        sequence = ingest.snapshot(out)
+        assert sequence % 2 == 0 and sequence >= last
+        assert np.all(out == out[0])  # Every slot from the same message
+        last = sequence
+    writer.join(5)
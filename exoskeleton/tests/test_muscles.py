@@ -0,0 +1,79 @@
+"""
+The batched muscle bank against the one-muscle-at-a-time Muscle path, on links that are rotated and moved.
+"""
+import numpy as np
+import pytest
+
+pytest.importorskip("klampt")
+from klampt.math import so3
+import pyonics.submodules.control.control as ctrl
+
+
+class Bones:
+    # Stands in for a TransformBuffer: current pose rows, R column-major then t
+    def __init__(self, transforms):
+        self.current = np.asarray(transforms, dtype=float)
+
+    def __getitem__(self, x):
+        return self.current[x]
+
+
+class Controller:
+    def __init__(self, bones):
+        self.bones = bones
+
+
+def rotated_pose(links, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for _ in range(links):
+        rotation = so3.from_moment(rng.normal(size=3).tolist())
+        rows.append(list(rotation) + rng.normal(size=3).tolist())
+    return rows
+
+
+ATTACHMENTS = {"name": np.array(["bicep", "tricep", "calf"]),
+               "link_a": np.array([0, 1, 2], dtype=np.int32), "link_b": np.array([1, 2, 0], dtype=np.int32),
+               "delta_a": np.array([[.1, .2, 0], [0, .3, .1], [.2, 0, .2]]),
+               "delta_b": np.array([[0, -.1, .2], [.1, .1, 0], [0, .2, -.1]]),
+               "turns": np.array([20., 15, 25]), "r_0": np.array([1., 1, 1]), "l_0": np.array([1., 1.5, 2]),
+               "weave_length": np.array([3., 2.5, 3.5]), "max_pressure": np.array([6., 6, 6])}
+
+
+def muscle_rows():
+    for x in range(len(ATTACHMENTS["name"])):
+        yield {column: values[x] for column, values in ATTACHMENTS.items()}
+
+
+def test_bank_matches_muscles_on_rotated_links():
+    controller = Controller(Bones(rotated_pose(3)))
+    muscles = [ctrl.Muscle(row, controller) for row in muscle_rows()]
+    bank = ctrl.MuscleBank(ATTACHMENTS, controller)
+    pressures = [.2, .5, .9]
+    bank.set_pressures(pressures)
+    links, vectors, points = bank.update()
+
+    n = len(muscles)
+    for x, (muscle, pressure) in enumerate(zip(muscles, pressures)):
+        triplet_a, triplet_b = muscle.update_muscle(pressure)
+        assert bank.lengths[x] == pytest.approx(muscle.length)
+        for row, (link, force, point) in ((x, triplet_a), (n + x, triplet_b)):
+            assert links[row] == link
+            np.testing.assert_allclose(vectors[row], force, atol=1e-12)
+            np.testing.assert_allclose(points[row], point, atol=1e-12)
+
+
+def test_attachment_follows_link_rotation():
+    # A quarter turn about z carries an offset along x onto y
+    row = np.array(list(so3.from_axis_angle(([0, 0, 1], np.pi / 2))) + [1, 2, 3])
+    np.testing.assert_allclose(ctrl.Muscle.attachment(row, [1, 0, 0]), [1, 3, 3], atol=1e-12)
+
+
+def test_bank_update_reuses_its_arrays():
+    controller = Controller(Bones(rotated_pose(3, seed=1)))
+    bank = ctrl.MuscleBank(ATTACHMENTS, controller)
+    bank.set_pressures([1, 1, 1])
+    scales, forces = bank.scales, bank.force_vectors
+    bank.update()
+    bank.update(force_multiplier=2)
+    assert bank.scales is scales and bank.force_vectors is forces
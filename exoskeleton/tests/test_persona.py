@@ -0,0 +1,72 @@
+"""
+The persona's batching worker and response cache, with the stub language model in place of GPT-2.
+"""
+import asyncio
+import sys
+
+import pytest
+
+pytest.importorskip("OpenGL")  # The interface module draws the HUD through klampt.vis
+import pyonics.submodules.ui.interface as ui
+
+
+def test_nothing_loads_until_the_first_prompt():
+    persona = ui.Personality("gpt2")
+    assert persona.model is None and persona.thread is None
+    assert "transformers" not in sys.modules
+
+
+def test_prompts_batch_and_cache():
+    model = ui.StubLanguageModel(delay=.05)
+    persona = ui.Personality(model, batch_window=.1)
+    try:
+        futures = [persona.submit(prompt) for prompt in ("hello", "status", "hello")]
+        assert futures[0] is futures[2]  # Asked twice while in flight, generated once
+        responses = [future.result(5) for future in futures]
+        assert model.batches == [["hello", "status"]]
+        assert responses[0].startswith("hello ") and responses[1].startswith("status ")
+        assert persona.process_input("hello") == responses[0]
+        assert persona.hits == 1 and len(model.batches) == 1
+        persona.submit("hello", temperature=.1).result(5)  # Other settings, other response
+        assert len(model.batches) == 2
+    finally:
+        persona.close()
+
+
+def test_respond_on_the_event_loop():
+    persona = ui.Personality("stub")
+    try:
+        response = asyncio.run(persona.respond("ready"))
+        assert response.startswith("ready ") and persona.batches == 1
+    finally:
+        persona.close()
+
+
+def test_model_errors_reach_the_caller():
+    class BrokenModel:
+        def generate(self, prompts, **settings):
+            raise RuntimeError("out of memory")
+
+    persona = ui.Personality(BrokenModel())
+    try:
+        with pytest.raises(RuntimeError, match="out of memory"):
+            persona.submit("hello").result(5)
+        assert not persona.in_flight and not persona.cache
+    finally:
+        persona.close()
+
+
+def test_prompts_after_close_fail_at_once():
+    persona = ui.Personality(ui.StubLanguageModel(delay=.05))
+    before = persona.submit("hello")
+    persona.close()
+    assert before.result(5).startswith("hello ")  # Submitted before close, still answered
+    after = persona.submit("status")
+    assert after.done()
+    with pytest.raises(RuntimeError, match="closed"):
+        after.result(0)
+    with pytest.raises(RuntimeError, match="closed"):
+        asyncio.run(asyncio.wait_for(persona.respond("status"), 1))
+    persona.close()  # Twice is fine
+    persona.thread.join(5)
+    assert not persona.thread.is_alive()
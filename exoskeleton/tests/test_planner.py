@@ -0,0 +1,92 @@
+"""
+Roadmap cache and queries on a warm roadmap, in a toy 2D cspace with a wall down the middle.
+"""
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+
+kmcs = pytest.importorskip("klampt.plan.cspace")
+import pyonics.submodules.control.control as ctrl
+
+
+class WallSpace(kmcs.CSpace):
+    # Unit square with a wall at x = 0.5 that leaves a gap at the top
+    def __init__(self):
+        kmcs.CSpace.__init__(self)
+        self.bound = [(0, 1), (0, 1)]
+        self.eps = 1e-2
+
+    def feasible(self, q):
+        return kmcs.CSpace.feasible(self, q) and not (.45 < q[0] < .55 and q[1] < .8)
+
+
+def warm_controller(milestones=(), edges=()):
+    # An ExoController with only the planner parts, the roadmap restored like build_planner does it
+    controller = ctrl.ExoController.__new__(ctrl.ExoController)
+    controller.cspace = WallSpace()
+    controller.planner = ctrl.Roadmap(controller.cspace, milestones, edges)
+    controller.planner_lock = threading.Lock()
+    controller.shutdown_flag = False
+    return controller
+
+
+def grown_roadmap(milestones=200):
+    controller = warm_controller()
+    while controller.planner.count < milestones:
+        controller.plan_more(50)
+    return controller.planner.graph()
+
+
+def check_path(path, start, goal):
+    assert path is not None
+    assert path[0] == pytest.approx(start) and path[-1] == pytest.approx(goal)
+    space = WallSpace()
+    space.setup()
+    assert all(space.isVisible(a, b) for a, b in zip(path, path[1:]))
+
+
+def test_roadmap_round_trip(tmp_path):
+    milestones, edges = grown_roadmap()
+    assert len(edges) > len(milestones)
+    path = str(tmp_path / "robot.roadmap")
+    ctrl.save_roadmap(path, "key", milestones, edges)
+    loaded_milestones, loaded_edges = ctrl.load_roadmap(path, "key")
+    np.testing.assert_allclose(loaded_milestones, milestones)
+    np.testing.assert_array_equal(loaded_edges, edges)
+    assert ctrl.load_roadmap(path, "other key") is None
+
+
+def test_queries_on_large_restored_roadmap(tmp_path):
+    milestones, edges = grown_roadmap(1200)
+    path = str(tmp_path / "robot.roadmap")
+    ctrl.save_roadmap(path, "key", milestones, edges)
+    controller = warm_controller(*ctrl.load_roadmap(path, "key"))
+    assert controller.planner.count == len(milestones) and len(controller.planner.edges) == len(edges)
+    for start, goal in [([.1, .2], [.9, .2]), ([.9, .1], [.2, .3]), ([.3, .05], [.7, .05])]:
+        check_path(controller.plan_path(start, goal, iterations=0), start, goal)  # The stored edges alone connect them
+    assert controller.planner.count == len(milestones)  # Queries leave the shared roadmap alone
+    controller.plan_more(10)  # And it keeps growing afterwards
+    check_path(controller.plan_path([.1, .2], [.9, .2], iterations=0), [.1, .2], [.9, .2])
+
+
+def test_query_without_a_way_through():
+    controller = warm_controller([[.1, .1], [.2, .1]], [[0, 1]])
+    assert controller.plan_path([.1, .2], [.9, .2], iterations=0) is None
+    assert controller.plan_path([.5, .5], [.1, .1]) is None  # Start inside the wall
+
+
+def test_grow_roadmap_stops_at_cap():
+    controller = warm_controller([[.1, .1]])
+    controller.roadmap_saved = 0  # Never saved, so only the live size can stop it
+    controller.save_planner_roadmap = lambda: None
+
+    async def grow():
+        task = asyncio.create_task(controller.grow_roadmap(iterations=20, interval=0, max_milestones=30))
+        await asyncio.sleep(.3)
+        controller.shutdown_flag = True
+        await task
+
+    asyncio.run(grow())
+    assert 30 <= controller.planner.count < 30 + 20 + 1
@@ -0,0 +1,52 @@
+"""
+Startup ordering, and background steps that boot does not wait for.
+"""
+import os
+import threading
+
+import pytest
+
+from pyonics.submodules.startup import startup
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_background_step_does_not_hold_up_startup():
+    release = threading.Event()
+    finished = []
+    plan = startup.StartupOrchestrator(on_background=finished.append)
+    plan.add("world", lambda: "world")
+    plan.add("pairs", lambda: release.wait(5), after=["world"], background=True)
+    plan.add("vis", lambda: "vis", after=["world"])
+
+    assert plan.run() == {"world": "world", "vis": "vis"}
+    assert plan.steps["pairs"].state == "running"
+    assert "running (bg)" in plan.timeline()
+    assert plan.critical_path()[-1] != "pairs"
+
+    release.set()
+    assert plan.wait_background(5)
+    assert [step.name for step in finished] == ["pairs"] and finished[0].state == "done"
+    assert plan.steps["pairs"].end >= plan.steps["pairs"].start
+
+
+def test_nothing_may_need_a_background_step():
+    plan = startup.StartupOrchestrator()
+    plan.add("pairs", lambda: None, background=True)
+    plan.add("contacts", lambda: None, after=["pairs"])
+    with pytest.raises(ValueError):
+        plan.run()
+
+
+def test_hud_with_sim_plans_without_background_steps(monkeypatch):
+    monkeypatch.chdir(ROOT)  # Config paths are relative to the exoskeleton folder
+    import config.schema as cfg
+    import exos
+    config = cfg.load_config("config/desktopsim_testconfig2.txt").replace(has_sim=True, has_vis=True, has_hud=True)
+    system = exos.ExOS.__new__(exos.ExOS)  # The steps are only planned here, not built
+    system.logging = False
+    plan = system.plan_startup(config)
+    plan.check()
+    assert plan.steps["self pairs"].background
+    assert "self pairs" not in plan.steps["hud"].after
+    assert {"sim", "contacts", "vis"} <= set(plan.steps["hud"].after)
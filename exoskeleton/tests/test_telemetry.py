@@ -0,0 +1,147 @@
+"""
+Telemetry logs: the record ring around its wrap point, what a reader gets back after a flush, and the encrypted
+log format.
+"""
+import time
+
+import numpy as np
+import pytest
+
+from pyonics.submodules.telemetry import telemetry as tlm
+
+MUSCLES, LINKS = 3, 2
+
+
+def tick_state(tick):
+    return (tick * .01, tick, np.full(MUSCLES, tick, dtype=np.float32), np.full((LINKS, 12), tick, dtype=float),
+            np.full(MUSCLES, -tick, dtype=np.float32))
+
+
+def check_records(records, ticks):
+    assert records["tick"].tolist() == list(ticks)
+    for record, tick in zip(records, ticks):
+        assert record["time"] == tick * .01
+        assert np.all(record["pressures"] == tick) and np.all(record["transforms"] == tick)
+        assert np.all(record["forces"] == -tick)
+
+
+def test_flush_and_read_back(tmp_path):
+    path = str(tmp_path / "log.exo")
+    with open(path, "wb") as log:
+        writer = tlm.TelemetryWriter(log, MUSCLES, LINKS, capacity=64, block=16, threaded=False)
+        for tick in range(40):
+            assert writer.record(*tick_state(tick))
+        writer.flush()
+        check_records(tlm.open_telemetry(path), range(40))  # Readable while the log is still open
+        writer.record(*tick_state(40))
+        writer.close()
+    check_records(tlm.open_telemetry(path), range(41))
+
+
+def test_ring_wraps_and_drops_when_full(tmp_path):
+    path = str(tmp_path / "log.exo")
+    with open(path, "wb") as log:
+        writer = tlm.TelemetryWriter(log, MUSCLES, LINKS, capacity=8, block=4, threaded=False)
+        for tick in range(6):
+            writer.record(*tick_state(tick))
+        writer.flush()  # Tail is now part way round the ring
+        results = [writer.record(*tick_state(tick)) for tick in range(6, 16)]
+        assert results == [True] * 8 + [False] * 2  # The ring holds 8; the writer is a full ring behind after that
+        assert writer.dropped == 2
+        writer.flush()  # Pending records straddle the end of the ring: written as two slices
+        for tick in range(16, 20):
+            writer.record(*tick_state(tick))
+        writer.close()
+    check_records(tlm.open_telemetry(path), list(range(14)) + list(range(16, 20)))
+
+
+def test_threaded_writer_and_torn_last_record(tmp_path):
+    path = str(tmp_path / "log.exo")
+    with open(path, "wb") as log:
+        writer = tlm.TelemetryWriter(log, MUSCLES, LINKS, capacity=32, block=8, flush_interval=.01)
+        for tick in range(100):
+            while not writer.record(*tick_state(tick)):
+                time.sleep(.001)  # Waits for the writer thread to make room, so nothing is lost
+        writer.close()
+        log.write(b"\0" * (writer.dtype.itemsize // 2))  # A record cut off mid-write
+    check_records(tlm.open_telemetry(path), range(100))
+
+
+def encrypted_log(path, ticks, password=b"correct horse", chunk_size=256):
+    # A telemetry log through a LogEncryptor, with a cheap key derivation so the tests stay fast
+    with open(path, "wb") as log:
+        sink = tlm.LogEncryptor.from_password(log, password, iterations=1000, chunk_size=chunk_size)
+        writer = tlm.TelemetryWriter(sink, MUSCLES, LINKS, capacity=64, block=16, threaded=False)
+        for tick in range(ticks):
+            writer.record(*tick_state(tick))
+        writer.close()
+        sink.close()
+    return path
+
+
+def test_encrypted_round_trip(tmp_path):
+    pytest.importorskip("cryptography")
+    path = encrypted_log(str(tmp_path / "log.exo"), 50)
+    reader = tlm.EncryptedLogReader(path, b"correct horse")
+    try:
+        assert reader.chunks > 3  # Records span several chunks
+        check_records(reader.records(0, 50), range(50))
+        check_records(reader.records(17, 5), range(17, 22))  # Random access decrypts only what it needs
+        check_records(reader.records(45, 100), range(45, 50))
+        assert b"".join(reader) == reader.read(0, reader.size)
+    finally:
+        reader.close()
+
+
+def test_encrypted_log_wrong_password(tmp_path):
+    pytest.importorskip("cryptography")
+    path = encrypted_log(str(tmp_path / "log.exo"), 10)
+    reader = tlm.EncryptedLogReader(path, b"wrong horse")
+    try:
+        with pytest.raises(ValueError, match="verify"):
+            reader.records(0, 10)
+    finally:
+        reader.close()
+
+
+STRIDE = tlm.NONCE_SIZE + 256 + tlm.TAG_SIZE  # One sealed chunk of encrypted_log
+
+
+def rewrite(path, change):
+    with open(path, "rb") as log:
+        data = bytearray(log.read())
+    with open(path, "wb") as log:
+        log.write(change(data))
+
+
+@pytest.mark.parametrize("change", [
+    lambda data: data[:tlm.ENCRYPTED_HEADER.size + 100] + bytes([data[tlm.ENCRYPTED_HEADER.size + 100] ^ 1]) +
+    data[tlm.ENCRYPTED_HEADER.size + 101:],  # One bit flipped in the first chunk
+    lambda data: data[:len(data) - (len(data) - tlm.ENCRYPTED_HEADER.size) % STRIDE],  # Final chunk gone whole
+    lambda data: data[:-5],  # Cut off mid-chunk
+], ids=["tampered", "truncated at a chunk", "truncated mid-chunk"])
+def test_encrypted_log_detects_damage(tmp_path, change):
+    pytest.importorskip("cryptography")
+    path = encrypted_log(str(tmp_path / "log.exo"), 50)
+    rewrite(path, change)
+    with pytest.raises(ValueError):
+        reader = tlm.EncryptedLogReader(path, b"correct horse")
+        try:
+            for chunk in reader:
+                pass
+        finally:
+            reader.close()
+
+
+def test_encrypted_log_detects_swapped_chunks(tmp_path):
+    pytest.importorskip("cryptography")
+    path = encrypted_log(str(tmp_path / "log.exo"), 50)
+    start = tlm.ENCRYPTED_HEADER.size
+    rewrite(path, lambda data: data[:start] + data[start + STRIDE:start + 2 * STRIDE] + data[start:start + STRIDE] +
+            data[start + 2 * STRIDE:])
+    reader = tlm.EncryptedLogReader(path, b"correct horse")
+    try:
+        with pytest.raises(ValueError, match="Chunk 0"):
+            reader.chunk(0)
+    finally:
+        reader.close()
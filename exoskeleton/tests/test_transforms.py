@@ -0,0 +1,70 @@
+"""
+TransformBuffer.diff against klampt's own se3.error, angles near pi included.
+"""
+import math
+
+import numpy as np
+import pytest
+
+pytest.importorskip("klampt")
+from klampt.math import se3, so3
+import pyonics.submodules.control.control as ctrl
+
+
+class Link:
+    def __init__(self, robot, x):
+        self.robot, self.x = robot, x
+
+    def getTransform(self):
+        return self.robot.pose[self.x]
+
+
+class PosedRobot:
+    # Just enough RobotModel for a TransformBuffer: links with settable transforms
+    def __init__(self, pose):
+        self.pose = pose
+
+    def numLinks(self):
+        return len(self.pose)
+
+    def link(self, x):
+        return Link(self, x)
+
+
+def random_pairs(count, seed=0):
+    rng = np.random.default_rng(seed)
+    pairs = []
+    for x in range(count):
+        if x % 3 == 0:
+            angle = rng.uniform(0, math.pi)
+        elif x % 3 == 1:
+            angle = math.pi - 10 ** rng.uniform(-9, -1)  # Near pi, where the skew part all but vanishes
+        else:
+            angle = math.pi
+        axis = rng.normal(size=3)
+        axis /= np.linalg.norm(axis)
+        current = (so3.from_moment(rng.normal(size=3).tolist()), rng.normal(size=3).tolist())
+        previous = (so3.mul(so3.from_axis_angle((axis.tolist(), angle)), current[0]), rng.normal(size=3).tolist())
+        pairs.append((previous, current))
+    return pairs
+
+
+def test_diff_matches_se3_error():
+    pairs = random_pairs(600)
+    robot = PosedRobot([previous for previous, current in pairs])
+    bones = ctrl.TransformBuffer(robot)
+    robot.pose = [current for previous, current in pairs]
+    bones.capture()
+    diff = bones.diff()
+    for row, (previous, current) in zip(diff, pairs):
+        expected = np.array(se3.error(previous, current))
+        if abs(np.linalg.norm(expected[:3]) - math.pi) < 1e-5 and np.dot(row[:3], expected[:3]) < 0:
+            expected[:3] *= -1  # At pi, w and -w are the same rotation
+        np.testing.assert_allclose(row, expected, atol=1e-6)
+
+
+def test_diff_without_motion_is_zero():
+    robot = PosedRobot([current for previous, current in random_pairs(10, seed=1)])
+    bones = ctrl.TransformBuffer(robot)
+    bones.capture()
+    np.testing.assert_allclose(bones.diff(), 0, atol=1e-7)
@@ -0,0 +1,93 @@
+"""
+The control-to-render snapshot handoff: a pinned snapshot is never written, so the render thread never draws a frame
+that mixes two ticks.
+"""
+import threading
+import time
+
+import numpy as np
+import pytest
+
+pytest.importorskip("OpenGL")  # video draws through klampt.vis
+import pyonics.submodules.video.video as vid
+
+MUSCLES, LINKS = 4, 3
+
+
+class Vis:
+    # Just the klampt.vis calls RenderThread makes, with a window that is always up
+    def shown(self):
+        return True
+
+    def lock(self):
+        pass
+
+    def unlock(self):
+        pass
+
+    def update(self):
+        pass
+
+
+def publish(snapshots, tick):
+    return snapshots.publish(tick, np.full(LINKS, tick), np.full((LINKS, 12), tick), np.full((MUSCLES, 3), tick),
+                             np.full((MUSCLES, 3), tick), np.full(MUSCLES, tick), np.full(LINKS, tick))
+
+
+def check_snapshot(snapshot):
+    tick = snapshot["tick"]
+    for field in ("config", "transforms", "endpoints_a", "endpoints_b", "pressures", "link_forces"):
+        assert np.all(snapshot[field] == tick), field + " is from another tick"
+    return int(tick)
+
+
+def wrap(run, errors):
+    # Thread exceptions never reach the test on their own
+    def guarded():
+        try:
+            run()
+        except Exception as error:
+            errors.append(error)
+    return guarded
+
+
+def test_pinned_slot_is_never_written():
+    snapshots = vid.SnapshotBuffer(MUSCLES, LINKS)
+    assert publish(snapshots, 1)
+    sequence, snapshot = snapshots.pin()
+    assert sequence == 1 and check_snapshot(snapshot) == 1
+    assert publish(snapshots, 2)  # Into the other slot
+    assert not publish(snapshots, 3)  # Would overwrite the pinned slot, so skipped
+    assert check_snapshot(snapshot) == 1 and snapshots.skipped == 1
+    snapshots.release()
+    assert publish(snapshots, 4)
+    sequence, snapshot = snapshots.pin()
+    assert sequence == 3 and check_snapshot(snapshot) == 4
+    snapshots.release()
+
+
+def test_render_thread_never_sees_a_torn_snapshot(monkeypatch):
+    monkeypatch.setattr(vid, "kvis", Vis())
+    snapshots = vid.SnapshotBuffer(MUSCLES, LINKS)
+    drawn = []
+
+    def draw(snapshot):
+        tick = check_snapshot(snapshot)
+        time.sleep(.002)  # Publishes carry on meanwhile
+        assert check_snapshot(snapshot) == tick  # Still the same tick at the end of the frame
+        drawn.append(tick)
+
+    renderer = vid.RenderThread(snapshots, draw, rate=500)
+    errors = []
+    renderer.run = wrap(renderer.run, errors)
+    renderer.start()
+    tick = 0
+    deadline = time.monotonic() + .5
+    while time.monotonic() < deadline:
+        tick += 1
+        publish(snapshots, tick)
+    renderer.stop()
+
+    assert not errors
+    assert len(drawn) > 10 and drawn == sorted(set(drawn))  # Only newer snapshots drawn, each once
+    assert snapshots.skipped > 0 and snapshots.sequence + snapshots.skipped == tick